@@ -0,0 +1,252 @@
+"""
+Admission control and priority queueing in front of vLLM
+
+Past its breaking point vLLM degrades for everyone at once: every request
+queues, and interactive chats time out alongside batch jobs. The
+AdmissionController keeps a bounded window of requests in flight (sized from
+max_num_seqs) and of prompt tokens in flight, queues the rest by priority
+class, and rejects a request with a retry hint as soon as it would wait longer
+than its class's queue-time budget. Batch traffic may only fill part of the
+window, so spare capacity goes to it without crowding out interactive users.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Dict
+
+import app_metrics
+
+# Lower priority is served first; max_share caps the part of the window a class may fill
+DEFAULT_CLASSES = {
+    'interactive': {'priority': 0, 'queue_timeout': 5.0, 'max_share': 1.0},
+    'default': {'priority': 1, 'queue_timeout': 15.0, 'max_share': 1.0},
+    'batch': {'priority': 2, 'queue_timeout': 120.0, 'max_share': 0.75}
+}
+
+# Chat template overhead per message, as in the mock server's tokenizer
+TOKENS_PER_MESSAGE = 4
+
+
+def estimate_prompt_tokens(payload: Dict) -> int:
+    """Rough prompt size (4 characters per token) without a /tokenize round trip"""
+    if not isinstance(payload, dict):
+        return 0
+    messages = payload.get('messages')
+    if isinstance(messages, list):
+        chars = sum(len(str(m.get('content') or '')) for m in messages if isinstance(m, dict))
+        return chars // 4 + TOKENS_PER_MESSAGE * len(messages)
+    prompt = payload.get('prompt')
+    return len(prompt) // 4 if isinstance(prompt, str) else 0
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request would exceed its queue-time budget"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Ticket:
+    def __init__(self, priority_class: str, priority: int, tokens: int):
+        self.priority_class = priority_class
+        self.priority = priority
+        self.tokens = tokens
+        self.granted = False
+        self.released = False
+        self.enqueued_at = time.time()
+        self.deadline = None
+        self.admitted_at = None
+        # Optional callback run when a queued ticket is granted (used by acquire_async)
+        self.waker = None
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = 256, max_prompt_tokens: int = None, classes: Dict = None):
+        """
+        max_prompt_tokens of None leaves prompt tokens unbounded. A request larger
+        than the whole token budget is still admitted once nothing else is in
+        flight, so it can never wait forever.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_prompt_tokens = max_prompt_tokens
+        self.classes = {name: dict(settings) for name, settings in (classes or DEFAULT_CLASSES).items()}
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self.in_flight = 0
+        self.tokens_in_flight = 0
+        # Moving average of time in flight, used to estimate queue waits
+        self.avg_service_time = None
+        self.counts = {name: {'admitted': 0, 'queued': 0, 'rejected': 0, 'timed_out': 0} for name in self.classes}
+
+    def configure(self, max_concurrency: int, max_prompt_tokens: int = None, classes: Dict = None):
+        """Resize the window, e.g. after max_num_seqs or the backend list changed"""
+        with self._cond:
+            self.max_concurrency = max(1, int(max_concurrency))
+            self.max_prompt_tokens = max_prompt_tokens
+            if classes:
+                for name, settings in classes.items():
+                    self.classes[name] = dict(self.classes.get(name, DEFAULT_CLASSES['default']), **settings)
+                    self.counts.setdefault(name, {'admitted': 0, 'queued': 0, 'rejected': 0, 'timed_out': 0})
+            self._dispatch()
+
+    def _class_limit(self, priority_class: str) -> int:
+        return max(1, int(self.max_concurrency * self.classes[priority_class].get('max_share', 1.0)))
+
+    def _fits(self, ticket: Ticket) -> bool:
+        if self.in_flight >= self._class_limit(ticket.priority_class):
+            return False
+        if self.max_prompt_tokens and self.in_flight and \
+                self.tokens_in_flight + ticket.tokens > self.max_prompt_tokens:
+            return False
+        return True
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        ticket.admitted_at = time.time()
+        self.in_flight += 1
+        self.tokens_in_flight += ticket.tokens
+        self.counts[ticket.priority_class]['admitted'] += 1
+        if ticket.waker is not None:
+            ticket.waker()
+        app_metrics.ADMISSION_QUEUE_WAIT.observe(ticket.admitted_at - ticket.enqueued_at,
+                                                 priority_class=ticket.priority_class)
+
+    def _dispatch(self):
+        """Admit queued requests in priority order while they fit; caller holds the lock"""
+        granted = False
+        while self._queue and self._fits(self._queue[0][2]):
+            _, _, ticket = heapq.heappop(self._queue)
+            self._grant(ticket)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _estimated_wait(self, ticket: Ticket) -> float:
+        if self.avg_service_time is None:
+            # Nothing measured yet; let the queue timeout decide
+            return 0.0
+        ahead = sum(1 for _, _, t in self._queue if t.priority <= ticket.priority)
+        return self.avg_service_time * (ahead + 1) / self._class_limit(ticket.priority_class)
+
+    def _enter(self, priority_class: str, tokens: int, waker=None) -> Ticket:
+        """Admit at once, reject up front, or queue; returns the (possibly ungranted) ticket"""
+        if priority_class not in self.classes:
+            priority_class = 'default'
+        settings = self.classes[priority_class]
+        ticket = Ticket(priority_class, settings['priority'], tokens)
+        ticket.waker = waker
+        budget = settings['queue_timeout']
+        ticket.deadline = ticket.enqueued_at + budget
+
+        with self._cond:
+            # Requests of the same or higher priority already queued go first
+            if self._fits(ticket) and not any(t.priority <= ticket.priority for _, _, t in self._queue):
+                self._grant(ticket)
+                return ticket
+
+            estimate = self._estimated_wait(ticket)
+            if estimate > budget:
+                # Fail fast instead of holding the connection only to time out
+                self._reject(ticket, 'rejected')
+                raise AdmissionRejected(f'Server busy: estimated queue wait {estimate:.1f}s exceeds the '
+                                        f'{budget:.0f}s budget for {priority_class} requests', estimate)
+
+            self.counts[priority_class]['queued'] += 1
+            heapq.heappush(self._queue, (ticket.priority, next(self._sequence), ticket))
+        app_metrics.ADMISSION_QUEUE_DEPTH.inc(priority_class=priority_class)
+        return ticket
+
+    def _leave_queue(self, ticket: Ticket, outcome: str = None):
+        """Take an ungranted ticket off the queue; caller holds the lock"""
+        self._queue = [entry for entry in self._queue if entry[2] is not ticket]
+        heapq.heapify(self._queue)
+        if outcome:
+            self._reject(ticket, outcome)
+
+    def _timed_out(self, ticket: Ticket) -> AdmissionRejected:
+        budget = self.classes[ticket.priority_class]['queue_timeout']
+        return AdmissionRejected(f'Server busy: queued longer than the {budget:.0f}s budget '
+                                 f'for {ticket.priority_class} requests', self._estimated_wait(ticket))
+
+    def acquire(self, priority_class: str = 'default', tokens: int = 0) -> Ticket:
+        """Wait for a slot in the window, or raise AdmissionRejected past the class's queue budget"""
+        ticket = self._enter(priority_class, tokens)
+        if ticket.granted:
+            return ticket
+        try:
+            with self._cond:
+                while not ticket.granted:
+                    remaining = ticket.deadline - time.time()
+                    if remaining <= 0:
+                        self._leave_queue(ticket, 'timed_out')
+                        raise self._timed_out(ticket)
+                    self._cond.wait(remaining)
+        finally:
+            app_metrics.ADMISSION_QUEUE_DEPTH.dec(priority_class=ticket.priority_class)
+        return ticket
+
+    async def acquire_async(self, priority_class: str = 'default', tokens: int = 0) -> Ticket:
+        """acquire() for the async server: waits on a future instead of holding a thread"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            # Called under the lock from whichever thread freed the slot
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        ticket = self._enter(priority_class, tokens, wake)
+        if ticket.granted:
+            return ticket
+        try:
+            await asyncio.wait_for(granted, max(0.0, ticket.deadline - time.time()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._cond:
+                if not ticket.granted:
+                    self._leave_queue(ticket, 'timed_out' if isinstance(e, asyncio.TimeoutError) else None)
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise self._timed_out(ticket)
+                    raise
+            # Granted while timing out or being cancelled: keep the slot, or hand it back
+            if isinstance(e, asyncio.CancelledError):
+                self.release(ticket)
+                raise
+        finally:
+            app_metrics.ADMISSION_QUEUE_DEPTH.dec(priority_class=ticket.priority_class)
+        return ticket
+
+    def _reject(self, ticket: Ticket, outcome: str):
+        self.counts[ticket.priority_class][outcome] += 1
+        app_metrics.ADMISSION_REJECTIONS.inc(priority_class=ticket.priority_class, reason=outcome)
+
+    def release(self, ticket: Ticket):
+        """Free the ticket's slot; safe to call more than once"""
+        with self._cond:
+            if ticket.released or not ticket.granted:
+                return
+            ticket.released = True
+            self.in_flight -= 1
+            self.tokens_in_flight -= ticket.tokens
+            elapsed = time.time() - ticket.admitted_at
+            self.avg_service_time = elapsed if self.avg_service_time is None else \
+                0.9 * self.avg_service_time + 0.1 * elapsed
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            queued = {name: 0 for name in self.classes}
+            for _, _, ticket in self._queue:
+                queued[ticket.priority_class] += 1
+            return {
+                'max_concurrency': self.max_concurrency,
+                'max_prompt_tokens': self.max_prompt_tokens,
+                'in_flight': self.in_flight,
+                'tokens_in_flight': self.tokens_in_flight,
+                'avg_service_time': self.avg_service_time,
+                'classes': {name: dict(settings, queue_depth=queued[name], **self.counts[name])
+                            for name, settings in self.classes.items()}
+            }
@@ -1,13 +1,22 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g, send_file
 import json
 import os
 import subprocess
 import requests
+import threading
 import time
-import asyncio
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from benchmark import run_benchmark_suite
+from benchmark_jobs import BenchmarkJobManager
+from benchmark_history import BenchmarkHistory
+from http_client import PooledHTTPClient
+from backend_pool import BackendPool, NoHealthyBackendError, prefix_key
+from admission import AdmissionController, AdmissionRejected, estimate_prompt_tokens
+from response_cache import ResponseCache
+from batch_jobs import BatchJobManager
+from blue_green import DEFAULT_PORTS, BlueGreenReloader, ReloadInProgress
+import config_cache
+import app_metrics
 
 # Simple Flask app without any proxy configuration
 app = Flask(__name__)
@@ -17,26 +26,59 @@ APP_CONFIG_PATH = 'app_config.json'
 # Use the systemd service's config location
 VLLM_CONFIG_PATH = '/opt/vllm/vllm_config.json'
 DEFAULT_CONFIG_PATH = '/opt/vllm/default_vllm_config.json'
+# Append-only store of completed benchmark runs
+BENCHMARK_HISTORY_PATH = 'benchmark_history.db'
+# One directory per batch inference job: input, output and checkpoint
+BATCH_JOBS_DIR = 'batch_jobs'
+# Configs, logs and pids of vLLM instances started by blue-green reloads
+VLLM_INSTANCES_DIR = 'vllm_instances'
+# Response cache route for /chat-completion, kept apart from the gateway's /v1 paths
+CHAT_CACHE_ROUTE = '/chat-completion'
+
+# Worker processes for benchmark load generation
+BENCHMARK_WORKERS = min(8, os.cpu_count() or 1)
 
 # HuggingFace token file (separate from config for security)
 HF_TOKEN_PATH = os.path.expanduser('~/.huggingface_token')
 
+# Shared services below are created by init_services() on the first request (or at startup
+# when run directly), never at import: spawned benchmark workers and the debug reloader's
+# watcher import this module too, and must not open databases, threads or batch jobs
+_services_lock = threading.Lock()
+
+# Benchmarks run as background jobs so requests return immediately; finished
+# runs are recorded in the history store for later comparison
+benchmark_history = None
+benchmark_jobs = None
+
 def load_app_config():
     """Load application configuration"""
     if os.path.exists(APP_CONFIG_PATH):
-        with open(APP_CONFIG_PATH, 'r') as f:
-            return json.load(f)
+        return config_cache.read_json(APP_CONFIG_PATH)
     return {'huggingface_token': ''}
 
+def create_http_client():
+    """Build the shared upstream client from the optional http_client section of app_config.json"""
+    settings = load_app_config().get('http_client', {})
+    client = PooledHTTPClient(
+        pool_maxsize=settings.get('pool_maxsize', 64),
+        connect_timeout=settings.get('connect_timeout', 5.0),
+        read_timeout=settings.get('read_timeout', 60.0))
+    # The HuggingFace API is only hit for model checks; keep its pool small
+    client.mount('https://huggingface.co', settings.get('huggingface_pool_maxsize', 4))
+    return client
+
+# Keep-alive connection pool shared by every outbound call
+http_client = None
+
 def load_vllm_config():
     """Load vLLM configuration"""
+    # Parsed files are cached until their mtime/inode changes on disk
     if os.path.exists(VLLM_CONFIG_PATH):
-        with open(VLLM_CONFIG_PATH, 'r') as f:
-            return json.load(f)
+        return config_cache.read_json(VLLM_CONFIG_PATH)
     # Fall back to default config file
     if os.path.exists(DEFAULT_CONFIG_PATH):
-        with open(DEFAULT_CONFIG_PATH, 'r') as f:
-            return json.load(f)
+        return config_cache.read_json(DEFAULT_CONFIG_PATH)
     # If neither exists, return minimal config
     return {
         'model': 'HuggingFaceTB/SmolLM3-3B',
@@ -44,15 +86,154 @@ def load_vllm_config():
         'port': 5002
     }
 
+def create_backend_pool():
+    """Build the vLLM backend pool from the optional backends section of app_config.json"""
+    settings = load_app_config().get('backends', {})
+    return BackendPool(
+        policy=settings.get('policy', 'least_outstanding'),
+        health_interval=settings.get('health_interval', 5.0),
+        failure_threshold=settings.get('failure_threshold', 3),
+        load_factor=settings.get('load_factor', 1.25))
+
+# Replicas that chat and gateway requests are balanced across
+backend_pool = None
+
+def routing_key(payload):
+    """Prefix affinity key for a chat/completion request, when the pool routes by prefix"""
+    if backend_pool.policy != 'prefix_affinity':
+        return None
+    return prefix_key(payload, load_app_config().get('backends', {}).get('prefix_chars', 1024))
+
+def sync_backends():
+    """Point the pool at the configured replica URLs; True if the list changed.
+    
+    Without a backends.urls list in app_config.json the pool is the single
+    local vLLM on the configured port, so single-GPU setups behave as before.
+    """
+    urls = load_app_config().get('backends', {}).get('urls')
+    return backend_pool.set_backends(urls or [f"http://localhost:{load_vllm_config().get('port', 5002)}"])
+
+def get_backend_pool():
+    """The backend pool, synced with the configured replica URLs"""
+    if sync_backends():
+        # The admission window scales with the number of replicas
+        configure_admission()
+    backend_pool.start()
+    return backend_pool
+
+def create_admission_controller():
+    """Build the admission controller from the optional admission section of app_config.json"""
+    return AdmissionController(classes=load_app_config().get('admission', {}).get('classes'))
+
+# Bounded window of requests in flight to vLLM, with priority queueing in front of it
+admission = None
+
+def configure_admission():
+    """Size the admission window to the current deployment.
+    
+    Unless admission.max_concurrency is set, the window is max_num_seqs per
+    backend: vLLM batches that many sequences at once, so anything beyond
+    would only queue inside vLLM where priorities cannot be applied. Runs when
+    the configs or the backend list change, not on every request.
+    """
+    if admission is None:
+        return
+    sync_backends()
+    settings = load_app_config().get('admission', {})
+    max_concurrency = settings.get('max_concurrency') or \
+        load_vllm_config().get('max_num_seqs', 256) * max(1, len(backend_pool.backends))
+    admission.configure(max_concurrency, settings.get('max_prompt_tokens'), settings.get('classes'))
+
+def get_admission():
+    """The admission controller, sized by configure_admission()"""
+    return admission
+
+def request_priority_class(default_class, headers=None):
+    """Priority class for the current request (or for the given headers).
+    
+    API keys (Authorization: Bearer or X-API-Key) listed under admission.tenants
+    map to their class; others get default_class. X-Priority may only lower a
+    request's priority, so clients can mark their own bulk traffic as batch.
+    """
+    headers = request.headers if headers is None else headers
+    tenants = load_app_config().get('admission', {}).get('tenants', {})
+    auth = headers.get('Authorization', '')
+    api_key = auth[7:] if auth.startswith('Bearer ') else headers.get('X-API-Key')
+    priority_class = tenants.get(api_key, default_class) if api_key else default_class
+    
+    requested = headers.get('X-Priority')
+    classes = admission.classes
+    if requested in classes and priority_class in classes and \
+            classes[requested]['priority'] > classes[priority_class]['priority']:
+        priority_class = requested
+    return priority_class
+
+def create_response_cache():
+    """Build the response cache from the optional response_cache section of app_config.json"""
+    settings = load_app_config().get('response_cache', {})
+    if not settings.get('enabled', True):
+        return None
+    return ResponseCache(
+        max_bytes=settings.get('max_bytes', 64 * 1024 * 1024),
+        ttl=settings.get('ttl', 3600.0),
+        disk_path=settings.get('disk_path'))
+
+# Exact-match cache for deterministic (temperature 0 or seeded) requests; None when disabled
+response_cache = None
+
+# Offline JSONL batch jobs, sent through the backend pool as the batch admission class
+batch_jobs = None
+
 def save_app_config(config):
     """Save application configuration"""
-    with open(APP_CONFIG_PATH, 'w') as f:
-        json.dump(config, f, indent=2)
+    config_cache.write_json(APP_CONFIG_PATH, config)
+    configure_admission()
 
 def save_vllm_config(config):
     """Save vLLM configuration"""
-    with open(VLLM_CONFIG_PATH, 'w') as f:
-        json.dump(config, f, indent=2)
+    previous_model = load_vllm_config().get('model')
+    # Atomic replace so concurrent readers never see a half-written file
+    config_cache.write_json(VLLM_CONFIG_PATH, config)
+    # Cached answers belong to the old model's weights
+    if response_cache and config.get('model') != previous_model:
+        response_cache.invalidate()
+    # max_num_seqs sets the admission window
+    configure_admission()
+
+def create_vllm_reloader():
+    """Build the blue-green reloader from the optional blue_green section of app_config.json"""
+    settings = load_app_config().get('blue_green', {})
+    return BlueGreenReloader(
+        load_vllm_config, save_vllm_config, get_backend_pool, VLLM_INSTANCES_DIR,
+        ports=settings.get('ports', DEFAULT_PORTS),
+        python=settings.get('python'),
+        ready_timeout=settings.get('ready_timeout', 1800.0),
+        warmup_requests=settings.get('warmup_requests', 3),
+        drain_timeout=settings.get('drain_timeout', 120.0))
+
+# Applies config changes by bringing up a second vLLM instance before retiring the first
+vllm_reloader = None
+
+def init_services():
+    """Create the shared services and start background work in the serving process (idempotent)"""
+    global benchmark_history, benchmark_jobs, http_client, backend_pool, admission, response_cache, \
+        batch_jobs, vllm_reloader
+    with _services_lock:
+        if vllm_reloader is not None:
+            return
+        benchmark_history = BenchmarkHistory(BENCHMARK_HISTORY_PATH)
+        benchmark_jobs = BenchmarkJobManager(history=benchmark_history)
+        http_client = create_http_client()
+        backend_pool = create_backend_pool()
+        admission = create_admission_controller()
+        # Syncs the pool with the configured backends and sizes the admission window to match
+        get_backend_pool()
+        response_cache = create_response_cache()
+        batch_jobs = BatchJobManager(BATCH_JOBS_DIR, get_backend_pool, get_admission)
+        # Jobs interrupted by a restart continue from their last checkpoint
+        batch_jobs.resume_interrupted()
+        # Assigned last: requests only skip init_services() once everything above exists
+        vllm_reloader = create_vllm_reloader()
 
 def mask_token(token):
     """Mask HuggingFace token for display"""
@@ -66,8 +247,7 @@ def load_hf_token():
     """Load HuggingFace token from file"""
     if os.path.exists(HF_TOKEN_PATH):
         try:
-            with open(HF_TOKEN_PATH, 'r') as f:
-                return f.read().strip()
+            return config_cache.read_text(HF_TOKEN_PATH)
         except:
             pass
     return ''
@@ -77,10 +257,9 @@ def save_hf_token(token):
     try:
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(HF_TOKEN_PATH), exist_ok=True)
-        with open(HF_TOKEN_PATH, 'w') as f:
-            f.write(token)
-        # Set restrictive permissions (owner read/write only)
-        os.chmod(HF_TOKEN_PATH, 0o600)
+        # Restrictive permissions (owner read/write only) are set before the
+        # token is written, then the file is renamed into place
+        config_cache.write_atomic(HF_TOKEN_PATH, token, mode=0o600)
         # Also set as environment variable for current session
         os.environ['HUGGINGFACE_TOKEN'] = token
         os.environ['HF_TOKEN'] = token
@@ -89,6 +268,38 @@ def save_hf_token(token):
         print(f"Error saving HF token: {e}")
         return False
 
+def record_upstream_error(error_class, status=''):
+    """Count a failed vLLM call by class (timeout, connection, http_status, other)"""
+    app_metrics.UPSTREAM_ERRORS.inc(error_class=error_class, status=str(status))
+
+def record_upstream_usage(usage):
+    app_metrics.UPSTREAM_TOKENS.inc(usage.get('prompt_tokens', 0), kind='prompt')
+    app_metrics.UPSTREAM_TOKENS.inc(usage.get('completion_tokens', 0), kind='completion')
+
+@app.before_request
+def ensure_services():
+    # Covers flask run, WSGI servers and the test client, which never call init_services() themselves
+    if vllm_reloader is None:
+        init_services()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    # Label by route pattern, not raw path, so job ids do not explode cardinality
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    app_metrics.HTTP_REQUEST_DURATION.observe(
+        time.perf_counter() - g.get('request_start', time.perf_counter()),
+        route=route, method=request.method, status=str(response.status_code))
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this app"""
+    return Response(app_metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Main configuration page"""
@@ -116,7 +327,7 @@ def check_model():
     try:
         # Check HuggingFace API to see if model exists
         url = f'https://huggingface.co/api/models/{model_id}'
-        response = requests.get(url, timeout=5)
+        response = http_client.get(url, timeout=5)
 
         if response.status_code == 200:
             return jsonify({'valid': True, 'message': 'Model found and accessible'})
@@ -169,8 +380,37 @@ def update_config():
 
 @app.route('/restart-service', methods=['POST'])
 def restart_service():
-    """Restart the vLLM systemd service"""
+    """Apply the saved vLLM config without downtime when possible.
+    
+    If the GPU has room for a second instance, a blue-green reload starts in
+    the background (progress at /reload-status). Otherwise, or when asked for
+    mode 'restart', the vLLM systemd service is restarted as before.
+    """
+    data = request.get_json(silent=True) or {}
+    if vllm_reloader.running:
+        return jsonify({'success': False, 'message': 'A reload is already in progress',
+                        'reload': vllm_reloader.get_status()})
+
+    app_config = load_app_config()
+    mode, reason = 'restart', 'restart requested'
+    if data.get('mode') != 'restart':
+        if not app_config.get('blue_green', {}).get('enabled', True):
+            reason = 'blue-green reloads are disabled'
+        elif app_config.get('backends', {}).get('urls'):
+            reason = 'backends are listed in app_config.json'
+        else:
+            mode, reason = vllm_reloader.plan()
+
+    if mode == 'blue_green':
+        try:
+            return jsonify({'success': True, 'mode': mode, 'reload': vllm_reloader.start()})
+        except (ReloadInProgress, RuntimeError) as e:
+            return jsonify({'success': False, 'message': str(e)})
+
     try:
+        # Instances left by an earlier swap would hold the port and GPU memory the service needs
+        vllm_reloader.stop_all()
+
         # Replace 'vllm' with your actual service name
         result = subprocess.run(
             ['systemctl', 'restart', 'vllm'],
@@ -180,14 +420,21 @@ def restart_service():
         )
 
         if result.returncode == 0:
-            return jsonify({'success': True})
+            app_metrics.VLLM_RELOADS.inc(mode='restart', result='completed')
+            return jsonify({'success': True, 'mode': mode, 'reason': reason})
         else:
+            app_metrics.VLLM_RELOADS.inc(mode='restart', result='failed')
             return jsonify({'success': False, 'message': result.stderr})
     except subprocess.TimeoutExpired:
         return jsonify({'success': False, 'message': 'Command timed out'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/reload-status')
+def reload_status():
+    """Progress of the current or last blue-green reload"""
+    return jsonify({'success': True, 'reload': vllm_reloader.get_status()})
+
 @app.route('/service-status')
 def service_status():
     """Get the status of the vLLM systemd service"""
@@ -202,11 +449,19 @@ def service_status():
 
         # systemctl status returns 0 for active, 3 for inactive
         active = result.returncode == 0
+        details = result.stdout
+
+        # After a blue-green reload vLLM runs outside the service
+        instance = None if active else vllm_reloader.managed_instance(load_vllm_config().get('port', 5002))
+        if instance:
+            active = True
+            details = (f"vLLM ({instance['model']}) started by a blue-green reload, pid {instance['pid']}, "
+                       f"log {instance['log_path']}\n\n{details}")
 
         return jsonify({
             'active': active,
             'status': 'active' if active else 'inactive',
-            'details': result.stdout
+            'details': details
         })
     except subprocess.TimeoutExpired:
         return jsonify({'active': False, 'status': 'timeout', 'details': 'Command timed out'})
@@ -221,8 +476,7 @@ def reset_config():
         if not os.path.exists(DEFAULT_CONFIG_PATH):
             return jsonify({'success': False, 'message': f'Default config file not found at {DEFAULT_CONFIG_PATH}'})
         
-        with open(DEFAULT_CONFIG_PATH, 'r') as f:
-            default_config = json.load(f)
+        default_config = config_cache.read_json(DEFAULT_CONFIG_PATH)
         
         save_vllm_config(default_config)
         return jsonify({'success': True})
@@ -249,6 +503,37 @@ def save_raw_config():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def chat_metrics(usage, time_taken_seconds):
+    """Latency and throughput of a non-streamed completion; also records them"""
+    completion_tokens = usage.get('completion_tokens', 0)
+    # Calculate throughput (tokens per second)
+    throughput = completion_tokens / time_taken_seconds if time_taken_seconds > 0 else 0
+    
+    app_metrics.UPSTREAM_REQUEST_DURATION.observe(time_taken_seconds, stream='false')
+    record_upstream_usage(usage)
+    
+    return {
+        'latency_ms': round(time_taken_seconds * 1000, 2),
+        'throughput_tps': round(throughput, 2),
+        'prompt_tokens': usage.get('prompt_tokens', 0),
+        'completion_tokens': completion_tokens,
+        'total_tokens': usage.get('total_tokens', 0),
+        'time_seconds': round(time_taken_seconds, 2)
+    }
+
+def build_chat_request(data):
+    """vLLM chat request for a prompt sent from the UI"""
+    config = load_vllm_config()
+    return {
+        "model": config.get('model', 'HuggingFaceTB/SmolLM3-3B'),
+        "messages": [
+            {"role": "user", "content": data.get('prompt', '')}
+        ],
+        "temperature": data.get('temperature', 0.7),
+        "max_tokens": data.get('max_tokens', 1000),
+        "stream": False
+    }
+
 @app.route('/chat-completion', methods=['POST'])
 def chat_completion():
     """Send chat completion request to vLLM and return response with metrics"""
@@ -259,31 +544,39 @@ def chat_completion():
         if not user_prompt:
             return jsonify({'success': False, 'message': 'No prompt provided'})
         
-        # Get vLLM config to know the port
-        config = load_vllm_config()
-        vllm_url = f"http://localhost:{config.get('port', 5002)}/v1/chat/completions"
+        chat_request = build_chat_request(data)
         
-        # Prepare the chat request
-        chat_request = {
-            "model": config.get('model', 'HuggingFaceTB/SmolLM3-3B'),
-            "messages": [
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": data.get('temperature', 0.7),
-            "max_tokens": data.get('max_tokens', 1000),
-            "stream": False
-        }
+        # Identical deterministic requests are answered without touching the GPU
+        cached = response_cache.get(chat_request, CHAT_CACHE_ROUTE) if response_cache else None
+        if cached is not None:
+            return cached_chat_completion(json.loads(cached), data.get('stream'))
+        
+        # Wait for a slot in the admission window; raises AdmissionRejected when busy
+        ticket = get_admission().acquire(request_priority_class('interactive'),
+                                         estimate_prompt_tokens(chat_request))
+        
+        # Relay tokens as they are generated instead of one buffered reply
+        if data.get('stream'):
+            return stream_chat_completion(chat_request, ticket)
         
         # Track timing
         start_time = time.time()
         
         # Make request to vLLM
-        response = requests.post(vllm_url, json=chat_request, timeout=60)
+        app_metrics.UPSTREAM_REQUESTS_IN_FLIGHT.inc()
+        try:
+            # Least loaded healthy replica in the backend pool
+            with get_backend_pool().lease(affinity_key=routing_key(chat_request)) as backend:
+                response = http_client.post(f"{backend.url}/v1/chat/completions", json=chat_request)
+        finally:
+            app_metrics.UPSTREAM_REQUESTS_IN_FLIGHT.dec()
+            admission.release(ticket)
         
         # Calculate latency
         latency = (time.time() - start_time) * 1000  # Convert to milliseconds
         
         if response.status_code != 200:
+            record_upstream_error('http_status', response.status_code)
             return jsonify({
                 'success': False, 
                 'message': f'vLLM error: {response.status_code}',
@@ -291,43 +584,189 @@ def chat_completion():
             })
         
         result = response.json()
-        
-        # Extract response and metrics
-        response_text = result['choices'][0]['message']['content']
-        usage = result.get('usage', {})
-        
-        # Calculate tokens per second
-        total_tokens = usage.get('total_tokens', 0)
-        completion_tokens = usage.get('completion_tokens', 0)
-        prompt_tokens = usage.get('prompt_tokens', 0)
-        
-        # Calculate throughput (tokens per second)
-        time_taken_seconds = latency / 1000
-        throughput = completion_tokens / time_taken_seconds if time_taken_seconds > 0 else 0
+        if response_cache:
+            response_cache.put(chat_request, response.content, CHAT_CACHE_ROUTE)
         
         return jsonify({
             'success': True,
-            'response': response_text,
-            'metrics': {
-                'latency_ms': round(latency, 2),
-                'throughput_tps': round(throughput, 2),
-                'prompt_tokens': prompt_tokens,
-                'completion_tokens': completion_tokens,
-                'total_tokens': total_tokens,
-                'time_seconds': round(time_taken_seconds, 2)
-            }
+            'response': result['choices'][0]['message']['content'],
+            'metrics': chat_metrics(result.get('usage', {}), latency / 1000)
         })
         
+    except AdmissionRejected as e:
+        return jsonify({'success': False, 'message': str(e), 'retry_after': e.retry_after}), 429, \
+            {'Retry-After': str(e.retry_after)}
+    except NoHealthyBackendError as e:
+        record_upstream_error('no_backend')
+        return jsonify({'success': False, 'message': str(e)})
     except requests.exceptions.Timeout:
+        record_upstream_error('timeout')
         return jsonify({'success': False, 'message': 'Request timed out'})
     except requests.exceptions.ConnectionError:
+        record_upstream_error('connection')
         return jsonify({'success': False, 'message': 'Cannot connect to vLLM server. Is it running?'})
     except Exception as e:
+        record_upstream_error('other')
         return jsonify({'success': False, 'message': str(e)})
 
+def sse_event(payload):
+    """Format a dict as one server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+def cached_chat_events(result):
+    """The token and metrics events that replay a cached vLLM response"""
+    usage = result.get('usage', {})
+    content = result['choices'][0]['message']['content']
+    return content, {
+        'latency_ms': 0,
+        'throughput_tps': 0,
+        'prompt_tokens': usage.get('prompt_tokens', 0),
+        'completion_tokens': usage.get('completion_tokens', 0),
+        'total_tokens': usage.get('total_tokens', 0),
+        'time_seconds': 0,
+        'cached': True
+    }
+
+def cached_chat_completion(result, stream):
+    """Answer /chat-completion from a cached vLLM response, as JSON or as a one-token SSE stream"""
+    content, metrics = cached_chat_events(result)
+    if not stream:
+        return jsonify({'success': True, 'response': content, 'metrics': metrics})
+    
+    def generate():
+        yield sse_event({'type': 'token', 'content': content})
+        yield sse_event({'type': 'metrics', 'metrics': dict(metrics, ttft_ms=0, itl_mean_ms=0, itl_p95_ms=0,
+                                                             decode_tps=0)})
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def streamed_chat_metrics(start_time, first_token_time, inter_token_gaps, usage, content_chunks):
+    """TTFT, inter-token latency and throughput of a finished stream; also records them"""
+    total_time = time.time() - start_time
+    completion_tokens = usage.get('completion_tokens', content_chunks)
+    prompt_tokens = usage.get('prompt_tokens', 0)
+    ttft = (first_token_time - start_time) if first_token_time else total_time
+    decode_time = total_time - ttft
+    sorted_gaps = sorted(inter_token_gaps)
+    app_metrics.UPSTREAM_REQUEST_DURATION.observe(total_time, stream='true')
+    record_upstream_usage({'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens})
+    
+    return {
+        'latency_ms': round(total_time * 1000, 2),
+        'ttft_ms': round(ttft * 1000, 2),
+        'itl_mean_ms': round(sum(sorted_gaps) / len(sorted_gaps) * 1000, 2) if sorted_gaps else 0,
+        'itl_p95_ms': round(sorted_gaps[int(len(sorted_gaps) * 0.95)] * 1000, 2) if sorted_gaps else 0,
+        'throughput_tps': round(completion_tokens / total_time, 2) if total_time > 0 else 0,
+        'decode_tps': round((completion_tokens - 1) / decode_time, 2) if decode_time > 0 and completion_tokens > 1 else 0,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': usage.get('total_tokens', prompt_tokens + completion_tokens),
+        'time_seconds': round(total_time, 2)
+    }
+
+def cache_streamed_completion(chat_request, content_parts, finish_reason, usage):
+    """Store a finished stream in the response cache as the equivalent non-streamed response"""
+    if response_cache is None:
+        return
+    response_cache.put(chat_request, json.dumps({
+        'object': 'chat.completion',
+        'model': chat_request['model'],
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(content_parts)},
+                     'finish_reason': finish_reason}],
+        'usage': usage
+    }).encode(), CHAT_CACHE_ROUTE)
+
+def stream_chat_completion(chat_request, ticket):
+    """Proxy a streaming chat completion from vLLM to the browser as SSE.
+    
+    Emits {"type": "token"} frames as content arrives and a final
+    {"type": "metrics"} frame with TTFT, inter-token latency and tokens/s.
+    """
+    chat_request = dict(chat_request, stream=True, stream_options={'include_usage': True})
+    
+    def generate():
+        start_time = time.time()
+        first_token_time = None
+        last_token_time = None
+        inter_token_gaps = []
+        content_chunks = 0
+        content_parts = []
+        finish_reason = None
+        usage = {}
+        
+        app_metrics.UPSTREAM_REQUESTS_IN_FLIGHT.inc()
+        try:
+            # The client's read timeout applies between chunks, not to the whole answer
+            with get_backend_pool().lease(affinity_key=routing_key(chat_request)) as backend, \
+                    http_client.post(f"{backend.url}/v1/chat/completions", json=chat_request, stream=True) as response:
+                if response.status_code != 200:
+                    record_upstream_error('http_status', response.status_code)
+                    yield sse_event({'type': 'error', 'message': f'vLLM error: {response.status_code}',
+                                     'details': response.text})
+                    return
+                
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+                    
+                    chunk = json.loads(payload)
+                    if chunk.get('usage'):
+                        usage = chunk['usage']
+                    choices = chunk.get('choices') or []
+                    if choices and choices[0].get('finish_reason'):
+                        finish_reason = choices[0]['finish_reason']
+                    content = choices[0].get('delta', {}).get('content') if choices else None
+                    if not content:
+                        continue
+                    
+                    now = time.time()
+                    if first_token_time is None:
+                        first_token_time = now
+                        app_metrics.UPSTREAM_TTFT.observe(now - start_time)
+                    else:
+                        inter_token_gaps.append(now - last_token_time)
+                    last_token_time = now
+                    content_chunks += 1
+                    content_parts.append(content)
+                    yield sse_event({'type': 'token', 'content': content})
+        except NoHealthyBackendError as e:
+            record_upstream_error('no_backend')
+            yield sse_event({'type': 'error', 'message': str(e)})
+            return
+        except requests.exceptions.Timeout:
+            record_upstream_error('timeout')
+            yield sse_event({'type': 'error', 'message': 'Request timed out'})
+            return
+        except requests.exceptions.ConnectionError:
+            record_upstream_error('connection')
+            yield sse_event({'type': 'error', 'message': 'Cannot connect to vLLM server. Is it running?'})
+            return
+        except Exception as e:
+            record_upstream_error('other')
+            yield sse_event({'type': 'error', 'message': str(e)})
+            return
+        finally:
+            app_metrics.UPSTREAM_REQUESTS_IN_FLIGHT.dec()
+        
+        if finish_reason:
+            cache_streamed_completion(chat_request, content_parts, finish_reason, usage)
+        yield sse_event({
+            'type': 'metrics',
+            'metrics': streamed_chat_metrics(start_time, first_token_time, inter_token_gaps, usage, content_chunks)
+        })
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs once the stream ends or the client goes away, even if generation never started
+    response.call_on_close(lambda: admission.release(ticket))
+    return response
+
 @app.route('/run-benchmark', methods=['POST'])
 def run_benchmark():
-    """Run benchmark tests on the vLLM model"""
+    """Start benchmark tests on the vLLM model as a background job"""
     try:
         data = request.json
         test_type = data.get('test_type', 'quick')
@@ -335,6 +774,10 @@ def run_benchmark():
         # Get vLLM config to know the port
         config = load_vllm_config()
         base_url = f"http://localhost:{config.get('port', 5002)}"
+        backend_urls = [backend.url for backend in get_backend_pool().backends]
+        # With several replicas, benchmark the pool through this app's gateway by default
+        if data.get('target', 'pool' if len(backend_urls) > 1 else 'direct') == 'pool':
+            base_url = f"http://127.0.0.1:{request.environ.get('SERVER_PORT', 5005)}"
         model_name = config.get('model', 'HuggingFaceTB/SmolLM3-3B')
         
         # Define test suites
@@ -343,23 +786,346 @@ def run_benchmark():
         elif test_type == 'standard':
             tests = ['latency', 'concurrent', 'throughput']
         elif test_type == 'full':
-            tests = ['latency', 'concurrent', 'throughput', 'stress']
+            tests = ['latency', 'streaming', 'concurrent', 'throughput', 'stress']
         elif test_type == 'stress':
             tests = ['stress']
         else:
             # Individual test type
             tests = [test_type]
         
-        # Run the benchmarks asynchronously
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        results = loop.run_until_complete(run_benchmark_suite(base_url, model_name, tests))
-        loop.close()
+        # Per-test options (e.g. trace replay settings)
+        options = {
+            'trace_path': data.get('trace_path'),
+            'time_scale': float(data.get('time_scale', 1.0)),
+            'max_requests': data.get('max_requests'),
+            # Shard concurrent/stress clients across processes so the harness
+            # itself is not the bottleneck at high concurrency
+            'workers': int(data.get('workers', BENCHMARK_WORKERS)),
+            # Shared-prefix workload shape for the prefix_cache test
+            'prefix_tokens': data.get('prefix_tokens'),
+            'share_ratio': float(data.get('share_ratio', 0.8)),
+            'num_prefixes': data.get('num_prefixes'),
+            'prefix_caching_enabled': config.get('enable_prefix_caching'),
+            # Prompt/output length grid for the length_sweep test, capped at the served context
+            'input_lengths': data.get('input_lengths'),
+            'output_lengths': data.get('output_lengths'),
+            'max_model_len': config.get('max_model_len'),
+            'request_timeout': data.get('request_timeout'),
+            # Sample vLLM's /metrics alongside each test
+            'scrape_metrics': bool(data.get('scrape_metrics', True)),
+            # Scrape every replica, not the gateway, when benchmarking the pool
+            'metrics_base_urls': backend_urls,
+            # Latency targets for goodput: request overrides app_config's benchmark_slo section
+            'slo': dict(load_app_config().get('benchmark_slo', {}), **(data.get('slo') or {}))
+        }
+        if 'replay' in tests and not options['trace_path']:
+            return jsonify({'success': False, 'message': 'No trace_path provided for replay'})
+        
+        job = benchmark_jobs.submit(test_type, tests, base_url, model_name, options, config=config)
         
-        return jsonify({'success': True, 'results': results})
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status})
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/benchmark-jobs')
+def list_benchmark_jobs():
+    """List recent benchmark jobs"""
+    return jsonify({'success': True, 'jobs': benchmark_jobs.list_jobs()})
+
+@app.route('/benchmark-jobs/<job_id>')
+def get_benchmark_job(job_id):
+    """Get status, progress and (partial) results of a benchmark job"""
+    job = benchmark_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown benchmark job'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/benchmark-jobs/<job_id>/events')
+def stream_benchmark_job(job_id):
+    """Stream benchmark job progress as server-sent events"""
+    if benchmark_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'message': 'Unknown benchmark job'}), 404
+    
+    # EventSource resends the last id it saw when reconnecting
+    last_event_id = request.headers.get('Last-Event-ID')
+    start_index = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+    
+    def generate():
+        for index, event in benchmark_jobs.iter_events(job_id, start_index):
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield f"id: {index}\ndata: {json.dumps(event, default=float)}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/http-client-stats')
+def http_client_stats():
+    """Connection pool and per-host statistics for outbound HTTP calls"""
+    return jsonify({'success': True, 'stats': http_client.stats()})
+
+# Hop-by-hop headers are per connection and must not be forwarded by a proxy
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'content-encoding',
+                      'te', 'trailer', 'upgrade', 'proxy-authorization', 'proxy-authenticate', 'host'}
+
+def gateway_error(message, status, error_type, headers=None):
+    """OpenAI-style error body so API clients surface the reason"""
+    response = jsonify({'object': 'error', 'message': message, 'type': error_type, 'code': status})
+    response.status_code = status
+    response.headers.extend(headers or {})
+    return response
+
+def proxy_to_backend(method, path):
+    """Forward an OpenAI API request to the vLLM backend pool.
+    
+    Completion requests pass admission control first and hold their slot
+    until the response has been sent.
+    """
+    pool = get_backend_pool()
+    body = request.get_data()
+    payload = None
+    if path.endswith('completions'):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            pass
+    if payload is None:
+        return forward_to_backend(pool, method, path, body, None)
+    
+    use_cache = response_cache is not None and isinstance(payload, dict) and not payload.get('stream')
+    if use_cache:
+        cached = response_cache.get(payload, path)
+        if cached is not None:
+            return Response(cached, mimetype='application/json', headers={'X-Cache': 'HIT'})
+    
+    try:
+        ticket = get_admission().acquire(request_priority_class('default'), estimate_prompt_tokens(payload))
+    except AdmissionRejected as e:
+        return gateway_error(str(e), 429, 'RateLimitError', {'Retry-After': str(e.retry_after)})
+    try:
+        response = forward_to_backend(pool, method, path, body, routing_key(payload))
+    except BaseException:
+        admission.release(ticket)
+        raise
+    if response.is_streamed:
+        response.call_on_close(lambda: admission.release(ticket))
+    else:
+        admission.release(ticket)
+        if use_cache and response.status_code == 200:
+            response_cache.put(payload, response.get_data(), path)
+    return response
+
+def forward_to_backend(pool, method, path, body, affinity_key):
+    """Send the request to a healthy replica and pass its response through.
+    
+    Connection failures are retried on the other replicas; once an upstream
+    has answered, its response (streamed or not) is passed through as is.
+    """
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+    tried = []
+    
+    while True:
+        try:
+            backend = pool.acquire(exclude=tried, affinity_key=affinity_key)
+        except NoHealthyBackendError as e:
+            record_upstream_error('no_backend')
+            return gateway_error(str(e), 503, 'ServiceUnavailableError')
+        
+        try:
+            upstream = http_client.request(method, f"{backend.url}{path}", params=request.args,
+                                           data=body, headers=headers, stream=True)
+        except requests.exceptions.ConnectionError as e:
+            pool.release(backend, e)
+            app_metrics.GATEWAY_REQUESTS.inc(backend=backend.url, status='connection_error')
+            record_upstream_error('connection')
+            tried.append(backend.url)
+            continue
+        except requests.exceptions.Timeout as e:
+            # The request may still be running upstream; retrying could run it twice
+            pool.release(backend, e)
+            app_metrics.GATEWAY_REQUESTS.inc(backend=backend.url, status='timeout')
+            record_upstream_error('timeout')
+            return gateway_error(f'Backend {backend.url} timed out', 504, 'TimeoutError')
+        
+        app_metrics.GATEWAY_REQUESTS.inc(backend=backend.url, status=str(upstream.status_code))
+        response_headers = [(k, v) for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+        response_headers.append(('X-Backend', backend.url))
+        
+        if 'text/event-stream' not in upstream.headers.get('Content-Type', ''):
+            error = None
+            try:
+                content = upstream.content
+            except requests.exceptions.RequestException as e:
+                error = e
+                record_upstream_error('timeout')
+                return gateway_error(f'Backend {backend.url} timed out', 504, 'TimeoutError')
+            finally:
+                upstream.close()
+                pool.release(backend, error)
+            return Response(content, status=upstream.status_code, headers=response_headers)
+        
+        def generate(upstream=upstream, backend=backend):
+            # The backend stays leased until the last chunk reaches the client
+            error = None
+            try:
+                for chunk in upstream.iter_content(chunk_size=None):
+                    yield chunk
+            except requests.exceptions.RequestException as e:
+                error = e
+                record_upstream_error('stream_aborted')
+            finally:
+                upstream.close()
+                pool.release(backend, error)
+        
+        response_headers.append(('X-Accel-Buffering', 'no'))
+        return Response(stream_with_context(generate()), status=upstream.status_code, headers=response_headers)
+
+@app.route('/v1/models')
+def gateway_models():
+    """OpenAI model list, served by any healthy replica"""
+    return proxy_to_backend('GET', '/v1/models')
+
+@app.route('/v1/<path:endpoint>', methods=['POST'])
+def gateway_v1(endpoint):
+    """OpenAI API gateway load balanced across the vLLM replicas"""
+    return proxy_to_backend('POST', f'/v1/{endpoint}')
+
+@app.route('/tokenize', methods=['POST'])
+def gateway_tokenize():
+    """vLLM tokenizer endpoint, used by the length sweep benchmark through the gateway"""
+    return proxy_to_backend('POST', '/tokenize')
+
+@app.route('/backends')
+def list_backends():
+    """Health, load and routing policy of the vLLM backend pool"""
+    return jsonify({'success': True, 'pool': get_backend_pool().stats()})
+
+@app.route('/admission')
+def admission_stats():
+    """Admission window, queue depth and rejections per priority class"""
+    return jsonify({'success': True, 'admission': get_admission().stats()})
+
+@app.route('/response-cache')
+def response_cache_stats():
+    """Hit/miss counts and size of the response cache"""
+    if response_cache is None:
+        return jsonify({'success': True, 'enabled': False})
+    return jsonify({'success': True, 'enabled': True, 'stats': response_cache.stats()})
+
+@app.route('/response-cache/clear', methods=['POST'])
+def clear_response_cache():
+    """Drop cached responses, for all models or only the one given"""
+    if response_cache is None:
+        return jsonify({'success': False, 'message': 'Response cache is disabled'})
+    removed = response_cache.invalidate((request.json or {}).get('model') if request.is_json else None)
+    return jsonify({'success': True, 'removed': removed})
+
+@app.route('/backends/drain', methods=['POST'])
+def drain_backend():
+    """Take a backend out of rotation (or put it back) without dropping in-flight requests"""
+    data = request.json or {}
+    try:
+        get_backend_pool().drain(data.get('url', ''), bool(data.get('draining', True)))
+        return jsonify({'success': True, 'pool': backend_pool.stats()})
+    except KeyError:
+        return jsonify({'success': False, 'message': f"Unknown backend: {data.get('url')}"}), 404
+
+@app.route('/batch-jobs', methods=['POST'])
+def create_batch_job():
+    """Start a batch job from an uploaded OpenAI batch JSONL file or a path on this host"""
+    try:
+        data = request.form if request.files else (request.json or {})
+        admission_window = get_admission()
+        # Enough requests in flight to fill the batch class's share of the engine
+        default_concurrency = int(admission_window.max_concurrency * admission_window.classes['batch']['max_share'])
+        job = batch_jobs.create(
+            input_path=data.get('input_path'),
+            concurrency=int(data.get('concurrency') or default_concurrency),
+            max_retries=int(data.get('max_retries', 3)),
+            upload=request.files.get('file'))
+        return jsonify({'success': True, 'job': job.to_dict()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/batch-jobs')
+def list_batch_jobs():
+    """List batch jobs, newest first"""
+    return jsonify({'success': True, 'jobs': batch_jobs.list_jobs()})
+
+@app.route('/batch-jobs/<job_id>')
+def get_batch_job(job_id):
+    """Status, progress, throughput and ETA of a batch job"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown batch job'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/batch-jobs/<job_id>/pause', methods=['POST'])
+def pause_batch_job(job_id):
+    """Stop a batch job once its in-flight requests finish"""
+    if batch_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'message': 'Unknown batch job'}), 404
+    return jsonify({'success': True, 'job': batch_jobs.pause(job_id).to_dict()})
+
+@app.route('/batch-jobs/<job_id>/resume', methods=['POST'])
+def resume_batch_job(job_id):
+    """Continue a paused or failed batch job from its checkpoint"""
+    if batch_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'message': 'Unknown batch job'}), 404
+    try:
+        return jsonify({'success': True, 'job': batch_jobs.start(job_id).to_dict()})
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+
+@app.route('/batch-jobs/<job_id>/output')
+def download_batch_output(job_id):
+    """Results written so far, one OpenAI batch output line per request"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown batch job'}), 404
+    return send_file(os.path.abspath(job.output_path), mimetype='application/jsonl', as_attachment=True,
+                     download_name=f'{job_id}_output.jsonl')
+
+@app.route('/benchmark-history')
+def list_benchmark_history():
+    """List stored benchmark runs, newest first"""
+    try:
+        model = request.args.get('model')
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({'success': True, 'runs': benchmark_history.list_runs(model, limit)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/benchmark-history/<int:run_id>')
+def get_benchmark_run(run_id):
+    """Get a stored benchmark run with its config and results"""
+    run = benchmark_history.get_run(run_id)
+    if run is None:
+        return jsonify({'success': False, 'message': 'Unknown benchmark run'}), 404
+    return jsonify({'success': True, 'run': run})
+
+@app.route('/benchmark-history/compare')
+def compare_benchmark_runs():
+    """Compare two stored runs and flag regressions beyond a threshold"""
+    try:
+        base_id = request.args.get('base', type=int)
+        candidate_id = request.args.get('candidate', type=int)
+        threshold = request.args.get('threshold', 10.0, type=float)
+        if base_id is None or candidate_id is None:
+            return jsonify({'success': False, 'message': 'Both base and candidate run ids are required'})
+        comparison = benchmark_history.compare_runs(base_id, candidate_id, threshold)
+        return jsonify({'success': True, 'comparison': comparison})
+    except KeyError:
+        return jsonify({'success': False, 'message': 'Unknown benchmark run'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5005)
+    debug = True
+    # The debug reloader serves from a child process (WERKZEUG_RUN_MAIN) while the parent
+    # only watches files; create the services in the serving process alone
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_services()
+    app.run(debug=debug, host='0.0.0.0', port=5005)
@@ -0,0 +1,220 @@
+"""
+Prometheus metrics for the SlydLLMSite app
+
+Minimal counters, gauges and fixed-bucket histograms rendered in the
+Prometheus text exposition format. Each update is a dict lookup and an add
+under a lock, cheap enough to call on every request.
+"""
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+# Seconds; spans sub-10ms route handling up to multi-minute generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name: str, documentation: str, label_names: List[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names or ())
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} expects labels {self.label_names}, got {tuple(labels)}')
+        return tuple(labels[name] for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(self.label_names, key)} {value}'
+                                for key, value in items]
+
+
+class Gauge(Counter):
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: List[str] = None,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # Index of the first bucket whose upper bound (le) holds value; len(buckets) is +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+
+        lines = self.header()
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.label_names, key, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'slyd_http_request_duration_seconds',
+    'Time to handle a request to the app, until the response starts for streamed routes',
+    ['route', 'method', 'status']))
+
+UPSTREAM_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'slyd_upstream_request_duration_seconds',
+    'End-to-end latency of chat completions proxied to vLLM',
+    ['stream']))
+
+UPSTREAM_TTFT = REGISTRY.register(Histogram(
+    'slyd_upstream_time_to_first_token_seconds',
+    'Time to the first streamed token from vLLM'))
+
+UPSTREAM_TOKENS = REGISTRY.register(Counter(
+    'slyd_upstream_tokens_total',
+    'Prompt and completion tokens processed by vLLM for proxied requests',
+    ['kind']))
+
+UPSTREAM_REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'slyd_upstream_requests_in_flight',
+    'Chat completions currently waiting on vLLM'))
+
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    'slyd_upstream_errors_total',
+    'Failed calls to vLLM by class: timeout, connection, http_status or other',
+    ['error_class', 'status']))
+
+BENCHMARK_JOB_DURATION = REGISTRY.register(Histogram(
+    'slyd_benchmark_job_duration_seconds',
+    'Wall time of benchmark jobs from start to finish',
+    ['test_type', 'status'],
+    buckets=(10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0, 7200.0)))
+
+GATEWAY_REQUESTS = REGISTRY.register(Counter(
+    'slyd_gateway_requests_total',
+    'Requests proxied through the gateway by backend and upstream status',
+    ['backend', 'status']))
+
+BACKEND_OUTSTANDING = REGISTRY.register(Gauge(
+    'slyd_backend_outstanding_requests',
+    'Requests currently in flight to each vLLM backend',
+    ['backend']))
+
+BACKEND_HEALTHY = REGISTRY.register(Gauge(
+    'slyd_backend_healthy',
+    '1 if the backend passed its last health checks, 0 if it is out of rotation',
+    ['backend']))
+
+BACKEND_AFFINITY_ROUTING = REGISTRY.register(Counter(
+    'slyd_backend_affinity_routing_total',
+    'Prefix affinity routing outcomes: hits (home replica), fallbacks (home overloaded or down), unkeyed',
+    ['outcome']))
+
+ADMISSION_QUEUE_WAIT = REGISTRY.register(Histogram(
+    'slyd_admission_queue_wait_seconds',
+    'Time requests waited in the admission queue before reaching vLLM',
+    ['priority_class']))
+
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'slyd_admission_queue_depth',
+    'Requests waiting for admission',
+    ['priority_class']))
+
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    'slyd_admission_rejections_total',
+    'Requests turned away with 429: rejected up front or timed_out in the queue',
+    ['priority_class', 'reason']))
+
+RESPONSE_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'slyd_response_cache_lookups_total',
+    'Response cache lookups: memory_hits, disk_hits, misses, or bypassed for non-deterministic requests',
+    ['result']))
+
+RESPONSE_CACHE_BYTES = REGISTRY.register(Gauge(
+    'slyd_response_cache_bytes',
+    'Size of the cached response bodies held in memory'))
+
+BATCH_REQUESTS = REGISTRY.register(Counter(
+    'slyd_batch_requests_total',
+    'Batch job requests by outcome: succeeded, failed (error status), error (not sent) or invalid',
+    ['outcome']))
+
+VLLM_RELOADS = REGISTRY.register(Counter(
+    'slyd_vllm_reloads_total',
+    'vLLM config reloads: blue_green swaps (completed or failed) and plain service restarts',
+    ['mode', 'result']))
+
+VLLM_RELOAD_DURATION = REGISTRY.register(Histogram(
+    'slyd_vllm_reload_duration_seconds',
+    'Time from starting a reload until the new vLLM instance serves traffic and the old one is stopped',
+    ['mode'],
+    buckets=(10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0)))
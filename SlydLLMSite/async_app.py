@@ -0,0 +1,487 @@
+"""
+Async serving mode for SlydLLMSite
+
+The Flask app holds a worker thread for every in-flight chat completion and
+benchmark event stream, so a few dozen concurrent chat users exhaust it. This
+aiohttp server handles those long-lived routes natively on one event loop,
+with one pooled upstream ClientSession: /chat-completion (streaming and not),
+the OpenAI /v1 gateway and /tokenize, benchmark job event streams and
+/metrics. Every other route is short-lived configuration work and is served
+by the unchanged Flask app on a small thread pool, so both modes share the
+same backend pool, admission controller, response cache, benchmark jobs and
+Prometheus metrics.
+
+Usage:
+    python async_app.py --host 0.0.0.0 --port 5005
+"""
+import argparse
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+import app as site
+import app_metrics
+from admission import AdmissionRejected, estimate_prompt_tokens
+from backend_pool import NoHealthyBackendError
+
+SSE_HEADERS = {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def classify_error(error: Exception) -> str:
+    """Same error classes the Flask routes record"""
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return 'connection'
+    return 'other'
+
+
+def error_message(error: Exception) -> str:
+    return {
+        'timeout': 'Request timed out',
+        'connection': 'Cannot connect to vLLM server. Is it running?'
+    }.get(classify_error(error), str(error))
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Upstream session sized and timed like the Flask app's PooledHTTPClient"""
+    settings = site.load_app_config().get('http_client', {})
+    connector = aiohttp.TCPConnector(limit=settings.get('pool_maxsize', 64), keepalive_timeout=60)
+    # The read timeout applies between chunks, so long streamed answers are fine
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=settings.get('connect_timeout', 5.0),
+                                    sock_read=settings.get('read_timeout', 60.0))
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+class AsyncSite:
+    def __init__(self, wsgi_threads: int = 16):
+        self.session = None
+        # Flask routes are quick file and systemctl work; a few threads are plenty
+        self.executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='wsgi')
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.record_request_duration], client_max_size=100 * 1024 * 1024)
+        app.router.add_get('/metrics', self.metrics)
+        app.router.add_post('/chat-completion', self.chat_completion)
+        app.router.add_get('/v1/models', self.gateway)
+        app.router.add_post('/v1/{endpoint:.+}', self.gateway)
+        app.router.add_post('/tokenize', self.gateway)
+        app.router.add_get('/benchmark-jobs/{job_id}/events', self.benchmark_job_events)
+        app.router.add_get('/batch-jobs/{job_id}/output', self.batch_job_output)
+        app.router.add_route('*', '/{path:.*}', self.wsgi)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app: web.Application):
+        # Native routes bypass Flask's before_request hook, so make sure the services exist
+        site.init_services()
+        self.session = create_session()
+
+    async def _on_cleanup(self, app: web.Application):
+        await self.session.close()
+        self.executor.shutdown(wait=False)
+
+    @web.middleware
+    async def record_request_duration(self, request: web.Request, handler):
+        # Requests handed to Flask are timed by its own after_request hook
+        if handler == self.wsgi:
+            return await handler(request)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            resource = request.match_info.route.resource
+            app_metrics.HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, route=resource.canonical if resource else 'unmatched',
+                method=request.method, status=str(status))
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=app_metrics.REGISTRY.render().encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+    # Chat
+
+    async def chat_completion(self, request: web.Request) -> web.StreamResponse:
+        """Async /chat-completion with the same request, cache and admission handling as the Flask route"""
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data or not data.get('prompt'):
+            return web.json_response({'success': False, 'message': 'No prompt provided'})
+
+        chat_request = site.build_chat_request(data)
+        cached = site.response_cache.get(chat_request, site.CHAT_CACHE_ROUTE) if site.response_cache else None
+        if cached is not None:
+            content, metrics = site.cached_chat_events(json.loads(cached))
+            if not data.get('stream'):
+                return web.json_response({'success': True, 'response': content, 'metrics': metrics})
+            response = await self._open_stream(request)
+            await response.write(site.sse_event({'type': 'token', 'content': content}).encode())
+            await response.write(site.sse_event({'type': 'metrics', 'metrics': dict(
+                metrics, ttft_ms=0, itl_mean_ms=0, itl_p95_ms=0, decode_tps=0)}).encode())
+            return response
+
+        try:
+            ticket = await site.get_admission().acquire_async(
+                site.request_priority_class('interactive', request.headers), estimate_prompt_tokens(chat_request))
+        except AdmissionRejected as e:
+            return web.json_response({'success': False, 'message': str(e), 'retry_after': e.retry_after},
+                                     status=429, headers={'Retry-After': str(e.retry_after)})
+        try:
+            if data.get('stream'):
+                return await self._stream_chat(request, chat_request)
+            return await self._complete_chat(chat_request)
+        finally:
+            site.admission.release(ticket)
+
+    async def _complete_chat(self, chat_request: dict) -> web.Response:
+        pool = site.get_backend_pool()
+        start_time = time.time()
+        app_metrics.UPSTREAM_REQUESTS_IN_FLIGHT.inc()
+        backend, error = None, None
+        try:
+            backend = pool.acquire(affinity_key=site.routing_key(chat_request))
+            async with self.session.post(f"{backend.url}/v1/chat/completions", json=chat_request) as response:
+                if response.status != 200:
+                    site.record_upstream_error('http_status', response.status)
+                    return web.json_response({'success': False, 'message': f'vLLM error: {response.status}',
+                                              'details': await response.text()})
+                body = await response.read()
+        except NoHealthyBackendError as e:
+            site.record_upstream_error('no_backend')
+            return web.json_response({'success': False, 'message': str(e)})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+            site.record_upstream_error(classify_error(e))
+            return web.json_response({'success': False, 'message': error_message(e)})
+        finally:
+            app_metrics.UPSTREAM_REQUESTS_IN_FLIGHT.dec()
+            if backend is not None:
+                pool.release(backend, error)
+
+        try:
+            result = json.loads(body)
+            content = result['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            # Same reply as the Flask route gives for a response it cannot parse
+            site.record_upstream_error('other')
+            return web.json_response({'success': False, 'message': f'Unexpected vLLM response: {e!r}',
+                                      'details': body.decode('utf-8', 'replace')[:1000]})
+        # Only well-formed completions are worth serving again
+        if site.response_cache:
+            site.response_cache.put(chat_request, body, site.CHAT_CACHE_ROUTE)
+        return web.json_response({
+            'success': True,
+            'response': content,
+            'metrics': site.chat_metrics(result.get('usage', {}), time.time() - start_time)
+        })
+
+    async def _open_stream(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers=SSE_HEADERS)
+        await response.prepare(request)
+        return response
+
+    async def _stream_chat(self, request: web.Request, chat_request: dict) -> web.StreamResponse:
+        """Relay vLLM's SSE stream as {"type": "token"} frames and a closing {"type": "metrics"} frame"""
+        chat_request = dict(chat_request, stream=True, stream_options={'include_usage': True})
+        response = await self._open_stream(request)
+        pool = site.get_backend_pool()
+
+        start_time = time.time()
+        first_token_time = None
+        last_token_time = None
+        inter_token_gaps = []
+        content_parts = []
+        finish_reason = None
+        usage = {}
+
+        app_metrics.UPSTREAM_REQUESTS_IN_FLIGHT.inc()
+        backend, error = None, None
+        try:
+            backend = pool.acquire(affinity_key=site.routing_key(chat_request))
+            async with self.session.post(f"{backend.url}/v1/chat/completions", json=chat_request) as upstream:
+                if upstream.status != 200:
+                    site.record_upstream_error('http_status', upstream.status)
+                    await response.write(site.sse_event({'type': 'error', 'message': f'vLLM error: {upstream.status}',
+                                                         'details': await upstream.text()}).encode())
+                    return response
+
+                async for raw_line in upstream.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+
+                    chunk = json.loads(payload)
+                    if chunk.get('usage'):
+                        usage = chunk['usage']
+                    choices = chunk.get('choices') or []
+                    if choices and choices[0].get('finish_reason'):
+                        finish_reason = choices[0]['finish_reason']
+                    content = choices[0].get('delta', {}).get('content') if choices else None
+                    if not content:
+                        continue
+
+                    now = time.time()
+                    if first_token_time is None:
+                        first_token_time = now
+                        app_metrics.UPSTREAM_TTFT.observe(now - start_time)
+                    else:
+                        inter_token_gaps.append(now - last_token_time)
+                    last_token_time = now
+                    content_parts.append(content)
+                    await response.write(site.sse_event({'type': 'token', 'content': content}).encode())
+        except NoHealthyBackendError as e:
+            site.record_upstream_error('no_backend')
+            await response.write(site.sse_event({'type': 'error', 'message': str(e)}).encode())
+            return response
+        except ConnectionResetError:
+            # The browser went away; nothing left to send
+            return response
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+            site.record_upstream_error(classify_error(e))
+            await response.write(site.sse_event({'type': 'error', 'message': error_message(e)}).encode())
+            return response
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            # A chunk that is not an OpenAI stream event; end with an error frame rather than a cut stream
+            site.record_upstream_error('other')
+            await response.write(site.sse_event({'type': 'error',
+                                                 'message': f'Unexpected vLLM response: {e!r}'}).encode())
+            return response
+        finally:
+            app_metrics.UPSTREAM_REQUESTS_IN_FLIGHT.dec()
+            if backend is not None:
+                pool.release(backend, error)
+
+        if finish_reason:
+            site.cache_streamed_completion(chat_request, content_parts, finish_reason, usage)
+        metrics = site.streamed_chat_metrics(start_time, first_token_time, inter_token_gaps, usage,
+                                             len(content_parts))
+        await response.write(site.sse_event({'type': 'metrics', 'metrics': metrics}).encode())
+        return response
+
+    # OpenAI gateway
+
+    async def gateway(self, request: web.Request) -> web.StreamResponse:
+        """Async counterpart of the Flask gateway: cache, admission, then a healthy replica"""
+        body = await request.read()
+        payload = None
+        if request.path.endswith('completions'):
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                pass
+        if payload is None:
+            return await self._forward(request, body, None)
+
+        use_cache = site.response_cache is not None and isinstance(payload, dict) and not payload.get('stream')
+        if use_cache:
+            cached = site.response_cache.get(payload, request.path)
+            if cached is not None:
+                return web.Response(body=cached, content_type='application/json', headers={'X-Cache': 'HIT'})
+
+        try:
+            ticket = await site.get_admission().acquire_async(
+                site.request_priority_class('default', request.headers), estimate_prompt_tokens(payload))
+        except AdmissionRejected as e:
+            return self._gateway_error(str(e), 429, 'RateLimitError', {'Retry-After': str(e.retry_after)})
+        try:
+            response = await self._forward(request, body, site.routing_key(payload))
+        finally:
+            site.admission.release(ticket)
+        if use_cache and response.status == 200 and isinstance(response, web.Response):
+            site.response_cache.put(payload, response.body, request.path)
+        return response
+
+    @staticmethod
+    def _gateway_error(message: str, status: int, error_type: str, headers: dict = None) -> web.Response:
+        return web.json_response({'object': 'error', 'message': message, 'type': error_type, 'code': status},
+                                 status=status, headers=headers)
+
+    async def _forward(self, request: web.Request, body: bytes, affinity_key: str) -> web.StreamResponse:
+        pool = site.get_backend_pool()
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in site.HOP_BY_HOP_HEADERS}
+        tried = []
+
+        while True:
+            try:
+                backend = pool.acquire(exclude=tried, affinity_key=affinity_key)
+            except NoHealthyBackendError as e:
+                site.record_upstream_error('no_backend')
+                return self._gateway_error(str(e), 503, 'ServiceUnavailableError')
+
+            try:
+                upstream = await self.session.request(request.method, f"{backend.url}{request.path}",
+                                                      params=request.query, data=body, headers=headers)
+            except aiohttp.ClientConnectorError as e:
+                # Nothing reached the replica, so another one can take the request
+                pool.release(backend, e)
+                app_metrics.GATEWAY_REQUESTS.inc(backend=backend.url, status='connection_error')
+                site.record_upstream_error('connection')
+                tried.append(backend.url)
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                pool.release(backend, e)
+                app_metrics.GATEWAY_REQUESTS.inc(backend=backend.url, status='timeout')
+                site.record_upstream_error(classify_error(e))
+                return self._gateway_error(f'Backend {backend.url} timed out', 504, 'TimeoutError')
+
+            app_metrics.GATEWAY_REQUESTS.inc(backend=backend.url, status=str(upstream.status))
+            response_headers = {k: v for k, v in upstream.headers.items()
+                                if k.lower() not in site.HOP_BY_HOP_HEADERS}
+            response_headers['X-Backend'] = backend.url
+            error = None
+            try:
+                if 'text/event-stream' not in upstream.headers.get('Content-Type', ''):
+                    return web.Response(body=await upstream.read(), status=upstream.status,
+                                        headers=response_headers)
+
+                response_headers['X-Accel-Buffering'] = 'no'
+                response = web.StreamResponse(status=upstream.status, headers=response_headers)
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_any():
+                    await response.write(chunk)
+                await response.write_eof()
+                return response
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                site.record_upstream_error('stream_aborted')
+                raise
+            finally:
+                upstream.release()
+                pool.release(backend, error)
+
+    # Benchmarks
+
+    async def benchmark_job_events(self, request: web.Request) -> web.StreamResponse:
+        """Follow a benchmark job's progress as server-sent events without holding a thread"""
+        job_id = request.match_info['job_id']
+        if site.benchmark_jobs.get(job_id) is None:
+            return web.json_response({'success': False, 'message': 'Unknown benchmark job'}, status=404)
+
+        # EventSource resends the last id it saw when reconnecting
+        last_event_id = request.headers.get('Last-Event-ID')
+        index = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+        response = await self._open_stream(request)
+        last_write = time.time()
+
+        while True:
+            pending, finished = site.benchmark_jobs.events_since(job_id, index)
+            for event in pending:
+                await response.write(f"id: {index}\ndata: {json.dumps(event, default=float)}\n\n".encode())
+                index += 1
+            if pending:
+                last_write = time.time()
+            elif finished:
+                return response
+            elif time.time() - last_write > 15.0:
+                await response.write(b': keep-alive\n\n')
+                last_write = time.time()
+            await asyncio.sleep(0.25)
+
+    async def batch_job_output(self, request: web.Request) -> web.StreamResponse:
+        """Batch results straight from disk; the output of a large job can run to gigabytes"""
+        job_id = request.match_info['job_id']
+        job = site.batch_jobs.get(job_id)
+        if job is None:
+            return web.json_response({'success': False, 'message': 'Unknown batch job'}, status=404)
+        return web.FileResponse(job.output_path, headers={
+            'Content-Type': 'application/jsonl',
+            'Content-Disposition': f'attachment; filename="{job_id}_output.jsonl"'
+        })
+
+    # Everything else: the Flask app
+
+    async def wsgi(self, request: web.Request) -> web.StreamResponse:
+        """Serve a route from the Flask app on the thread pool, streaming its body chunk by chunk"""
+        body = await request.read()
+        sockname = request.transport.get_extra_info('sockname') if request.transport else None
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': request.path,
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': request.host.split(':')[0],
+            # /run-benchmark uses this to send pool benchmarks back through this server
+            'SERVER_PORT': str(sockname[1]) if sockname else '5005',
+            'SERVER_PROTOCOL': f'HTTP/{request.version.major}.{request.version.minor}',
+            'REMOTE_ADDR': request.remote or '',
+            'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in request.headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                environ[key] = value
+
+        loop = asyncio.get_running_loop()
+        status, headers, result = await loop.run_in_executor(self.executor, self._call_wsgi, environ)
+        try:
+            response = web.StreamResponse(status=status, headers=[
+                (k, v) for k, v in headers if k.lower() not in site.HOP_BY_HOP_HEADERS])
+            await response.prepare(request)
+            # Each chunk is produced on the thread pool, so slow or large bodies never sit in memory whole
+            chunks = iter(result)
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await response.write(chunk)
+            await response.write_eof()
+            return response
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    @staticmethod
+    def _call_wsgi(environ: dict):
+        """Run the Flask app up to its response headers; the body iterable is consumed by the caller"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        result = site.app(environ, start_response)
+        return started['status'], started['headers'], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve SlydLLMSite on an async event loop')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5005)
+    parser.add_argument('--wsgi-threads', type=int, default=16,
+                        help='Threads for the configuration routes served by the Flask app')
+    args = parser.parse_args()
+
+    print(f"SlydLLMSite (async) serving on http://{args.host}:{args.port}")
+    web.run_app(AsyncSite(args.wsgi_threads).create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
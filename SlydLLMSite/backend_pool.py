@@ -0,0 +1,317 @@
+"""
+Pool of vLLM backends behind the SlydLLMSite gateway
+
+On multi-GPU boxes several single-GPU vLLM replicas can serve the same
+model. BackendPool tracks each replica's outstanding requests and, from its
+/metrics, KV cache usage, and routes every request to the least loaded
+healthy replica, or, with prefix_affinity, pins requests sharing a prompt
+prefix to one replica so its prefix cache is reused. A background thread health-checks the replicas; one that
+fails repeatedly (or refuses connections on the request path) stops
+receiving new requests until it recovers, while requests already on it
+finish normally.
+"""
+import bisect
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import aiohttp
+import requests
+
+import app_metrics
+from vllm_metrics import extract_sample, parse_prometheus
+
+POLICIES = ('least_outstanding', 'least_kv_cache', 'prefix_affinity')
+
+# Points per backend on the hash ring; more points spread keys more evenly
+RING_REPLICAS = 100
+
+
+def _hash(value: str) -> int:
+    # Stable across processes, unlike hash(), so every app worker agrees on placement
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+def prefix_key(payload: Dict, prefix_chars: int = 1024) -> Optional[str]:
+    """Hash of the shared leading part of a chat or completion request's prompt.
+    
+    Requests that share a system prompt or retrieved context share this key, and
+    vLLM's prefix cache only helps if they land on the same replica. For chats
+    only the messages before the last user turn count (capped at prefix_chars),
+    so a short system prompt is not mixed with each request's own question. A
+    single-message chat or a plain prompt falls back to its first prefix_chars.
+    """
+    if not isinstance(payload, dict):
+        return None
+    messages = payload.get('messages')
+    if isinstance(messages, list) and messages:
+        messages = [m for m in messages if isinstance(m, dict)]
+        user_turns = [i for i, m in enumerate(messages) if m.get('role') == 'user']
+        leading = messages[:user_turns[-1]] if user_turns else messages[:-1]
+        parts = []
+        for message in leading or messages[:1]:
+            content = message.get('content')
+            parts.append(f"{message.get('role')}:{content if isinstance(content, str) else json.dumps(content)}\n")
+            if sum(len(p) for p in parts) >= prefix_chars:
+                break
+        text = ''.join(parts)
+    elif isinstance(payload.get('prompt'), str):
+        text = payload['prompt']
+    else:
+        return None
+    return hashlib.sha1(f"{payload.get('model')}\n{text[:prefix_chars]}".encode('utf-8')).hexdigest()
+
+
+class NoHealthyBackendError(Exception):
+    """Raised when every backend is unhealthy, draining or excluded"""
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.healthy = True
+        self.draining = False
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.last_check = None
+        self.last_error = None
+        self.kv_cache_usage = None
+        self.running = None
+        self.waiting = None
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.draining
+
+    def to_dict(self) -> Dict:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'draining': self.draining,
+            'outstanding': self.outstanding,
+            'consecutive_failures': self.consecutive_failures,
+            'last_check': self.last_check,
+            'last_error': self.last_error,
+            'kv_cache_usage': self.kv_cache_usage,
+            'running': self.running,
+            'waiting': self.waiting,
+            'requests': self.requests,
+            'errors': self.errors
+        }
+
+
+class BackendPool:
+    def __init__(self, urls: List[str] = None, policy: str = 'least_outstanding', health_interval: float = 5.0,
+                 failure_threshold: int = 3, health_timeout: float = 2.0, load_factor: float = 1.25):
+        """
+        A backend is taken out of rotation after failure_threshold consecutive
+        failed health checks or connection errors, and put back after its next
+        successful check.
+        
+        With prefix_affinity, a backend takes a keyed request only while its
+        outstanding requests stay under load_factor times the pool average
+        (consistent hashing with bounded loads); past that the request moves on
+        along the ring rather than queueing behind a hot prefix.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown routing policy: {policy}')
+        self.policy = policy
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.health_timeout = health_timeout
+        self.load_factor = load_factor
+        self._lock = threading.Lock()
+        self._backends = {}
+        self._ring = []
+        self._ring_hashes = []
+        self.affinity = {'hits': 0, 'fallbacks': 0, 'unkeyed': 0}
+        self._session = requests.Session()
+        self._thread = None
+        self.set_backends(urls or [])
+
+    def set_backends(self, urls: List[str]) -> bool:
+        """Replace the backend list, keeping state for URLs already in the pool; True if it changed"""
+        urls = [url.rstrip('/') for url in urls]
+        with self._lock:
+            if list(self._backends) == urls:
+                return False
+            self._backends = {url: self._backends.get(url) or Backend(url) for url in urls}
+            # Adding or removing a backend only moves the keys on its own ring points
+            self._ring = sorted((_hash(f'{url}#{i}'), url) for url in urls for i in range(RING_REPLICAS))
+            self._ring_hashes = [h for h, _ in self._ring]
+        return True
+
+    @property
+    def backends(self) -> List[Backend]:
+        with self._lock:
+            return list(self._backends.values())
+
+    def start(self):
+        """Start the background health checker (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._health_loop, name='backend-health', daemon=True)
+            self._thread.start()
+
+    def _health_loop(self):
+        while True:
+            for backend in self.backends:
+                self.check(backend)
+            time.sleep(self.health_interval)
+
+    def check(self, backend: Backend):
+        """Probe /health, then refresh load gauges from /metrics"""
+        backend.last_check = time.time()
+        try:
+            response = self._session.get(f'{backend.url}/health', timeout=self.health_timeout)
+            if response.status_code != 200:
+                raise requests.exceptions.HTTPError(f'Status {response.status_code}')
+        except requests.exceptions.RequestException as e:
+            self.report_failure(backend, str(e))
+            return
+
+        with self._lock:
+            backend.consecutive_failures = 0
+            backend.last_error = None
+            backend.healthy = True
+        app_metrics.BACKEND_HEALTHY.set(1, backend=backend.url)
+
+        try:
+            response = self._session.get(f'{backend.url}/metrics', timeout=self.health_timeout)
+            if response.status_code == 200:
+                sample = extract_sample(parse_prometheus(response.text))
+                backend.kv_cache_usage = sample['kv_cache_usage']
+                backend.running = sample['running']
+                backend.waiting = sample['waiting']
+        except requests.exceptions.RequestException:
+            # Load gauges are best-effort; routing falls back to outstanding counts
+            pass
+
+    def report_failure(self, backend: Backend, error: str = None):
+        with self._lock:
+            backend.consecutive_failures += 1
+            backend.last_error = error
+            if backend.consecutive_failures >= self.failure_threshold:
+                backend.healthy = False
+        if not backend.healthy:
+            app_metrics.BACKEND_HEALTHY.set(0, backend=backend.url)
+
+    def drain(self, url: str, draining: bool = True):
+        """Stop (or resume) sending new requests to a backend; in-flight requests finish"""
+        with self._lock:
+            backend = self._backends.get(url.rstrip('/'))
+            if backend is None:
+                raise KeyError(url)
+            backend.draining = draining
+
+    def _load_key(self, backend: Backend):
+        if self.policy == 'least_kv_cache':
+            # Stale between scrapes, so outstanding requests break ties and fill the gap
+            return (backend.kv_cache_usage if backend.kv_cache_usage is not None else 0.0, backend.outstanding)
+        return (backend.outstanding,)
+
+    def _select(self, exclude: List[str]) -> Backend:
+        """Pick the least loaded available backend; caller holds the lock"""
+        candidates = [b for b in self._backends.values() if b.available and b.url not in exclude]
+        if not candidates:
+            raise NoHealthyBackendError('No healthy vLLM backend available')
+        lowest = min(self._load_key(b) for b in candidates)
+        # Random among equals so idle replicas share load instead of the first taking it all
+        return random.choice([b for b in candidates if self._load_key(b) == lowest])
+
+    def _select_affine(self, key: str, exclude: List[str]) -> Backend:
+        """Walk the ring from the key's point to the first backend under its load bound; caller holds the lock"""
+        candidates = [b for b in self._backends.values() if b.available and b.url not in exclude]
+        if not candidates:
+            raise NoHealthyBackendError('No healthy vLLM backend available')
+        total = sum(b.outstanding for b in candidates) + 1
+        capacity = math.ceil(self.load_factor * total / len(candidates))
+
+        start = bisect.bisect(self._ring_hashes, _hash(key))
+        home = None
+        seen = set()
+        for offset in range(len(self._ring)):
+            url = self._ring[(start + offset) % len(self._ring)][1]
+            if url in seen:
+                continue
+            seen.add(url)
+            if home is None:
+                home = url
+            backend = self._backends[url]
+            if backend.available and url not in exclude and backend.outstanding < capacity:
+                self._count_affinity('hits' if url == home else 'fallbacks')
+                return backend
+        # Unreachable while capacity exceeds the average load, kept as a safe default
+        self._count_affinity('fallbacks')
+        return self._select(exclude)
+
+    def _count_affinity(self, outcome: str):
+        self.affinity[outcome] += 1
+        app_metrics.BACKEND_AFFINITY_ROUTING.inc(outcome=outcome)
+
+    def acquire(self, exclude: List[str] = (), affinity_key: str = None) -> Backend:
+        """Reserve a backend, counting the request as outstanding until release().
+        
+        affinity_key (see prefix_key) is used by the prefix_affinity policy;
+        requests without one go to the least loaded backend.
+        """
+        with self._lock:
+            # Select and count in one step so concurrent callers see each other's load
+            if self.policy != 'prefix_affinity':
+                backend = self._select(exclude)
+            elif affinity_key is None:
+                self._count_affinity('unkeyed')
+                backend = self._select(exclude)
+            else:
+                backend = self._select_affine(affinity_key, exclude)
+            backend.outstanding += 1
+            backend.requests += 1
+        app_metrics.BACKEND_OUTSTANDING.inc(backend=backend.url)
+        return backend
+
+    def release(self, backend: Backend, error: Exception = None):
+        with self._lock:
+            backend.outstanding -= 1
+            if error is not None:
+                backend.errors += 1
+        app_metrics.BACKEND_OUTSTANDING.dec(backend=backend.url)
+        if isinstance(error, (requests.exceptions.ConnectionError, aiohttp.ClientConnectorError)):
+            # Refused connections mean the replica is down; don't wait for the next check
+            self.report_failure(backend, str(error))
+
+    @contextmanager
+    def lease(self, exclude: List[str] = (), affinity_key: str = None) -> Iterator[Backend]:
+        """acquire() and release() around one request"""
+        backend = self.acquire(exclude, affinity_key)
+        error = None
+        try:
+            yield backend
+        except requests.exceptions.RequestException as e:
+            error = e
+            raise
+        finally:
+            self.release(backend, error)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            backends = [b.to_dict() for b in self._backends.values()]
+            affinity = dict(self.affinity)
+        keyed = affinity['hits'] + affinity['fallbacks']
+        # Share of keyed requests served by their home replica, where the prefix is cached
+        affinity['hit_rate'] = affinity['hits'] / keyed if keyed else None
+        return {
+            'policy': self.policy,
+            'health_interval': self.health_interval,
+            'failure_threshold': self.failure_threshold,
+            'healthy_backends': sum(1 for b in backends if b['healthy'] and not b['draining']),
+            'affinity': affinity,
+            'backends': backends
+        }
@@ -0,0 +1,442 @@
+"""
+Offline batch inference jobs for the SlydLLMSite app
+
+A job takes a JSONL file in the OpenAI batch format (one
+{"custom_id", "method", "url", "body"} request per line), streams it through
+the vLLM backend pool at a fixed concurrency and appends one OpenAI-style
+result line per request to an output JSONL. Requests go through admission
+control as the batch class, so interactive traffic keeps priority while the
+batch soaks up the rest of the engine.
+
+Each job lives in its own directory with a state.json checkpoint: the input
+line and byte offset below which every request is done, the few finished
+lines above it, and the output size at that moment. Resuming truncates the
+output back to the checkpoint and continues from there, so after a restart
+every request appears in the output exactly once.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import aiohttp
+
+import app_metrics
+import config_cache
+from admission import AdmissionRejected, estimate_prompt_tokens
+from backend_pool import NoHealthyBackendError, prefix_key
+
+# Upstream statuses worth another attempt; anything else is the request's own fault
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Seconds of completions behind the throughput and ETA figures
+RATE_WINDOW = 60.0
+
+
+def lock_job_dir(job_dir: str):
+    """Exclusive flock on a job directory, held while the job runs; None if another process holds it"""
+    handle = open(os.path.join(job_dir, 'job.lock'), 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+class BatchJob:
+    def __init__(self, job_dir: str, input_path: str, concurrency: int = 32, max_retries: int = 3):
+        self.id = os.path.basename(job_dir)
+        self.dir = job_dir
+        self.input_path = input_path
+        self.output_path = os.path.join(job_dir, 'output.jsonl')
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.total = None
+        self.succeeded = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # Every input line below next_line (starting at input_offset) is in the output
+        self.checkpoint = {'next_line': 0, 'input_offset': 0, 'done_above': [], 'output_offset': 0}
+        self.stop_requested = False
+        # Scheduled on the loop in this process; always False for a job loaded from disk
+        self.active = False
+        self._recent = deque()
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.dir, 'state.json')
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def save(self):
+        config_cache.write_json(self.state_path, {
+            'input_path': self.input_path,
+            'concurrency': self.concurrency,
+            'max_retries': self.max_retries,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'total': self.total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'checkpoint': self.checkpoint
+        })
+
+    @classmethod
+    def load(cls, job_dir: str) -> 'BatchJob':
+        with open(os.path.join(job_dir, 'state.json')) as f:
+            state = json.load(f)
+        job = cls(job_dir, state['input_path'], state['concurrency'], state['max_retries'])
+        for key in ('status', 'created_at', 'started_at', 'finished_at', 'error', 'total', 'succeeded', 'failed',
+                    'prompt_tokens', 'completion_tokens', 'checkpoint'):
+            setattr(job, key, state[key])
+        return job
+
+    def record_completion(self, tokens: int):
+        now = time.time()
+        self._recent.append((now, tokens))
+        while self._recent and self._recent[0][0] < now - RATE_WINDOW:
+            self._recent.popleft()
+
+    def to_dict(self) -> Dict:
+        done = self.succeeded + self.failed
+        requests_per_second = tokens_per_second = eta = None
+        if self.status == 'running' and len(self._recent) > 1:
+            span = max(self._recent[-1][0] - self._recent[0][0], 1e-6)
+            requests_per_second = (len(self._recent) - 1) / span
+            tokens_per_second = sum(tokens for _, tokens in list(self._recent)[1:]) / span
+            if self.total is not None:
+                eta = (self.total - done) / requests_per_second
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'input_path': self.input_path,
+            'concurrency': self.concurrency,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'progress': {
+                'total': self.total,
+                'succeeded': self.succeeded,
+                'failed': self.failed,
+                'percent': round(100.0 * done / self.total, 2) if self.total else None,
+                'requests_per_second': requests_per_second,
+                'tokens_per_second': tokens_per_second,
+                'eta_seconds': eta
+            },
+            'usage': {'prompt_tokens': self.prompt_tokens, 'completion_tokens': self.completion_tokens}
+        }
+
+
+class BatchJobManager:
+    def __init__(self, jobs_dir: str, get_pool: Callable, get_admission: Callable,
+                 checkpoint_interval: float = 2.0, read_timeout: float = 600.0):
+        """
+        get_pool and get_admission return the app's current BackendPool and
+        AdmissionController. Jobs run one at a time on a dedicated event loop.
+        """
+        self.jobs_dir = jobs_dir
+        self.get_pool = get_pool
+        self.get_admission = get_admission
+        self.checkpoint_interval = checkpoint_interval
+        self.read_timeout = read_timeout
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._run_lock = None
+        os.makedirs(jobs_dir, exist_ok=True)
+        for name in sorted(os.listdir(jobs_dir)):
+            if os.path.exists(os.path.join(jobs_dir, name, 'state.json')):
+                job = BatchJob.load(os.path.join(jobs_dir, name))
+                self._jobs[job.id] = job
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            # One job at a time; two would only split the same engine between them
+            self._run_lock = asyncio.Lock()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='batch-jobs', daemon=True)
+            self._thread.start()
+
+    def create(self, input_path: str = None, concurrency: int = 32, max_retries: int = 3,
+               upload=None) -> BatchJob:
+        """Create and start a job from a file on this host, or from an uploaded file object"""
+        job_dir = os.path.join(self.jobs_dir, datetime.now().strftime('%Y%m%d%H%M%S-') + uuid.uuid4().hex[:8])
+        os.makedirs(job_dir)
+        if upload is not None:
+            input_path = os.path.join(job_dir, 'input.jsonl')
+            upload.save(input_path)
+        elif not input_path or not os.path.isfile(input_path):
+            os.rmdir(job_dir)
+            raise FileNotFoundError(f'Input file not found: {input_path}')
+
+        job = BatchJob(job_dir, os.path.abspath(input_path), max(1, int(concurrency)), int(max_retries))
+        open(job.output_path, 'wb').close()
+        job.save()
+        with self._lock:
+            self._jobs[job.id] = job
+        self.start(job.id)
+        return job
+
+    def get(self, job_id: str) -> BatchJob:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        return [job.to_dict() for job in reversed(list(self._jobs.values()))]
+
+    def start(self, job_id: str) -> BatchJob:
+        """Queue a new, paused or interrupted job to run from its checkpoint"""
+        job = self._jobs[job_id]
+        if job.status == 'completed':
+            return job
+        job.stop_requested = False
+        if job.active:
+            return job
+        # Held from here until the job stops, so no other process can write its output or state.json
+        lock = lock_job_dir(job.dir)
+        if lock is None:
+            raise RuntimeError(f'Batch job {job_id} is running in another process')
+        job.active = True
+        job.status = 'queued'
+        job.save()
+        self._ensure_loop()
+        asyncio.run_coroutine_threadsafe(self._run(job, lock), self._loop)
+        return job
+
+    def pause(self, job_id: str) -> BatchJob:
+        """Stop after the requests in flight finish; the job can be resumed with start()"""
+        job = self._jobs[job_id]
+        if not job.finished:
+            job.stop_requested = True
+            if job.status == 'queued':
+                job.status = 'paused'
+                job.save()
+        return job
+
+    def resume_interrupted(self):
+        """Restart jobs that were queued or running when the app went down"""
+        for job in list(self._jobs.values()):
+            if job.status in ('queued', 'running'):
+                try:
+                    self.start(job.id)
+                except RuntimeError:
+                    # Still running in another process, which owns its checkpoint
+                    pass
+
+    async def _run(self, job: BatchJob, lock):
+        try:
+            async with self._run_lock:
+                await self._run_job(job)
+        finally:
+            lock.close()
+            job.active = False
+
+    async def _run_job(self, job: BatchJob):
+        if job.stop_requested:
+            # Paused while waiting its turn
+            job.status = 'paused'
+            job.save()
+            return
+        job.status = 'running'
+        job.started_at = job.started_at or datetime.now().isoformat()
+        job.finished_at = None
+        job.error = None
+        try:
+            if job.total is None:
+                job.total = await asyncio.get_running_loop().run_in_executor(None, count_requests, job.input_path)
+            await self._process(job)
+            job.status = 'paused' if job.stop_requested else 'completed'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        if job.finished:
+            job.finished_at = datetime.now().isoformat()
+        job.save()
+
+    async def _process(self, job: BatchJob):
+        checkpoint = job.checkpoint
+        watermark = checkpoint['next_line']
+        done_above = set(checkpoint['done_above'])
+        # Input offset of every line read but not yet below the watermark
+        offsets = {}
+        read_state = {'index': watermark, 'offset': checkpoint['input_offset']}
+        queue = asyncio.Queue(maxsize=job.concurrency * 2)
+
+        output = open(job.output_path, 'r+b')
+        # Anything written after the last checkpoint is redone, so drop it
+        output.truncate(checkpoint['output_offset'])
+        output.seek(checkpoint['output_offset'])
+
+        def mark_done(index: int):
+            nonlocal watermark
+            done_above.add(index)
+            while watermark in done_above:
+                done_above.discard(watermark)
+                offsets.pop(watermark, None)
+                watermark += 1
+
+        def save_checkpoint():
+            output.flush()
+            os.fsync(output.fileno())
+            job.checkpoint = {
+                'next_line': watermark,
+                'input_offset': offsets.get(watermark, read_state['offset']),
+                'done_above': sorted(done_above),
+                'output_offset': output.tell()
+            }
+            job.save()
+
+        async def produce():
+            with open(job.input_path, 'rb') as f:
+                f.seek(read_state['offset'])
+                for line in f:
+                    if job.stop_requested:
+                        break
+                    index = read_state['index']
+                    offsets[index] = read_state['offset']
+                    read_state['index'] += 1
+                    read_state['offset'] += len(line)
+                    if index in done_above:
+                        continue
+                    if not line.strip():
+                        mark_done(index)
+                        continue
+                    await queue.put((index, line))
+            for _ in range(job.concurrency):
+                await queue.put(None)
+
+        async def work(session: aiohttp.ClientSession):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                if job.stop_requested:
+                    # Left below the watermark, so it is read again on resume
+                    continue
+                index, line = item
+                record, tokens = await self._execute(job, session, line)
+                output.write((json.dumps(record) + '\n').encode())
+                mark_done(index)
+                job.record_completion(tokens)
+
+        async def checkpoint_periodically():
+            while True:
+                await asyncio.sleep(self.checkpoint_interval)
+                save_checkpoint()
+
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=self.read_timeout)
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                checkpointer = asyncio.create_task(checkpoint_periodically())
+                try:
+                    await asyncio.gather(produce(), *(work(session) for _ in range(job.concurrency)))
+                finally:
+                    checkpointer.cancel()
+                    save_checkpoint()
+        finally:
+            output.close()
+
+    async def _execute(self, job: BatchJob, session: aiohttp.ClientSession, line: bytes):
+        """Run one input line and return its output record and token count"""
+        try:
+            request = json.loads(line)
+            custom_id = request.get('custom_id')
+            url, body = request['url'], dict(request['body'])
+            if request.get('method', 'POST') != 'POST' or not url.startswith('/v1/'):
+                raise ValueError(f'Unsupported request: {request.get("method")} {url}')
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            job.failed += 1
+            app_metrics.BATCH_REQUESTS.inc(outcome='invalid')
+            return self._record(None, None, error={'code': 'invalid_request', 'message': str(e)}), 0
+
+        # Results are written whole; streaming would only add overhead
+        body.pop('stream', None)
+        body.pop('stream_options', None)
+        pool = self.get_pool()
+        affinity_key = prefix_key(body) if pool.policy == 'prefix_affinity' else None
+        status, payload, error = None, None, None
+
+        attempts = 0
+        while attempts <= job.max_retries:
+            admission = self.get_admission()
+            try:
+                ticket = await admission.acquire_async('batch', estimate_prompt_tokens(body))
+            except AdmissionRejected as e:
+                # Interactive traffic has the engine; wait without spending an attempt
+                await asyncio.sleep(e.retry_after)
+                continue
+            attempts += 1
+            backend, failure = None, None
+            try:
+                backend = pool.acquire(affinity_key=affinity_key)
+                async with session.post(f'{backend.url}{url}', json=body) as response:
+                    status, payload = response.status, await response.read()
+                error = None
+            except NoHealthyBackendError as e:
+                status, error = None, {'code': 'no_backend', 'message': str(e)}
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failure = e
+                status, error = None, {'code': 'connection_error', 'message': str(e) or type(e).__name__}
+            finally:
+                if backend is not None:
+                    pool.release(backend, failure)
+                admission.release(ticket)
+            if status is not None and status not in RETRYABLE_STATUSES:
+                break
+            if attempts <= job.max_retries:
+                await asyncio.sleep(min(30.0, 2 ** attempts))
+
+        if status is None:
+            job.failed += 1
+            app_metrics.BATCH_REQUESTS.inc(outcome='error')
+            return self._record(custom_id, None, error=error or {'code': 'not_sent', 'message': 'Request not sent'}), 0
+
+        try:
+            response_body = json.loads(payload)
+        except ValueError:
+            response_body = {'error': {'message': payload.decode('utf-8', 'replace')}}
+        usage = (response_body.get('usage') or {}) if isinstance(response_body, dict) else {}
+        if status == 200:
+            job.succeeded += 1
+            job.prompt_tokens += usage.get('prompt_tokens', 0)
+            job.completion_tokens += usage.get('completion_tokens', 0)
+            app_metrics.BATCH_REQUESTS.inc(outcome='succeeded')
+        else:
+            job.failed += 1
+            app_metrics.BATCH_REQUESTS.inc(outcome='failed')
+        request_id = response_body.get('id') if isinstance(response_body, dict) else None
+        return self._record(custom_id, {'status_code': status, 'request_id': request_id, 'body': response_body}), \
+            usage.get('completion_tokens', 0)
+
+    @staticmethod
+    def _record(custom_id, response, error=None) -> Dict:
+        return {'id': f'batch_req_{uuid.uuid4().hex}', 'custom_id': custom_id, 'response': response, 'error': error}
+
+
+def count_requests(path: str) -> int:
+    """Non-blank lines in a JSONL file"""
+    with open(path, 'rb') as f:
+        return sum(1 for line in f if line.strip())
@@ -4,20 +4,162 @@ Benchmarking utilities for vLLM model testing
 import time
 import asyncio
 import aiohttp
-import numpy as np
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, Callable
 import json
 import random
-from concurrent.futures import ThreadPoolExecutor
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import math
 import requests
 from datetime import datetime
+import argparse
+from histogram import LatencyHistogram
+from vllm_metrics import MetricsSampler, diagnose_saturation
+
+# Below this many clients per process a single event loop keeps up fine and
+# the cost of shipping work to another process is not worth it
+MIN_CLIENTS_PER_WORKER = 16
+
+# Latency targets (seconds) a request must meet to count towards goodput.
+# ttft and tpot only apply to streamed requests, where they can be measured.
+DEFAULT_SLO = {
+    "ttft": 2.0,   # time to first token, reported against the p95
+    "tpot": 0.1,   # time per output token after the first
+    "e2e": 30.0    # end-to-end request latency, reported against the p99
+}
+
+# Client-side timeout (seconds) for a single request. Kept well above the e2e
+# target so slow requests are recorded as SLO misses rather than errors.
+REQUEST_TIMEOUT = 120
+
+# Conservative throughput floor used to scale length_sweep timeouts to each
+# cell, so long prompts on slow hardware time out only when truly stuck
+SWEEP_PREFILL_TOKENS_PER_SECOND = 500
+SWEEP_DECODE_TOKENS_PER_SECOND = 5
+
+# Common words that BPE tokenizers encode as one token each (with the leading
+# space), so a run of N of them is close to N prompt tokens
+FILLER_WORDS = [
+    "the", "of", "and", "to", "in", "is", "that", "for", "it", "as", "was", "with", "be", "by", "on",
+    "not", "he", "this", "are", "or", "his", "from", "at", "which", "but", "have", "an", "had", "they",
+    "you", "were", "their", "one", "all", "we", "can", "her", "has", "there", "been", "if", "more",
+    "when", "will", "would", "who", "so", "no", "time", "data", "system", "model", "report", "value",
+    "market", "water", "light", "world", "house", "group", "number", "state", "order", "point", "city"
+]
+
+class RequestStats:
+    """Fixed-memory aggregate of single_request results.
+    
+    Keeps counters and latency histograms instead of per-request dicts, so
+    long runs do not grow memory and stats from several clients, workers or
+    runs can be merged. Requests that succeed and meet every SLO target are
+    counted separately as good requests.
+    """
+    def __init__(self, slo: Dict = None):
+        self.slo = dict(DEFAULT_SLO, **(slo or {}))
+        self.total_requests = 0
+        self.successful_requests = 0
+        self.timed_out_requests = 0
+        self.good_requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.latency = LatencyHistogram()
+        self.first_byte_time = LatencyHistogram()
+        self.time_to_first_token = LatencyHistogram()
+        self.time_per_output_token = LatencyHistogram()
+        self.inter_token_latency = LatencyHistogram()
+        self.tokens_per_second = LatencyHistogram(min_value=0.01, max_value=1e6)
+    
+    def record(self, result: Dict):
+        self.total_requests += 1
+        if not result.get("success"):
+            if result.get("timed_out"):
+                self.timed_out_requests += 1
+            return
+        self.successful_requests += 1
+        self.prompt_tokens += result["prompt_tokens"]
+        self.completion_tokens += result["completion_tokens"]
+        self.total_tokens += result["total_tokens"]
+        self.latency.record(result["total_time"])
+        self.first_byte_time.record(result["first_byte_time"])
+        self.tokens_per_second.record(result["tokens_per_second"])
+        if "time_to_first_token" in result:
+            self.time_to_first_token.record(result["time_to_first_token"])
+            self.time_per_output_token.record(result["time_per_output_token"])
+            self.inter_token_latency.record_many(result["inter_token_latencies"])
+        if self.meets_slo(result):
+            self.good_requests += 1
+    
+    def meets_slo(self, result: Dict) -> bool:
+        """True if a successful result met every SLO target that applies to it"""
+        if result["total_time"] > self.slo["e2e"]:
+            return False
+        if "time_to_first_token" in result:
+            if result["time_to_first_token"] > self.slo["ttft"]:
+                return False
+            if result["time_per_output_token"] > self.slo["tpot"]:
+                return False
+        return True
+    
+    def merge(self, other: "RequestStats") -> "RequestStats":
+        self.total_requests += other.total_requests
+        self.successful_requests += other.successful_requests
+        self.timed_out_requests += other.timed_out_requests
+        self.good_requests += other.good_requests
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.total_tokens += other.total_tokens
+        for name in ("latency", "first_byte_time", "time_to_first_token", "time_per_output_token",
+                     "inter_token_latency", "tokens_per_second"):
+            getattr(self, name).merge(getattr(other, name))
+        return self
+    
+    @property
+    def failed_requests(self) -> int:
+        return self.total_requests - self.successful_requests
+    
+    @property
+    def success_rate(self) -> float:
+        return self.successful_requests / self.total_requests * 100 if self.total_requests else 0
+    
+    def goodput_summary(self, duration: float) -> Dict:
+        """Goodput (requests/s meeting every SLO) and how the latency tails compare to the targets"""
+        slo_met = {"e2e_p99": self.latency.percentile(99) <= self.slo["e2e"]}
+        # Token-level targets are only judged when streamed requests measured them
+        if self.time_to_first_token.count:
+            slo_met["ttft_p95"] = self.time_to_first_token.percentile(95) <= self.slo["ttft"]
+            slo_met["tpot_p95"] = self.time_per_output_token.percentile(95) <= self.slo["tpot"]
+        
+        return {
+            "goodput": self.good_requests / duration if duration > 0 else 0,
+            "good_requests": self.good_requests,
+            "slo_attainment": self.good_requests / self.total_requests * 100 if self.total_requests else 0,
+            "slo": self.slo,
+            "slo_met": slo_met
+        }
 
 class ModelBenchmark:
-    def __init__(self, base_url: str, model_name: str):
+    def __init__(self, base_url: str, model_name: str, num_workers: int = 1,
+                 progress: Callable[[str, Dict], None] = None, slo: Dict = None):
         self.base_url = base_url
         self.model_name = model_name
         self.chat_endpoint = f"{base_url}/v1/chat/completions"
         
+        # Latency targets for goodput; missing keys fall back to DEFAULT_SLO
+        self.slo = dict(DEFAULT_SLO, **(slo or {}))
+        
+        # Server /metrics sampler running alongside the current test, if any
+        self.metrics_sampler = None
+        
+        # Optional callback receiving (event, data) as multi-step tests advance
+        self.progress = progress
+        
+        # Worker processes used to shard high-concurrency client load
+        self.num_workers = max(1, num_workers)
+        self._process_pool = None
+        
         # Test prompts of varying lengths - base templates
         self.test_prompts = {
             "short": [
@@ -54,6 +196,45 @@ class ModelBenchmark:
             "fields": ["medicine", "education", "technology", "agriculture", "finance", "transportation"]
         }
     
+    def report_progress(self, event: str, data: Dict):
+        """Forward a progress event to the registered callback, if any"""
+        if self.progress is not None:
+            self.progress(event, data)
+    
+    @staticmethod
+    def synthetic_text(num_tokens: int, rng: random.Random = None) -> str:
+        """Filler text of roughly num_tokens tokens"""
+        rng = rng or random
+        return " ".join(rng.choice(FILLER_WORDS) for _ in range(num_tokens))
+    
+    def build_prefix_workload(self, num_requests: int, prefix_tokens: int = 1024, share_ratio: float = 0.8,
+                              num_prefixes: int = 4, seed: int = None) -> List[Dict]:
+        """Chat requests whose system prompts repeat, like long system prompts or shared RAG context.
+        
+        share_ratio of the requests reuse one of num_prefixes shared system prompts
+        of about prefix_tokens tokens; the rest get a unique one of the same length.
+        The user turn is always unique.
+        """
+        rng = random.Random(seed)
+        shared_prefixes = [self.synthetic_text(prefix_tokens, rng) for _ in range(num_prefixes)]
+        
+        workload = []
+        for _ in range(num_requests):
+            if num_prefixes and rng.random() < share_ratio:
+                prefix_id = rng.randrange(num_prefixes)
+                system_prompt = shared_prefixes[prefix_id]
+            else:
+                prefix_id = None
+                system_prompt = self.synthetic_text(prefix_tokens, rng)
+            workload.append({
+                "prefix_id": prefix_id,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": self.generate_unique_prompt(rng.choice(["short", "medium"]))}
+                ]
+            })
+        return workload
+    
     def generate_unique_prompt(self, prompt_type: str) -> str:
         """Generate a unique prompt by filling in template with random values"""
         templates = self.test_prompts[prompt_type]
@@ -106,24 +287,40 @@ class ModelBenchmark:
             else:
                 return template.format(concept1)
     
-    async def single_request(self, session: aiohttp.ClientSession, prompt: str, max_tokens: int = 256) -> Dict:
-        """Execute a single request and measure metrics"""
+    async def single_request(self, session: aiohttp.ClientSession, prompt: str, max_tokens: int = 256,
+                             stream: bool = False, messages: List[Dict] = None,
+                             temperature: float = 0.7, extra_body: Dict = None,
+                             timeout: float = REQUEST_TIMEOUT) -> Dict:
+        """Execute a single request and measure metrics
+        
+        extra_body is merged into the payload for vLLM-specific sampling
+        parameters such as ignore_eos.
+        """
         start_time = time.time()
-        first_token_time = None
         
         payload = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7,
+            "messages": messages or [{"role": "user", "content": prompt}],
+            "temperature": temperature,
             "max_tokens": max_tokens,
-            "stream": False
+            "stream": stream
         }
+        if stream:
+            # Ask vLLM to append a final usage chunk so token counts are exact
+            payload["stream_options"] = {"include_usage": True}
+        if extra_body:
+            payload.update(extra_body)
         
         try:
             # Add timeout to prevent hanging requests
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with session.post(self.chat_endpoint, json=payload, timeout=timeout) as response:
+            client_timeout = aiohttp.ClientTimeout(total=timeout)
+            async with session.post(self.chat_endpoint, json=payload, timeout=client_timeout) as response:
                 first_byte_time = time.time() - start_time
+                if stream:
+                    if response.status != 200:
+                        return {"success": False, "error": f"Status {response.status}"}
+                    return await self._read_stream(response, start_time, first_byte_time)
+                
                 result = await response.json()
                 total_time = time.time() - start_time
                 
@@ -140,115 +337,233 @@ class ModelBenchmark:
                     }
                 else:
                     return {"success": False, "error": f"Status {response.status}"}
+        except asyncio.TimeoutError:
+            return {"success": False, "error": f"Timed out after {timeout:g}s", "timed_out": True}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    async def _read_stream(self, response: aiohttp.ClientResponse, start_time: float,
+                           first_byte_time: float) -> Dict:
+        """Consume an SSE chat completion stream, timing every content chunk"""
+        first_token_time = None
+        last_token_time = None
+        inter_token_latencies = []
+        content_chunks = 0
+        usage = {}
+        
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            
+            chunk = json.loads(data)
+            if chunk.get('usage'):
+                usage = chunk['usage']
+            choices = chunk.get('choices') or []
+            if not choices or not choices[0].get('delta', {}).get('content'):
+                continue
+            
+            now = time.time()
+            if first_token_time is None:
+                first_token_time = now - start_time
+            else:
+                inter_token_latencies.append(now - last_token_time)
+            last_token_time = now
+            content_chunks += 1
+        
+        total_time = time.time() - start_time
+        if first_token_time is None:
+            return {"success": False, "error": "Stream ended without any tokens"}
+        
+        # Fall back to counting chunks if the server did not report usage
+        completion_tokens = usage.get('completion_tokens', content_chunks)
+        prompt_tokens = usage.get('prompt_tokens', 0)
+        decode_time = total_time - first_token_time
+        
+        return {
+            "success": True,
+            "total_time": total_time,
+            "first_byte_time": first_byte_time,
+            "time_to_first_token": first_token_time,
+            "inter_token_latencies": inter_token_latencies,
+            "time_per_output_token": decode_time / (completion_tokens - 1) if completion_tokens > 1 else 0,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": usage.get('total_tokens', prompt_tokens + completion_tokens),
+            "tokens_per_second": completion_tokens / total_time if total_time > 0 else 0
+        }
+    
     async def latency_test(self, num_requests: int = 10) -> Dict:
         """Test latency with sequential requests"""
-        results = []
+        start_time = time.time()
+        stats = RequestStats(self.slo)
         async with aiohttp.ClientSession() as session:
             for i in range(num_requests):
                 # Use different prompt lengths with unique content
                 prompt_type = ["short", "medium", "long"][i % 3]
                 prompt = self.generate_unique_prompt(prompt_type)
                 
-                result = await self.single_request(session, prompt)
-                if result["success"]:
-                    results.append(result)
+                stats.record(await self.single_request(session, prompt))
                 
                 # Small delay between requests
                 await asyncio.sleep(0.1)
         
-        if not results:
+        if not stats.successful_requests:
             return {"error": "No successful requests"}
         
-        latencies = [r["total_time"] for r in results]
-        first_byte_times = [r["first_byte_time"] for r in results]
-        tokens_per_sec = [r["tokens_per_second"] for r in results]
+        first_byte = stats.first_byte_time.summary()
         
         return {
             "test_type": "latency",
-            "num_requests": len(results),
-            "success_rate": len(results) / num_requests * 100,
-            "latency": {
-                "mean": np.mean(latencies),
-                "median": np.median(latencies),
-                "p95": np.percentile(latencies, 95),
-                "p99": np.percentile(latencies, 99),
-                "min": np.min(latencies),
-                "max": np.max(latencies)
-            },
+            "num_requests": stats.successful_requests,
+            "success_rate": stats.success_rate,
+            "latency": stats.latency.summary(),
             "time_to_first_byte": {
-                "mean": np.mean(first_byte_times),
-                "median": np.median(first_byte_times)
+                "mean": first_byte["mean"],
+                "median": first_byte["median"]
             },
             "throughput": {
-                "mean_tokens_per_second": np.mean(tokens_per_sec),
-                "max_tokens_per_second": np.max(tokens_per_sec),
-                "total_tokens": sum(r["total_tokens"] for r in results),
-                "prompt_tokens": sum(r["prompt_tokens"] for r in results),
-                "completion_tokens": sum(r["completion_tokens"] for r in results)
-            }
+                "mean_tokens_per_second": stats.tokens_per_second.mean,
+                "max_tokens_per_second": stats.tokens_per_second.max,
+                "total_tokens": stats.total_tokens,
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens
+            },
+            **stats.goodput_summary(time.time() - start_time)
         }
     
-    async def concurrent_test(self, num_concurrent: int = 5, requests_per_client: int = 3) -> Dict:
-        """Test concurrent request handling"""
+    async def run_clients(self, num_clients: int, requests_per_client: int, stream: bool = False) -> Dict:
+        """Run closed-loop clients on this event loop, sharing one pooled session"""
         start_time = time.time()
         
-        async def client_task(client_id: int):
-            results = []
-            async with aiohttp.ClientSession() as session:
-                for i in range(requests_per_client):
-                    prompt_type = ["short", "medium", "long"][i % 3]
-                    prompt = self.generate_unique_prompt(prompt_type)
-                    result = await self.single_request(session, prompt)
-                    results.append(result)
-            return results
+        stats = RequestStats(self.slo)
         
-        # Launch concurrent clients
-        tasks = [client_task(i) for i in range(num_concurrent)]
-        all_results = await asyncio.gather(*tasks)
+        async def client_task(session: aiohttp.ClientSession):
+            for i in range(requests_per_client):
+                prompt_type = ["short", "medium", "long"][i % 3]
+                prompt = self.generate_unique_prompt(prompt_type)
+                stats.record(await self.single_request(session, prompt, stream=stream))
         
-        total_time = time.time() - start_time
+        connector = aiohttp.TCPConnector(limit=num_clients)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*[client_task(session) for _ in range(num_clients)])
+        
+        return {
+            "stats": stats,
+            "start_time": start_time,
+            "end_time": time.time()
+        }
+    
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # spawn rather than fork: the Flask app is multi-threaded
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.num_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._process_pool
+    
+    def close(self):
+        """Shut down worker processes started for sharded load"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=True)
+            self._process_pool = None
+    
+    async def _run_sharded_clients(self, num_clients: int, requests_per_client: int,
+                                   stream: bool = False) -> Dict:
+        """Split clients across worker processes and merge their results"""
+        num_shards = min(self.num_workers, math.ceil(num_clients / MIN_CLIENTS_PER_WORKER))
+        if num_shards <= 1:
+            return await self.run_clients(num_clients, requests_per_client, stream)
         
-        # Flatten results
-        flat_results = [r for client_results in all_results for r in client_results]
-        successful = [r for r in flat_results if r.get("success")]
+        # Spread clients as evenly as possible across shards
+        shard_sizes = [num_clients // num_shards + (1 if i < num_clients % num_shards else 0)
+                       for i in range(num_shards)]
+        
+        loop = asyncio.get_running_loop()
+        pool = self._get_process_pool()
+        shards = await asyncio.gather(*[
+            loop.run_in_executor(pool, _run_client_shard, self.base_url, self.model_name,
+                                 size, requests_per_client, self.slo, stream)
+            for size in shard_sizes
+        ])
+        
+        # Time the test from the first shard starting to the last one finishing,
+        # so worker start-up is not counted against the server
+        stats = RequestStats(self.slo)
+        for shard in shards:
+            stats.merge(shard["stats"])
+        
+        return {
+            "stats": stats,
+            "start_time": min(shard["start_time"] for shard in shards),
+            "end_time": max(shard["end_time"] for shard in shards),
+            "num_shards": num_shards
+        }
+    
+    async def concurrent_test(self, num_concurrent: int = 5, requests_per_client: int = 3,
+                              stream: bool = False) -> Dict:
+        """Test concurrent request handling
         
-        if not successful:
+        With stream=True the requests are streamed, so TTFT and TPOT are
+        measured and judged against the SLO as well as end-to-end latency.
+        """
+        if self.num_workers > 1:
+            run = await self._run_sharded_clients(num_concurrent, requests_per_client, stream)
+        else:
+            run = await self.run_clients(num_concurrent, requests_per_client, stream)
+        
+        total_time = run["end_time"] - run["start_time"]
+        
+        stats = run["stats"]
+        
+        if not stats.successful_requests:
             return {"error": "No successful requests"}
         
-        latencies = [r["total_time"] for r in successful]
-        tokens_per_sec = [r["tokens_per_second"] for r in successful]
+        latency = stats.latency.summary()
         
         return {
             "test_type": "concurrent",
             "num_concurrent_clients": num_concurrent,
             "requests_per_client": requests_per_client,
+            "worker_processes": run.get("num_shards", 1),
             "total_requests": num_concurrent * requests_per_client,
-            "successful_requests": len(successful),
-            "success_rate": len(successful) / len(flat_results) * 100,
+            "successful_requests": stats.successful_requests,
+            "success_rate": stats.success_rate,
             "total_test_time": total_time,
-            "requests_per_second": len(successful) / total_time,
+            "requests_per_second": stats.successful_requests / total_time,
             "latency_under_load": {
-                "mean": np.mean(latencies),
-                "median": np.median(latencies),
-                "p95": np.percentile(latencies, 95),
-                "p99": np.percentile(latencies, 99)
+                "mean": latency["mean"],
+                "median": latency["median"],
+                "p95": latency["p95"],
+                "p99": latency["p99"],
+                "p999": latency["p999"]
             },
             "throughput_under_load": {
-                "mean_tokens_per_second": np.mean(tokens_per_sec),
-                "aggregate_tokens_per_second": sum(tokens_per_sec),
-                "total_tokens_processed": sum(r["total_tokens"] for r in successful)
-            }
+                "mean_tokens_per_second": stats.tokens_per_second.mean,
+                "aggregate_tokens_per_second": stats.tokens_per_second.sum,
+                "total_tokens_processed": stats.total_tokens
+            },
+            **self._token_latency_summary(stats),
+            **stats.goodput_summary(total_time)
+        }
+    
+    @staticmethod
+    def _token_latency_summary(stats: RequestStats) -> Dict:
+        """TTFT/TPOT percentiles, when streamed requests measured them"""
+        if not stats.time_to_first_token.count:
+            return {}
+        return {
+            "time_to_first_token": stats.time_to_first_token.summary(),
+            "time_per_output_token": stats.time_per_output_token.summary()
         }
     
     async def throughput_test(self, duration_seconds: int = 30) -> Dict:
         """Test maximum throughput over a time period"""
         start_time = time.time()
         end_time = start_time + duration_seconds
-        results = []
-        request_count = 0
+        stats = RequestStats(self.slo)
         
         async with aiohttp.ClientSession() as session:
             while time.time() < end_time:
@@ -260,32 +575,547 @@ class ModelBenchmark:
                     prompt = self.generate_unique_prompt(prompt_type)
                     tasks.append(self.single_request(session, prompt, max_tokens=128))
                 
-                batch_results = await asyncio.gather(*tasks)
-                results.extend(batch_results)
-                request_count += batch_size
+                for result in await asyncio.gather(*tasks):
+                    stats.record(result)
                 
                 # Brief pause to avoid overwhelming
                 await asyncio.sleep(0.5)
         
         actual_duration = time.time() - start_time
-        successful = [r for r in results if r.get("success")]
         
-        if not successful:
+        if not stats.successful_requests:
             return {"error": "No successful requests"}
         
-        total_tokens = sum(r["total_tokens"] for r in successful)
-        completion_tokens = sum(r["completion_tokens"] for r in successful)
-        
         return {
             "test_type": "throughput",
             "test_duration": actual_duration,
+            "total_requests": stats.total_requests,
+            "successful_requests": stats.successful_requests,
+            "success_rate": stats.success_rate,
+            "requests_per_second": stats.successful_requests / actual_duration,
+            "tokens_per_second": stats.completion_tokens / actual_duration,
+            "total_tokens_processed": stats.total_tokens,
+            "average_tokens_per_request": stats.total_tokens / stats.successful_requests,
+            "latency": stats.latency.summary(),
+            **stats.goodput_summary(actual_duration)
+        }
+    
+    async def streaming_test(self, num_requests: int = 20, num_concurrent: int = 4) -> Dict:
+        """Measure TTFT, inter-token latency and time per output token over SSE streams"""
+        start_time = time.time()
+        queue = asyncio.Queue()
+        for i in range(num_requests):
+            queue.put_nowait(["short", "medium", "long"][i % 3])
+        
+        stats = RequestStats(self.slo)
+        
+        async def client_task(session: aiohttp.ClientSession):
+            while not queue.empty():
+                prompt = self.generate_unique_prompt(queue.get_nowait())
+                stats.record(await self.single_request(session, prompt, stream=True))
+        
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*[client_task(session) for _ in range(num_concurrent)])
+        
+        total_time = time.time() - start_time
+        
+        if not stats.successful_requests:
+            return {"error": "No successful requests"}
+        
+        return {
+            "test_type": "streaming",
+            "num_concurrent_clients": num_concurrent,
+            "total_requests": num_requests,
+            "successful_requests": stats.successful_requests,
+            "success_rate": stats.success_rate,
+            "total_test_time": total_time,
+            "requests_per_second": stats.successful_requests / total_time,
+            "latency": stats.latency.summary(),
+            "time_to_first_token": stats.time_to_first_token.summary(),
+            "inter_token_latency": stats.inter_token_latency.summary(),
+            "time_per_output_token": stats.time_per_output_token.summary(),
+            "throughput": {
+                "mean_tokens_per_second": stats.tokens_per_second.mean,
+                "aggregate_tokens_per_second": stats.completion_tokens / total_time,
+                "completion_tokens": stats.completion_tokens
+            },
+            **stats.goodput_summary(total_time)
+        }
+    
+    async def _run_prefix_workload(self, workload: List[Dict], num_concurrent: int, max_tokens: int) -> Dict:
+        """Stream a prefix workload through num_concurrent clients, tracking shared-prefix requests separately"""
+        start_time = time.time()
+        queue = asyncio.Queue()
+        for entry in workload:
+            queue.put_nowait(entry)
+        
+        stats = RequestStats(self.slo)
+        shared_stats = RequestStats(self.slo)
+        
+        async def client_task(session: aiohttp.ClientSession):
+            while not queue.empty():
+                entry = queue.get_nowait()
+                result = await self.single_request(session, None, max_tokens=max_tokens, stream=True,
+                                                   messages=entry["messages"])
+                stats.record(result)
+                if entry["prefix_id"] is not None:
+                    shared_stats.record(result)
+        
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*[client_task(session) for _ in range(num_concurrent)])
+        
+        total_time = time.time() - start_time
+        return {
+            "successful_requests": stats.successful_requests,
+            "success_rate": stats.success_rate,
+            "total_test_time": total_time,
+            "requests_per_second": stats.successful_requests / total_time,
+            "tokens_per_second": stats.completion_tokens / total_time,
+            "mean_prompt_tokens": stats.prompt_tokens / stats.successful_requests if stats.successful_requests else 0,
+            "time_to_first_token": stats.time_to_first_token.summary(),
+            "shared_prefix_ttft": shared_stats.time_to_first_token.summary(),
+            "latency": stats.latency.summary(),
+            **stats.goodput_summary(total_time)
+        }
+    
+    async def prefix_cache_test(self, num_requests: int = 40, num_concurrent: int = 4, prefix_tokens: int = 1024,
+                                share_ratio: float = 0.8, num_prefixes: int = 4, max_tokens: int = 64,
+                                prefix_caching_enabled: bool = None) -> Dict:
+        """Measure what prefix caching buys on a workload with shared system prompts.
+        
+        The workload runs twice against the same server: once as built, and once
+        with a unique nonce at the start of every system prompt so no request can
+        reuse a cached prefix. The second pass costs what the workload would with
+        caching off, without restarting vLLM.
+        """
+        workload = self.build_prefix_workload(num_requests, prefix_tokens, share_ratio, num_prefixes)
+        busted = [
+            dict(entry, messages=[
+                {"role": "system", "content": f"[{uuid.uuid4().hex}] {entry['messages'][0]['content']}"},
+                entry["messages"][1]
+            ])
+            for entry in workload
+        ]
+        
+        # Cache-busted pass first so it cannot pick up blocks the shared pass leaves behind
+        print("Running prefix workload with cache reuse defeated...")
+        cache_off = await self._run_prefix_workload(busted, num_concurrent, max_tokens)
+        self.report_progress("prefix_cache_pass", {"pass": "cache_off", "tokens_per_second": cache_off["tokens_per_second"]})
+        await asyncio.sleep(1)
+        print("Running prefix workload with shared prefixes...")
+        cache_on = await self._run_prefix_workload(workload, num_concurrent, max_tokens)
+        self.report_progress("prefix_cache_pass", {"pass": "cache_on", "tokens_per_second": cache_on["tokens_per_second"]})
+        
+        if not cache_on["successful_requests"] or not cache_off["successful_requests"]:
+            return {"error": "No successful requests"}
+        
+        def change_pct(before: float, after: float) -> float:
+            return (after - before) / before * 100 if before else 0.0
+        
+        ttft_median_delta = change_pct(cache_off["time_to_first_token"]["median"], cache_on["time_to_first_token"]["median"])
+        
+        return {
+            "test_type": "prefix_cache",
+            "workload": {
+                "num_requests": num_requests,
+                "num_concurrent_clients": num_concurrent,
+                "prefix_tokens": prefix_tokens,
+                "share_ratio": share_ratio,
+                "num_prefixes": num_prefixes,
+                "max_tokens": max_tokens
+            },
+            "prefix_caching_enabled": prefix_caching_enabled,
+            "cache_off": cache_off,
+            "cache_on": cache_on,
+            "ttft_median_delta_pct": ttft_median_delta,
+            "ttft_p95_delta_pct": change_pct(cache_off["time_to_first_token"]["p95"], cache_on["time_to_first_token"]["p95"]),
+            "shared_prefix_ttft_median_delta_pct": change_pct(cache_off["shared_prefix_ttft"]["median"],
+                                                             cache_on["shared_prefix_ttft"]["median"]),
+            "throughput_delta_pct": change_pct(cache_off["tokens_per_second"], cache_on["tokens_per_second"]),
+            # A cache that is off or too small to hold the prefixes shows no TTFT gain
+            "cache_effective": ttft_median_delta < -10,
+            "goodput": cache_on["goodput"],
+            "slo_attainment": cache_on["slo_attainment"],
+            "slo": cache_on["slo"],
+            "slo_met": cache_on["slo_met"]
+        }
+    
+    async def _count_prompt_tokens(self, session: aiohttp.ClientSession, messages: List[Dict]) -> int:
+        """Exact prompt token count, via vLLM's /tokenize or else a one-token completion's usage"""
+        try:
+            async with session.post(f"{self.base_url}/tokenize",
+                                    json={"model": self.model_name, "messages": messages}) as response:
+                if response.status == 200:
+                    return (await response.json())["count"]
+        except aiohttp.ClientError:
+            pass
+        result = await self.single_request(session, None, max_tokens=1, messages=messages)
+        if not result.get("success") or not result["prompt_tokens"]:
+            raise RuntimeError(f"Could not count prompt tokens: {result.get('error', 'no usage reported')}")
+        return result["prompt_tokens"]
+    
+    async def fit_prompt(self, session: aiohttp.ClientSession, target_tokens: int,
+                         max_attempts: int = 4) -> Dict:
+        """Build a single-turn prompt whose chat-templated length is target_tokens.
+        
+        Filler words are roughly one token each, so a few rounds of adding or
+        trimming words against the real tokenizer converge on the target.
+        Returns {"messages", "prompt_tokens"} with the closest length reached.
+        """
+        # A leading nonce keeps prompts of equal length from sharing cached prefixes
+        nonce = uuid.uuid4().hex[:8]
+        words = self.synthetic_text(target_tokens).split()
+        best = None
+        for _ in range(max_attempts):
+            messages = [{"role": "user", "content": f"{nonce} " + " ".join(words)}]
+            count = await self._count_prompt_tokens(session, messages)
+            if best is None or abs(count - target_tokens) < abs(best["prompt_tokens"] - target_tokens):
+                best = {"messages": messages, "prompt_tokens": count}
+            difference = target_tokens - count
+            if difference == 0:
+                break
+            if difference > 0:
+                words.extend(self.synthetic_text(difference).split())
+            else:
+                del words[max(1, len(words) + difference):]
+        return best
+    
+    async def _get_max_model_len(self, session: aiohttp.ClientSession) -> int:
+        """Context length vLLM reports for the served model, if any"""
+        try:
+            async with session.get(f"{self.base_url}/v1/models") as response:
+                for model in (await response.json()).get("data", []):
+                    if model.get("id") == self.model_name and model.get("max_model_len"):
+                        return model["max_model_len"]
+        except (aiohttp.ClientError, ValueError):
+            pass
+        return None
+    
+    @staticmethod
+    def sweep_timeout(input_length: int, output_length: int) -> float:
+        """Client timeout for one length_sweep request, scaled to its prompt and output length"""
+        return (REQUEST_TIMEOUT + input_length / SWEEP_PREFILL_TOKENS_PER_SECOND
+                + output_length / SWEEP_DECODE_TOKENS_PER_SECOND)
+    
+    async def length_sweep_test(self, input_lengths: List[int] = None, output_lengths: List[int] = None,
+                                requests_per_cell: int = 3, max_model_len: int = None,
+                                request_timeout: float = None) -> Dict:
+        """Measure prefill and decode speed over a grid of exact input x output lengths.
+        
+        Requests in a cell run one at a time so each sees an otherwise idle
+        server; ignore_eos pins the output length. Cells that do not fit in
+        max_model_len are left empty. Per-metric matrices are indexed
+        [input_length][output_length] for rendering as heatmaps.
+        
+        Each request's timeout is request_timeout if given, otherwise scaled
+        to the cell by sweep_timeout(). Timeouts are counted apart from other
+        errors so a slow cell is not mistaken for a failing one.
+        """
+        input_lengths = sorted(input_lengths or [128, 512, 2048, 8192, 32768])
+        output_lengths = sorted(output_lengths or [32, 128, 512])
+        
+        start_time = time.time()
+        stats = RequestStats(self.slo)
+        cells = [[None] * len(output_lengths) for _ in input_lengths]
+        
+        async with aiohttp.ClientSession() as session:
+            max_model_len = max_model_len or await self._get_max_model_len(session)
+            
+            for i, input_length in enumerate(input_lengths):
+                for j, output_length in enumerate(output_lengths):
+                    if max_model_len and input_length + output_length > max_model_len:
+                        continue
+                    print(f"Testing {input_length} input x {output_length} output tokens...")
+                    timeout = request_timeout or self.sweep_timeout(input_length, output_length)
+                    
+                    cell_stats = RequestStats(self.slo)
+                    for _ in range(requests_per_cell):
+                        prompt = await self.fit_prompt(session, input_length)
+                        result = await self.single_request(
+                            session, None, max_tokens=output_length, stream=True,
+                            messages=prompt["messages"], temperature=0.0, extra_body={"ignore_eos": True},
+                            timeout=timeout)
+                        cell_stats.record(result)
+                    stats.merge(cell_stats)
+                    
+                    failures = {
+                        "timeout": timeout,
+                        "timeouts": cell_stats.timed_out_requests,
+                        "errors": cell_stats.failed_requests - cell_stats.timed_out_requests
+                    }
+                    if not cell_stats.successful_requests:
+                        cells[i][j] = {
+                            "input_length": input_length,
+                            "output_length": output_length,
+                            "error": "All requests timed out" if not failures["errors"] else "No successful requests",
+                            **failures
+                        }
+                        self.report_progress("length_cell", cells[i][j])
+                        continue
+                    
+                    ttft = cell_stats.time_to_first_token.percentile(50)
+                    tpot = cell_stats.time_per_output_token.percentile(50)
+                    prompt_tokens = cell_stats.prompt_tokens / cell_stats.successful_requests
+                    cells[i][j] = {
+                        "input_length": input_length,
+                        "output_length": output_length,
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": cell_stats.completion_tokens / cell_stats.successful_requests,
+                        "success_rate": cell_stats.success_rate,
+                        "ttft": ttft,
+                        "tpot": tpot,
+                        "latency": cell_stats.latency.percentile(50),
+                        "prefill_tokens_per_second": prompt_tokens / ttft if ttft > 0 else 0,
+                        "decode_tokens_per_second": 1 / tpot if tpot > 0 else 0,
+                        **failures
+                    }
+                    self.report_progress("length_cell", cells[i][j])
+        
+        if not stats.successful_requests:
+            return {"error": "No successful requests"}
+        
+        def matrix(metric: str) -> List[List[float]]:
+            return [[cell.get(metric) if cell else None for cell in row] for row in cells]
+        
+        return {
+            "test_type": "length_sweep",
+            "input_lengths": input_lengths,
+            "output_lengths": output_lengths,
+            "requests_per_cell": requests_per_cell,
+            "max_model_len": max_model_len,
+            "timed_out_requests": stats.timed_out_requests,
+            "failed_requests": stats.failed_requests - stats.timed_out_requests,
+            "cells": cells,
+            "matrices": {
+                "ttft": matrix("ttft"),
+                "prefill_tokens_per_second": matrix("prefill_tokens_per_second"),
+                "decode_tokens_per_second": matrix("decode_tokens_per_second")
+            },
+            "latency": stats.latency.summary(),
+            "time_to_first_token": stats.time_to_first_token.summary(),
+            **stats.goodput_summary(time.time() - start_time)
+        }
+    
+    @staticmethod
+    def arrival_intervals(request_rate: float, arrival: str = "poisson", burstiness: float = 1.0):
+        """Yield inter-arrival gaps (seconds) for an open-loop request schedule.
+        
+        arrival is one of "poisson", "constant" or "gamma". For gamma arrivals
+        burstiness is the shape parameter: 1.0 matches Poisson, lower values
+        produce burstier traffic at the same mean rate.
+        """
+        if request_rate <= 0:
+            raise ValueError("request_rate must be positive")
+        while True:
+            if arrival == "constant":
+                yield 1.0 / request_rate
+            elif arrival == "poisson":
+                yield random.expovariate(request_rate)
+            elif arrival == "gamma":
+                yield random.gammavariate(burstiness, 1.0 / (request_rate * burstiness))
+            else:
+                raise ValueError(f"Unknown arrival distribution: {arrival}")
+    
+    @staticmethod
+    def _launch(pending: set, stats: RequestStats, request) -> asyncio.Task:
+        """Start a request without awaiting it; its result is folded into stats on completion"""
+        def collect(task: asyncio.Task):
+            pending.discard(task)
+            stats.record(task.result())
+        
+        task = asyncio.create_task(request)
+        task.add_done_callback(collect)
+        pending.add(task)
+        return task
+    
+    async def open_loop_test(self, request_rate: float, duration_seconds: int = 15,
+                             arrival: str = "poisson", burstiness: float = 1.0) -> Dict:
+        """Send requests at a target rate regardless of how fast the server completes them"""
+        start_time = time.time()
+        end_time = start_time + duration_seconds
+        stats = RequestStats(self.slo)
+        pending = set()
+        
+        # No connection cap: an open-loop client must never wait on its own pool
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            sent = 0
+            next_arrival = start_time
+            for gap in self.arrival_intervals(request_rate, arrival, burstiness):
+                next_arrival += gap
+                if next_arrival >= end_time:
+                    break
+                delay = next_arrival - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                prompt = self.generate_unique_prompt(random.choice(["short", "medium", "long"]))
+                self._launch(pending, stats, self.single_request(session, prompt, max_tokens=128, stream=True))
+                sent += 1
+            
+            send_duration = time.time() - start_time
+            if pending:
+                await asyncio.wait(pending)
+        
+        actual_duration = time.time() - start_time
+        
+        if not stats.successful_requests:
+            return {"error": "No successful requests", "offered_rate": request_rate}
+        
+        return {
+            "test_type": "open_loop",
+            "arrival": arrival,
+            "offered_rate": request_rate,
+            "achieved_send_rate": sent / send_duration if send_duration > 0 else 0,
+            "total_requests": stats.total_requests,
+            "successful_requests": stats.successful_requests,
+            "success_rate": stats.success_rate,
+            "test_duration": actual_duration,
+            "requests_per_second": stats.successful_requests / actual_duration,
+            "tokens_per_second": stats.completion_tokens / actual_duration,
+            "latency": stats.latency.summary(),
+            "time_to_first_token": stats.time_to_first_token.summary(),
+            **stats.goodput_summary(actual_duration)
+        }
+    
+    async def rate_sweep_test(self, request_rates: List[float] = None, duration_seconds: int = 15,
+                              arrival: str = "poisson", burstiness: float = 1.0) -> Dict:
+        """Run open-loop tests over increasing request rates to chart latency vs offered load"""
+        request_rates = request_rates or [1, 2, 4, 8, 16]
+        results = []
+        
+        for rate in request_rates:
+            print(f"Testing open-loop load at {rate} req/s ({arrival})...")
+            level_start = time.time()
+            test_result = await self.open_loop_test(rate, duration_seconds, arrival, burstiness)
+            
+            results.append({
+                "offered_rate": rate,
+                "achieved_rate": test_result.get("requests_per_second", 0),
+                "success_rate": test_result.get("success_rate", 0),
+                "mean_latency": test_result.get("latency", {}).get("mean", 0),
+                "p95_latency": test_result.get("latency", {}).get("p95", 0),
+                "p99_latency": test_result.get("latency", {}).get("p99", 0),
+                "p95_ttft": test_result.get("time_to_first_token", {}).get("p95", 0),
+                "tokens_per_second": test_result.get("tokens_per_second", 0),
+                "goodput": test_result.get("goodput", 0),
+                "slo_attainment": test_result.get("slo_attainment", 0)
+            })
+            if self.metrics_sampler is not None:
+                results[-1]["server"] = self.metrics_sampler.window(level_start, time.time())
+            self.report_progress("rate_level", results[-1])
+            
+            # Let queues drain before the next level
+            await asyncio.sleep(1)
+        
+        # The saturation rate is the highest offered load the server kept up with
+        sustained = [r for r in results if r["success_rate"] > 95 and r["achieved_rate"] >= 0.9 * r["offered_rate"]]
+        
+        return {
+            "test_type": "rate_sweep",
+            "arrival": arrival,
+            "duration_per_rate": duration_seconds,
+            "results_by_rate": results,
+            "max_sustained_rate": max([r["offered_rate"] for r in sustained], default=0),
+            "peak_goodput": max([r["goodput"] for r in results], default=0),
+            "slo": self.slo
+        }
+    
+    @staticmethod
+    def iter_trace(trace_path: str) -> Iterator[Dict]:
+        """Lazily read a JSONL request trace one line at a time.
+        
+        Each line is either a chat request ({"messages": [...], "max_tokens": N})
+        or an OpenAI batch line with the request under "body". Arrival time comes
+        from "timestamp" (epoch seconds or ISO 8601); lines without one are sent
+        immediately after the previous request.
+        """
+        with open(trace_path, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping malformed trace line {line_number}")
+                    continue
+                
+                body = record.get("body", record)
+                messages = body.get("messages")
+                if not messages and body.get("prompt"):
+                    messages = [{"role": "user", "content": body["prompt"]}]
+                if not messages:
+                    continue
+                
+                timestamp = record.get("timestamp", body.get("timestamp"))
+                if isinstance(timestamp, str):
+                    timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+                
+                yield {
+                    "messages": messages,
+                    "max_tokens": body.get("max_tokens") or body.get("max_completion_tokens") or 256,
+                    "temperature": body.get("temperature", 0.7),
+                    "timestamp": timestamp
+                }
+    
+    async def replay_test(self, trace_path: str, time_scale: float = 1.0, max_requests: int = None) -> Dict:
+        """Replay a JSONL trace with its original inter-arrival timing.
+        
+        time_scale compresses the timeline: 2.0 replays twice as fast, 10.0 ten times.
+        """
+        if time_scale <= 0:
+            raise ValueError("time_scale must be positive")
+        
+        start_time = time.time()
+        stats = RequestStats(self.slo)
+        pending = set()
+        trace_origin = None
+        request_count = 0
+        
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            for entry in self.iter_trace(trace_path):
+                if max_requests is not None and request_count >= max_requests:
+                    break
+                
+                if entry["timestamp"] is not None:
+                    if trace_origin is None:
+                        trace_origin = entry["timestamp"]
+                    delay = start_time + (entry["timestamp"] - trace_origin) / time_scale - time.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                
+                self._launch(pending, stats, self.single_request(
+                    session, None, max_tokens=entry["max_tokens"], stream=True,
+                    messages=entry["messages"], temperature=entry["temperature"]))
+                request_count += 1
+            
+            send_duration = time.time() - start_time
+            if pending:
+                await asyncio.wait(pending)
+        
+        actual_duration = time.time() - start_time
+        
+        if not stats.successful_requests:
+            return {"error": "No successful requests", "total_requests": request_count}
+        
+        return {
+            "test_type": "replay",
+            "trace_path": trace_path,
+            "time_scale": time_scale,
             "total_requests": request_count,
-            "successful_requests": len(successful),
-            "success_rate": len(successful) / len(results) * 100,
-            "requests_per_second": len(successful) / actual_duration,
-            "tokens_per_second": completion_tokens / actual_duration,
-            "total_tokens_processed": total_tokens,
-            "average_tokens_per_request": total_tokens / len(successful) if successful else 0
+            "successful_requests": stats.successful_requests,
+            "success_rate": stats.success_rate,
+            "send_duration": send_duration,
+            "test_duration": actual_duration,
+            "requests_per_second": stats.successful_requests / actual_duration,
+            "tokens_per_second": stats.completion_tokens / actual_duration,
+            "prompt_tokens": stats.prompt_tokens,
+            "completion_tokens": stats.completion_tokens,
+            "latency": stats.latency.summary(),
+            "time_to_first_token": stats.time_to_first_token.summary(),
+            "time_per_output_token": stats.time_per_output_token.summary(),
+            **stats.goodput_summary(actual_duration)
         }
     
     async def stress_test(self, max_concurrent: int = 100) -> Dict:
@@ -312,7 +1142,10 @@ class ModelBenchmark:
             # Use more requests per client for higher loads to really stress test
             requests_per_client = min(5, max(2, concurrent // 10))
             
-            test_result = await self.concurrent_test(concurrent, requests_per_client=requests_per_client)
+            level_start = time.time()
+            # Stream so every level is judged on TTFT and TPOT, not just e2e latency
+            test_result = await self.concurrent_test(concurrent, requests_per_client=requests_per_client,
+                                                     stream=True)
             
             success_rate = test_result.get("success_rate", 0)
             mean_latency = test_result.get("latency_under_load", {}).get("mean", 0)
@@ -322,10 +1155,18 @@ class ModelBenchmark:
                 "success_rate": success_rate,
                 "mean_latency": mean_latency,
                 "p99_latency": test_result.get("latency_under_load", {}).get("p99", 0),
+                "p95_ttft": test_result.get("time_to_first_token", {}).get("p95", 0),
+                "p95_tpot": test_result.get("time_per_output_token", {}).get("p95", 0),
                 "requests_per_second": test_result.get("requests_per_second", 0),
+                "goodput": test_result.get("goodput", 0),
+                "slo_attainment": test_result.get("slo_attainment", 0),
                 "total_requests": test_result.get("total_requests", 0),
                 "failed_requests": test_result.get("total_requests", 0) - test_result.get("successful_requests", 0)
             })
+            if self.metrics_sampler is not None:
+                # Server state while this level ran, to line up with its latency
+                results[-1]["server"] = self.metrics_sampler.window(level_start, time.time())
+            self.report_progress("stress_level", results[-1])
             
             # Dynamic stopping conditions
             if success_rate < 50:
@@ -345,15 +1186,16 @@ class ModelBenchmark:
             # Small delay between levels to let system recover
             await asyncio.sleep(1)
         
-        # Calculate metrics
-        optimal = max(results, key=lambda x: x["requests_per_second"]) if results else {"concurrent_clients": 1}
-        sustainable = [r for r in results if r["success_rate"] > 90]
+        # Calculate metrics; the optimum is the load delivering the most requests within SLO
+        optimal = max(results, key=lambda x: x["goodput"]) if results else {"concurrent_clients": 1}
+        # SLO attainment counts failures as misses too, so it is the stricter bar
+        sustainable = [r for r in results if r["slo_attainment"] > 90]
         max_sustainable = max([r["concurrent_clients"] for r in sustainable], default=1) if sustainable else 1
         
-        # Find degradation point (where success rate first drops below 95%)
+        # Find degradation point (where SLO attainment first drops below 95%)
         degradation_point = None
         for r in results:
-            if r["success_rate"] < 95:
+            if r["slo_attainment"] < 95:
                 degradation_point = r["concurrent_clients"]
                 break
         
@@ -365,8 +1207,11 @@ class ModelBenchmark:
             "max_sustainable_load": max_sustainable,
             "degradation_point": degradation_point,
             "breaking_point_found": found_breaking_point,
-            "peak_throughput": optimal["requests_per_second"],
-            "recommendations": self._generate_recommendations(results, found_breaking_point)
+            "peak_throughput": max([r["requests_per_second"] for r in results], default=0),
+            "peak_goodput": optimal.get("goodput", 0),
+            "slo": self.slo,
+            "recommendations": self._generate_recommendations(results, found_breaking_point),
+            "saturation": diagnose_saturation(results)
         }
     
     def _generate_recommendations(self, results: List[Dict], breaking_point_found: bool) -> Dict:
@@ -375,14 +1220,25 @@ class ModelBenchmark:
             return {"error": "No test results"}
         
         last_result = results[-1]
-        optimal = max(results, key=lambda x: x["requests_per_second"])
+        optimal = max(results, key=lambda x: x["goodput"])
+        peak_throughput = max(results, key=lambda x: x["requests_per_second"])
         
+        # Size for the load that maximizes goodput: raw throughput bought with
+        # SLO violations is not capacity we can use
         recommendations = {
             "optimal_concurrency": optimal["concurrent_clients"],
-            "suggested_max_workers": min(optimal["concurrent_clients"] * 2, 100)
+            "suggested_max_workers": min(optimal["concurrent_clients"] * 2, 100),
+            "goodput_at_optimal": optimal["goodput"]
         }
         
-        if not breaking_point_found and last_result["success_rate"] > 95:
+        if optimal["goodput"] == 0:
+            recommendations["note"] = "No load level met the latency SLOs. Relax the SLOs or add capacity."
+            recommendations["can_handle_more"] = False
+        elif peak_throughput["concurrent_clients"] > optimal["concurrent_clients"]:
+            recommendations["note"] = (f"Throughput keeps rising up to {peak_throughput['concurrent_clients']} clients, "
+                                       f"but beyond {optimal['concurrent_clients']} the extra requests miss their SLOs.")
+            recommendations["can_handle_more"] = False
+        elif not breaking_point_found and last_result["success_rate"] > 95 and last_result["slo_attainment"] > 95:
             recommendations["note"] = "System handled maximum tested load well. Consider testing with higher concurrency."
             recommendations["can_handle_more"] = True
         elif last_result["success_rate"] < 50:
@@ -394,18 +1250,42 @@ class ModelBenchmark:
         
         return recommendations
 
-async def run_benchmark_suite(base_url: str, model_name: str, tests: List[str]) -> Dict:
-    """Run selected benchmark tests"""
-    benchmark = ModelBenchmark(base_url, model_name)
+def _run_client_shard(base_url: str, model_name: str, num_clients: int, requests_per_client: int,
+                      slo: Dict = None, stream: bool = False) -> Dict:
+    """Process-pool entry point: run a shard of clients on the worker's own event loop"""
+    benchmark = ModelBenchmark(base_url, model_name, slo=slo)
+    return asyncio.run(benchmark.run_clients(num_clients, requests_per_client, stream))
+
+async def run_benchmark_suite(base_url: str, model_name: str, tests: List[str], options: Dict = None,
+                              progress: Callable[[str, Dict], None] = None) -> Dict:
+    """Run selected benchmark tests
+    
+    options carries per-test settings, e.g. trace_path and time_scale for replay,
+    workers to shard concurrent/stress load across processes, or slo to override
+    the DEFAULT_SLO latency targets used for goodput. Unless scrape_metrics is
+    False, the server's /metrics is sampled during each test and stored under
+    the test's server_metrics. progress, if
+    given, is called with (event, data) as each test and stress level finishes.
+    """
+    options = options or {}
+    benchmark = ModelBenchmark(base_url, model_name, num_workers=options.get("workers") or 1,
+                               progress=progress, slo=options.get("slo"))
     results = {
         "timestamp": datetime.now().isoformat(),
         "model": model_name,
         "base_url": base_url,
+        "slo": benchmark.slo,
         "tests": {}
     }
     
     for test_name in tests:
         print(f"Running {test_name} test...")
+        benchmark.report_progress("test_started", {"test": test_name})
+        if options.get("scrape_metrics", True):
+            # Behind a gateway, scrape the replicas themselves
+            benchmark.metrics_sampler = MetricsSampler(options.get("metrics_base_urls") or base_url,
+                                                       interval=options.get("metrics_interval") or 1.0)
+            benchmark.metrics_sampler.start()
         try:
             if test_name == "latency":
                 results["tests"][test_name] = await benchmark.latency_test(num_requests=10)
@@ -413,10 +1293,105 @@ async def run_benchmark_suite(base_url: str, model_name: str, tests: List[str])
                 results["tests"][test_name] = await benchmark.concurrent_test(num_concurrent=5, requests_per_client=3)
             elif test_name == "throughput":
                 results["tests"][test_name] = await benchmark.throughput_test(duration_seconds=20)
+            elif test_name == "rate_sweep":
+                results["tests"][test_name] = await benchmark.rate_sweep_test(duration_seconds=15)
+            elif test_name == "replay":
+                results["tests"][test_name] = await benchmark.replay_test(
+                    options["trace_path"], time_scale=options.get("time_scale", 1.0),
+                    max_requests=options.get("max_requests"))
+            elif test_name == "prefix_cache":
+                results["tests"][test_name] = await benchmark.prefix_cache_test(
+                    prefix_tokens=options.get("prefix_tokens") or 1024,
+                    share_ratio=options.get("share_ratio", 0.8),
+                    num_prefixes=options.get("num_prefixes") or 4,
+                    prefix_caching_enabled=options.get("prefix_caching_enabled"))
+            elif test_name == "length_sweep":
+                results["tests"][test_name] = await benchmark.length_sweep_test(
+                    input_lengths=options.get("input_lengths"), output_lengths=options.get("output_lengths"),
+                    max_model_len=options.get("max_model_len"), request_timeout=options.get("request_timeout"))
+            elif test_name == "streaming":
+                results["tests"][test_name] = await benchmark.streaming_test(num_requests=20, num_concurrent=4)
             elif test_name == "stress":
                 # Start with 50 for stress test - can be increased based on hardware
                 results["tests"][test_name] = await benchmark.stress_test(max_concurrent=50)
         except Exception as e:
             results["tests"][test_name] = {"error": str(e)}
+        if benchmark.metrics_sampler is not None:
+            server_metrics = await benchmark.metrics_sampler.stop()
+            benchmark.metrics_sampler = None
+            if isinstance(results["tests"].get(test_name), dict):
+                results["tests"][test_name]["server_metrics"] = server_metrics
+        benchmark.report_progress("test_completed", {"test": test_name, "result": results["tests"].get(test_name)})
+    
+    benchmark.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark a running vLLM server')
+    parser.add_argument('--url', default='http://localhost:5002', help='vLLM base URL')
+    parser.add_argument('--model', required=True, help='Model name served by vLLM')
+    parser.add_argument('--tests', default='latency',
+                        help='Comma-separated tests (latency, streaming, concurrent, throughput, rate_sweep, replay, '
+                             'prefix_cache, length_sweep, stress)')
+    parser.add_argument('--trace', dest='trace_path', help='JSONL trace for the replay test')
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='Replay speed-up factor (e.g. 2 or 10)')
+    parser.add_argument('--max-requests', type=int, help='Stop replay after this many requests')
+    parser.add_argument('--prefix-tokens', type=int, default=1024,
+                        help='Shared system prompt length for the prefix_cache test')
+    parser.add_argument('--share-ratio', type=float, default=0.8,
+                        help='Fraction of prefix_cache requests that reuse a shared prefix')
+    parser.add_argument('--num-prefixes', type=int, default=4,
+                        help='Number of distinct shared prefixes in the prefix_cache test')
+    parser.add_argument('--input-lengths', help='Comma-separated prompt lengths for length_sweep (e.g. 128,2048,32768)')
+    parser.add_argument('--output-lengths', help='Comma-separated output lengths for length_sweep (e.g. 32,512)')
+    parser.add_argument('--max-model-len', type=int, help='Skip length_sweep cells longer than this')
+    parser.add_argument('--request-timeout', type=float,
+                        help='Fixed per-request timeout in seconds for length_sweep '
+                             '(default: scaled to each cell\'s input and output length)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for concurrent/stress load generation')
+    parser.add_argument('--slo-ttft', type=float, default=DEFAULT_SLO["ttft"],
+                        help='Time-to-first-token target in seconds (judged at p95)')
+    parser.add_argument('--slo-tpot', type=float, default=DEFAULT_SLO["tpot"],
+                        help='Time-per-output-token target in seconds')
+    parser.add_argument('--slo-e2e', type=float, default=DEFAULT_SLO["e2e"],
+                        help='End-to-end latency target in seconds (judged at p99)')
+    parser.add_argument('--no-metrics', action='store_true', help="Do not sample the server's /metrics during tests")
+    parser.add_argument('--metrics-interval', type=float, default=1.0, help='Seconds between /metrics samples')
+    parser.add_argument('--metrics-urls',
+                        help='Comma-separated replica base URLs to scrape when --url is a load balancer')
+    parser.add_argument('--output', help='Write results JSON to this file instead of stdout')
+    args = parser.parse_args()
+    
+    options = {
+        "trace_path": args.trace_path,
+        "time_scale": args.time_scale,
+        "max_requests": args.max_requests,
+        "workers": args.workers,
+        "prefix_tokens": args.prefix_tokens,
+        "share_ratio": args.share_ratio,
+        "num_prefixes": args.num_prefixes,
+        "input_lengths": [int(n) for n in args.input_lengths.split(',')] if args.input_lengths else None,
+        "output_lengths": [int(n) for n in args.output_lengths.split(',')] if args.output_lengths else None,
+        "max_model_len": args.max_model_len,
+        "request_timeout": args.request_timeout,
+        "scrape_metrics": not args.no_metrics,
+        "metrics_interval": args.metrics_interval,
+        "metrics_base_urls": [u.strip() for u in args.metrics_urls.split(',')] if args.metrics_urls else None,
+        "slo": {"ttft": args.slo_ttft, "tpot": args.slo_tpot, "e2e": args.slo_e2e}
+    }
+    tests = [t.strip() for t in args.tests.split(',') if t.strip()]
+    results = asyncio.run(run_benchmark_suite(args.url, args.model, tests, options))
     
-    return results
\ No newline at end of file
+    output = json.dumps(results, indent=2, default=float)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
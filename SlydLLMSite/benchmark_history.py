@@ -0,0 +1,195 @@
+"""
+Persistent, append-only store of benchmark runs
+
+Each completed benchmark suite is saved to a local SQLite database together
+with the model and the full effective vLLM config it ran against, so runs
+can be compared later and regressions flagged.
+"""
+import hashlib
+import json
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, List, Iterator
+
+# (metric, higher_is_better) pairs compared between runs
+COMPARED_METRICS = [
+    ('p95_latency', False),
+    ('p99_latency', False),
+    ('p95_ttft', False),
+    ('tokens_per_second', True),
+    ('requests_per_second', True),
+    ('goodput', True),
+]
+
+
+def extract_metrics(test_result: Dict) -> Dict:
+    """Pull the comparable headline metrics out of one test's result dict"""
+    if not isinstance(test_result, dict) or test_result.get('error'):
+        return {}
+
+    metrics = {}
+    latency = test_result.get('latency') or test_result.get('latency_under_load') or {}
+    if 'p95' in latency:
+        metrics['p95_latency'] = latency['p95']
+    if 'p99' in latency:
+        metrics['p99_latency'] = latency['p99']
+
+    ttft = test_result.get('time_to_first_token') or {}
+    if 'p95' in ttft:
+        metrics['p95_ttft'] = ttft['p95']
+
+    if 'tokens_per_second' in test_result:
+        metrics['tokens_per_second'] = test_result['tokens_per_second']
+    elif 'throughput_under_load' in test_result:
+        metrics['tokens_per_second'] = test_result['throughput_under_load']['aggregate_tokens_per_second']
+    elif 'throughput' in test_result:
+        throughput = test_result['throughput']
+        metrics['tokens_per_second'] = throughput.get('aggregate_tokens_per_second',
+                                                      throughput.get('mean_tokens_per_second'))
+
+    if 'requests_per_second' in test_result:
+        metrics['requests_per_second'] = test_result['requests_per_second']
+    elif 'peak_throughput' in test_result:
+        metrics['requests_per_second'] = test_result['peak_throughput']
+
+    if 'goodput' in test_result:
+        metrics['goodput'] = test_result['goodput']
+    elif 'peak_goodput' in test_result:
+        metrics['goodput'] = test_result['peak_goodput']
+
+    return {name: float(value) for name, value in metrics.items() if value is not None}
+
+
+def config_hash(config: Dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class BenchmarkHistory:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    test_type TEXT,
+                    config_hash TEXT NOT NULL,
+                    config_json TEXT NOT NULL,
+                    results_json TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_runs_model_time ON runs (model, timestamp)')
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per call keeps this safe to use from any Flask or job thread
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save_run(self, results: Dict, config: Dict, test_type: str = None) -> int:
+        """Append a finished benchmark run and return its id"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO runs (timestamp, model, test_type, config_hash, config_json, results_json) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (results.get('timestamp'), results.get('model', config.get('model', '')), test_type,
+                 config_hash(config), json.dumps(config, sort_keys=True),
+                 json.dumps(results, default=float)))
+            return cursor.lastrowid
+
+    def list_runs(self, model: str = None, limit: int = 50) -> List[Dict]:
+        query = 'SELECT id, timestamp, model, test_type, config_hash, results_json FROM runs'
+        params = []
+        if model:
+            query += ' WHERE model = ?'
+            params.append(model)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [{
+            'id': row['id'],
+            'timestamp': row['timestamp'],
+            'model': row['model'],
+            'test_type': row['test_type'],
+            'config_hash': row['config_hash'],
+            'tests': list(json.loads(row['results_json']).get('tests', {}).keys())
+        } for row in rows]
+
+    def get_run(self, run_id: int) -> Dict:
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'timestamp': row['timestamp'],
+            'model': row['model'],
+            'test_type': row['test_type'],
+            'config_hash': row['config_hash'],
+            'config': json.loads(row['config_json']),
+            'results': json.loads(row['results_json'])
+        }
+
+    def compare_runs(self, base_id: int, candidate_id: int, threshold_pct: float = 10.0) -> Dict:
+        """Compare two runs test by test and flag regressions beyond threshold_pct"""
+        base = self.get_run(base_id)
+        candidate = self.get_run(candidate_id)
+        if base is None or candidate is None:
+            raise KeyError('Unknown benchmark run')
+
+        tests = {}
+        regressions = []
+        base_tests = base['results'].get('tests', {})
+        candidate_tests = candidate['results'].get('tests', {})
+
+        for test_name in base_tests:
+            if test_name not in candidate_tests:
+                continue
+            base_metrics = extract_metrics(base_tests[test_name])
+            candidate_metrics = extract_metrics(candidate_tests[test_name])
+
+            comparison = {}
+            for metric, higher_is_better in COMPARED_METRICS:
+                if metric not in base_metrics or metric not in candidate_metrics:
+                    continue
+                before = base_metrics[metric]
+                after = candidate_metrics[metric]
+                change_pct = (after - before) / before * 100 if before else 0.0
+                worse_pct = -change_pct if higher_is_better else change_pct
+                regressed = worse_pct > threshold_pct
+                comparison[metric] = {
+                    'base': before,
+                    'candidate': after,
+                    'change_pct': round(change_pct, 2),
+                    'regression': regressed,
+                    'improvement': -worse_pct > threshold_pct
+                }
+                if regressed:
+                    regressions.append(f'{test_name}.{metric}')
+            tests[test_name] = comparison
+
+        # Keys whose value differs between the two effective configs
+        all_keys = sorted(set(base['config']) | set(candidate['config']))
+        config_diff = {
+            key: {'base': base['config'].get(key), 'candidate': candidate['config'].get(key)}
+            for key in all_keys if base['config'].get(key) != candidate['config'].get(key)
+        }
+
+        return {
+            'base': {k: base[k] for k in ('id', 'timestamp', 'model', 'test_type', 'config_hash')},
+            'candidate': {k: candidate[k] for k in ('id', 'timestamp', 'model', 'test_type', 'config_hash')},
+            'threshold_pct': threshold_pct,
+            'config_diff': config_diff,
+            'tests': tests,
+            'regressions': regressions
+        }
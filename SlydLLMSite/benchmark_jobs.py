@@ -0,0 +1,179 @@
+"""
+Background benchmark jobs for the SlydLLMSite app
+
+Benchmarks run on a single event loop in a daemon thread so Flask workers
+return immediately. Each job keeps an append-only list of progress events
+that clients can poll or follow as a server-sent-events stream; results
+collected so far survive a browser disconnect.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Iterator, Tuple
+
+from benchmark import run_benchmark_suite
+from benchmark_history import BenchmarkHistory
+from app_metrics import BENCHMARK_JOB_DURATION
+
+
+class BenchmarkJob:
+    def __init__(self, test_type: str, tests: List[str], base_url: str, model_name: str, options: Dict,
+                 config: Dict = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.test_type = test_type
+        self.tests = tests
+        self.base_url = base_url
+        self.model_name = model_name
+        self.options = options
+        # Effective vLLM config the job ran against, recorded with its results
+        self.config = config or {}
+        self.run_id = None
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.results = {
+            'timestamp': self.created_at,
+            'model': model_name,
+            'base_url': base_url,
+            'tests': {}
+        }
+        self.events = []
+        self.completed_tests = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self, include_results: bool = True) -> Dict:
+        data = {
+            'job_id': self.id,
+            'test_type': self.test_type,
+            'tests': self.tests,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': {
+                'completed_tests': self.completed_tests,
+                'total_tests': len(self.tests),
+                'events': len(self.events)
+            },
+            'error': self.error,
+            'run_id': self.run_id
+        }
+        if include_results:
+            data['results'] = self.results
+        return data
+
+
+class BenchmarkJobManager:
+    def __init__(self, max_jobs: int = 50, history: BenchmarkHistory = None):
+        self.max_jobs = max_jobs
+        self.history = history
+        self._jobs = OrderedDict()
+        self._condition = threading.Condition(threading.RLock())
+        self._loop = None
+        self._thread = None
+        self._run_lock = None
+
+    def _ensure_loop(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        # Jobs queue behind each other; concurrent benchmarks would skew each other's numbers
+        self._run_lock = asyncio.Lock()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='benchmark-jobs', daemon=True)
+        self._thread.start()
+
+    def submit(self, test_type: str, tests: List[str], base_url: str, model_name: str,
+               options: Dict = None, config: Dict = None) -> BenchmarkJob:
+        """Queue a benchmark suite and return its job immediately"""
+        job = BenchmarkJob(test_type, tests, base_url, model_name, options or {}, config)
+        with self._condition:
+            self._ensure_loop()
+            self._jobs[job.id] = job
+            self._prune()
+        self._add_event(job, 'job_queued', {'job_id': job.id, 'tests': tests})
+        asyncio.run_coroutine_threadsafe(self._run(job), self._loop)
+        return job
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_jobs"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        while len(self._jobs) > self.max_jobs and finished:
+            del self._jobs[finished.pop(0)]
+
+    def get(self, job_id: str) -> BenchmarkJob:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        return [job.to_dict(include_results=False) for job in reversed(list(self._jobs.values()))]
+
+    def _add_event(self, job: BenchmarkJob, event: str, data: Dict):
+        with self._condition:
+            if event == 'test_completed':
+                job.results['tests'][data['test']] = data['result']
+                job.completed_tests += 1
+            job.events.append({'event': event, 'time': time.time(), 'data': data})
+            self._condition.notify_all()
+
+    async def _run(self, job: BenchmarkJob):
+        async with self._run_lock:
+            run_start = time.monotonic()
+            job.status = 'running'
+            job.started_at = datetime.now().isoformat()
+            self._add_event(job, 'job_started', {'job_id': job.id})
+            try:
+                results = await run_benchmark_suite(
+                    job.base_url, job.model_name, job.tests, job.options,
+                    progress=lambda event, data: self._add_event(job, event, data))
+                job.results = results
+                if self.history is not None:
+                    job.run_id = self.history.save_run(results, job.config, job.test_type)
+                status = 'completed'
+            except Exception as e:
+                job.error = str(e)
+                status = 'failed'
+            # Flip status and publish the final event together so followers never
+            # see a finished job without its closing event
+            BENCHMARK_JOB_DURATION.observe(time.monotonic() - run_start, test_type=job.test_type, status=status)
+            with self._condition:
+                job.status = status
+                job.finished_at = datetime.now().isoformat()
+                self._add_event(job, 'job_' + status, job.to_dict())
+
+    def events_since(self, job_id: str, start_index: int = 0) -> Tuple[List[Dict], bool]:
+        """Events from start_index on and whether the job has finished, without waiting"""
+        job = self.get(job_id)
+        with self._condition:
+            return job.events[start_index:], job.finished
+
+    def iter_events(self, job_id: str, start_index: int = 0,
+                    keepalive_seconds: float = 15.0) -> Iterator[Tuple[int, Dict]]:
+        """Yield (index, event) for a job as events arrive, until the job finishes.
+
+        Yields (None, None) as a keep-alive when nothing happened for a while.
+        """
+        job = self.get(job_id)
+        index = start_index
+        while job is not None:
+            with self._condition:
+                if index >= len(job.events) and not job.finished:
+                    self._condition.wait(timeout=keepalive_seconds)
+                pending = job.events[index:]
+                finished = job.finished
+            if not pending:
+                if finished:
+                    return
+                yield None, None
+                continue
+            for event in pending:
+                yield index, event
+                index += 1
+            if finished and index >= len(job.events):
+                return
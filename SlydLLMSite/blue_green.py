@@ -0,0 +1,376 @@
+"""
+Zero-downtime vLLM reloads by swapping between two instances
+
+Restarting the vLLM service to apply a new model or config drops every
+request for the minutes it takes to load weights. When the GPU has room for
+a second instance, a reload instead starts one on the spare port with the new
+config (built by build_vllm_command), waits until /v1/models lists the model
+and a few warm-up completions succeed, then flips the backend pool by saving
+the config with the new port. Clients reach vLLM through the app's /v1
+gateway (nginx proxies /v1/ to it), so the flip moves their traffic too. The
+old instance is drained of in-flight requests and stopped. Otherwise the
+reload falls back to restarting the service as before.
+
+Instances started here run outside systemd; their pid and port are kept in
+instances.json so a restarted site can still find and stop them.
+"""
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+import app_metrics
+import config_cache
+
+# build_vllm_command.py is installed next to the vLLM config in /opt/vllm; in a checkout it is one level up
+sys.path.extend(['/opt/vllm', os.path.dirname(os.path.dirname(os.path.abspath(__file__)))])
+
+# The two ports instances alternate between
+DEFAULT_PORTS = (5002, 5003)
+
+# Free memory kept back on top of the new instance's share, for CUDA context and allocator slack
+HEADROOM_MIB = 1024
+
+WARMUP_PROMPT = 'Say hello.'
+
+
+def gpu_memory() -> Optional[List[Tuple[int, float, float]]]:
+    """(index, total, free) MiB per GPU from nvidia-smi, or None when it cannot be read"""
+    try:
+        result = subprocess.run(
+            ['nvidia-smi', '--query-gpu=index,memory.total,memory.free', '--format=csv,noheader,nounits'],
+            capture_output=True, text=True, timeout=10)
+        if result.returncode != 0:
+            return None
+        gpus = []
+        for line in result.stdout.strip().splitlines():
+            if line.strip():
+                index, total, free = line.split(',')
+                gpus.append((int(index), float(total), float(free)))
+        return gpus
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+def select_gpus(config: Dict, gpus: Optional[List[Tuple[int, float, float]]],
+                busy=()) -> Tuple[Optional[List[int]], str]:
+    """The GPUs a second instance with this config can run on next to the live one.
+
+    vLLM claims gpu_memory_utilization of each GPU's total memory at startup,
+    so that much (plus headroom) must be free on every GPU it shards across.
+    GPUs the live instance occupies fail that check; busy excludes the ones
+    known to be in use regardless. Returns (indices, '') with the
+    tensor_parallel_size roomiest GPUs, or (None, reason).
+    """
+    if gpus is None:
+        return None, 'GPU memory could not be read'
+    tp = int(config.get('tensor_parallel_size') or 1)
+    utilization = float(config.get('gpu_memory_utilization') or 0.9)
+    idle = [(free, index) for index, total, free in gpus
+            if index not in busy and free >= utilization * total + HEADROOM_MIB]
+    if len(idle) < tp:
+        return None, (f'{tp} GPUs with {utilization:.0%} of their memory free needed, '
+                      f'{len(idle)} of {len(gpus)} available')
+    return sorted(index for _, index in sorted(idle, reverse=True)[:tp]), ''
+
+
+def port_in_use(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1)
+        return sock.connect_ex(('127.0.0.1', port)) == 0
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class ReloadInProgress(Exception):
+    """Raised when a reload is requested while another is still running"""
+
+
+class BlueGreenReloader:
+    def __init__(self, load_config: Callable[[], Dict], save_config: Callable[[Dict], None],
+                 get_pool: Callable, instance_dir: str, ports=DEFAULT_PORTS, python: str = None,
+                 service: str = 'vllm', ready_timeout: float = 1800.0, warmup_requests: int = 3,
+                 drain_timeout: float = 120.0):
+        """
+        load_config/save_config read and write the vLLM config the proxy
+        target is derived from; get_pool returns the synced backend pool.
+        python replaces the interpreter in the built command (default: this
+        one, which runs from the vLLM virtualenv when deployed).
+        """
+        self.load_config = load_config
+        self.save_config = save_config
+        self.get_pool = get_pool
+        self.instance_dir = instance_dir
+        self.ports = [int(p) for p in ports]
+        self.python = python or sys.executable
+        self.service = service
+        self.ready_timeout = ready_timeout
+        self.warmup_requests = warmup_requests
+        self.drain_timeout = drain_timeout
+        self._lock = threading.Lock()
+        self._thread = None
+        # Popen handles for instances started by this process, so they can be reaped
+        self._processes = {}
+        self.status = {'state': 'idle'}
+        os.makedirs(instance_dir, exist_ok=True)
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.instance_dir, 'instances.json')
+
+    def _instances(self) -> Dict[str, Dict]:
+        """Instances started here that are still running, keyed by port"""
+        if not os.path.exists(self.state_path):
+            return {}
+        instances = config_cache.read_json(self.state_path)
+        return {port: info for port, info in instances.items() if pid_alive(info['pid'])}
+
+    def _save_instances(self, instances: Dict[str, Dict]):
+        config_cache.write_json(self.state_path, instances)
+
+    def managed_instance(self, port: int) -> Optional[Dict]:
+        """The live instance this module started on the port, if any"""
+        return self._instances().get(str(port))
+
+    def busy_gpus(self) -> List[int]:
+        """GPUs pinned to instances started here"""
+        return [gpu for info in self._instances().values() for gpu in info.get('gpus') or []]
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def spare_port(self, active_port: int) -> Optional[int]:
+        for port in self.ports:
+            if port != active_port and not port_in_use(port):
+                return port
+        return None
+
+    def plan(self, config: Dict = None) -> Tuple[str, str]:
+        """('blue_green', '') when a second instance can come up next to the active one, else ('restart', reason)"""
+        config = config or self.load_config()
+        if self.spare_port(int(config.get('port', 5002))) is None:
+            return 'restart', f'no free spare port among {self.ports}'
+        gpus, reason = select_gpus(config, gpu_memory(), self.busy_gpus())
+        return ('blue_green', '') if gpus is not None else ('restart', reason)
+
+    def start(self) -> Dict:
+        """Start a blue-green reload to the saved config in the background; returns its status"""
+        with self._lock:
+            if self.running:
+                raise ReloadInProgress('A reload is already in progress')
+            config = self.load_config()
+            active_port = int(config.get('port', 5002))
+            port = self.spare_port(active_port)
+            if port is None:
+                raise RuntimeError(f'No free spare port among {self.ports}')
+            gpus, reason = select_gpus(config, gpu_memory(), self.busy_gpus())
+            if gpus is None:
+                raise RuntimeError(f'The new instance does not fit next to the active one: {reason}')
+            self.status = {
+                'state': 'starting',
+                'mode': 'blue_green',
+                'model': config.get('model'),
+                'old_port': active_port,
+                'new_port': port,
+                'gpus': gpus,
+                'started_at': datetime.now().isoformat(),
+                'finished_at': None,
+                'message': None,
+                'events': []
+            }
+            self._thread = threading.Thread(target=self._run, args=(config, active_port, port, gpus),
+                                            name='vllm-reload', daemon=True)
+            self._thread.start()
+        return self.get_status()
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            status = dict(self.status)
+            status['events'] = list(status.get('events', []))
+        status['running'] = self.running
+        return status
+
+    def _set(self, state: str, message: str):
+        with self._lock:
+            self.status['state'] = state
+            self.status['message'] = message
+            self.status['events'].append({'time': datetime.now().isoformat(), 'state': state, 'message': message})
+
+    def _run(self, config: Dict, active_port: int, port: int, gpus: List[int]):
+        started = time.time()
+        switched = False
+        try:
+            served_model = config.get('served_model_name') or config.get('model')
+            new_url = f'http://localhost:{port}'
+            self._set('launching', f'Starting vLLM for {config.get("model")} on port {port}, '
+                                   f'GPU {",".join(map(str, gpus))}')
+            process = self.launch(dict(config, port=port), gpus)
+
+            self._set('loading', 'Waiting for the new instance to load the model')
+            self._wait_ready(new_url, process, served_model)
+
+            self._set('warming_up', f'Sending {self.warmup_requests} warm-up requests')
+            self._warm_up(new_url, served_model)
+
+            # Saving the config with the new port is the flip: the pool targets localhost on the configured port
+            pool = self.get_pool()
+            old_url = f'http://localhost:{active_port}'
+            old_backend = next((b for b in pool.backends if b.url == old_url), None)
+            # Re-read the config so edits saved while the new instance loaded are kept
+            self.save_config(dict(self.load_config(), port=port))
+            self.get_pool()
+            switched = True
+            self._set('draining', f'Traffic switched to port {port}; draining port {active_port}')
+
+            # Leases keep their Backend object, so in-flight requests finish on the old instance
+            deadline = time.time() + self.drain_timeout
+            while old_backend is not None and old_backend.outstanding > 0 and time.time() < deadline:
+                time.sleep(0.5)
+            message = f'Now serving from port {port}'
+            if old_backend is not None and old_backend.outstanding > 0:
+                message += f'; {old_backend.outstanding} requests were still running on the old instance'
+
+            self._set('stopping_old', f'Stopping the old instance on port {active_port}')
+            try:
+                self.stop_instance(active_port)
+            except Exception as e:
+                message += f'; the old instance could not be stopped: {e}'
+            self._finish('completed', message, started)
+        except Exception as e:
+            if not switched:
+                # The old instance never stopped serving; just clean up the new one
+                try:
+                    self.stop_instance(port, service_fallback=False)
+                except Exception:
+                    pass
+            self._finish('failed', str(e), started)
+
+    def _finish(self, state: str, message: str, started: float):
+        self._set(state, message)
+        with self._lock:
+            self.status['finished_at'] = datetime.now().isoformat()
+        app_metrics.VLLM_RELOADS.inc(mode='blue_green', result=state)
+        app_metrics.VLLM_RELOAD_DURATION.observe(time.time() - started, mode='blue_green')
+
+    def launch(self, config: Dict, gpus: List[int] = None) -> subprocess.Popen:
+        """Write the config next to the instance log and start vLLM from the command built for it
+
+        gpus pins the instance to those devices (nvidia-smi indices) through
+        CUDA_VISIBLE_DEVICES, so it does not land on the live instance's GPUs.
+        """
+        from build_vllm_command import build_command
+
+        port = int(config['port'])
+        config_path = os.path.join(self.instance_dir, f'vllm_config_{port}.json')
+        log_path = os.path.join(self.instance_dir, f'vllm_{port}.log')
+        config_cache.write_json(config_path, config)
+
+        argv = shlex.split(build_command(config_path))
+        argv[0] = self.python
+        env = dict(os.environ)
+        if gpus is not None:
+            # PCI bus order makes CUDA's device numbering match nvidia-smi's indices
+            env['CUDA_DEVICE_ORDER'] = 'PCI_BUS_ID'
+            env['CUDA_VISIBLE_DEVICES'] = ','.join(str(gpu) for gpu in gpus)
+        with open(log_path, 'w') as log_file:
+            # New session so the whole process group (vLLM spawns workers) can be stopped
+            process = subprocess.Popen(argv, stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True,
+                                       env=env)
+        self._processes[port] = process
+
+        instances = self._instances()
+        instances[str(port)] = {'pid': process.pid, 'model': config.get('model'), 'gpus': gpus,
+                                'log_path': log_path, 'started_at': datetime.now().isoformat()}
+        self._save_instances(instances)
+        return process
+
+    def _log_tail(self, port: int, lines: int = 20) -> str:
+        try:
+            with open(os.path.join(self.instance_dir, f'vllm_{port}.log')) as f:
+                return ''.join(f.readlines()[-lines:]).strip()
+        except OSError:
+            return ''
+
+    def _wait_ready(self, base_url: str, process: subprocess.Popen, served_model: str):
+        """Poll /v1/models until it lists the model; raises if the process dies or the timeout passes"""
+        deadline = time.time() + self.ready_timeout
+        port = int(base_url.rsplit(':', 1)[1])
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f'New vLLM instance exited with code {process.returncode}: '
+                                   f'{self._log_tail(port)}')
+            try:
+                response = requests.get(f'{base_url}/v1/models', timeout=2)
+                if response.status_code == 200 and \
+                        any(m.get('id') == served_model for m in response.json().get('data', [])):
+                    return
+            except (requests.exceptions.RequestException, ValueError):
+                pass
+            time.sleep(2)
+        raise RuntimeError(f'New vLLM instance not ready after {self.ready_timeout:.0f}s')
+
+    def _warm_up(self, base_url: str, served_model: str):
+        """A few short completions so the first user requests do not pay for CUDA graph and cache warm-up"""
+        for _ in range(self.warmup_requests):
+            response = requests.post(f'{base_url}/v1/chat/completions', json={
+                'model': served_model,
+                'messages': [{'role': 'user', 'content': WARMUP_PROMPT}],
+                'max_tokens': 8,
+                'temperature': 0
+            }, timeout=120)
+            if response.status_code != 200:
+                raise RuntimeError(f'Warm-up request failed with HTTP {response.status_code}: {response.text[:200]}')
+
+    def stop_instance(self, port: int, service_fallback: bool = True, grace_seconds: float = 30):
+        """Stop the instance on a port: one started here by pid, otherwise the systemd service"""
+        instances = self._instances()
+        info = instances.pop(str(port), None)
+        if info is None:
+            if service_fallback:
+                result = subprocess.run(['systemctl', 'stop', self.service], capture_output=True, text=True,
+                                        timeout=60)
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr.strip() or f'systemctl stop {self.service} failed')
+            return
+
+        process = self._processes.pop(port, None)
+        pid = info['pid']
+
+        def alive():
+            # poll() reaps our own children, which would otherwise linger as zombies
+            return process.poll() is None if process is not None else pid_alive(pid)
+
+        try:
+            os.killpg(pid, signal.SIGTERM)
+            deadline = time.time() + grace_seconds
+            while alive() and time.time() < deadline:
+                time.sleep(0.5)
+            if alive():
+                os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        if process is not None:
+            process.wait()
+        self._save_instances(instances)
+
+    def stop_all(self):
+        """Stop every instance started here, before the service takes over again"""
+        for port in self._instances():
+            self.stop_instance(int(port), service_fallback=False)
@@ -0,0 +1,89 @@
+"""
+Stat-validated cache for the small config files the app reads on every request
+
+A file is re-parsed only when its mtime, inode or size changes, and our own
+writes go through a temp file + rename so concurrent readers always see
+either the old or the new file, never a half-written one.
+"""
+import copy
+import json
+import os
+import tempfile
+import threading
+
+_lock = threading.Lock()
+# path -> ((mtime_ns, inode, size), parsed value)
+_cache = {}
+
+
+def _signature(path: str):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def _read_cached(path: str, parse):
+    """Return the parsed file, re-reading only if it changed on disk.
+
+    Raises FileNotFoundError if the file does not exist.
+    """
+    signature = _signature(path)
+    with _lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    with open(path, 'r') as f:
+        value = parse(f)
+    with _lock:
+        _cache[path] = (signature, value)
+    return value
+
+
+def read_json(path: str):
+    """Load a JSON file through the cache; callers get their own copy to mutate"""
+    return copy.deepcopy(_read_cached(path, json.load))
+
+
+def read_text(path: str) -> str:
+    """Load a stripped text file through the cache"""
+    return _read_cached(path, lambda f: f.read().strip())
+
+
+def invalidate(path: str = None):
+    """Drop one cached file, or everything when path is None"""
+    with _lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
+
+
+def write_atomic(path: str, content: str, mode: int = None):
+    """Write content to path via a temp file in the same directory and rename it into place"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        if mode is not None:
+            os.fchmod(fd, mode)
+        elif os.path.exists(path):
+            # Keep the permissions of the file being replaced
+            os.fchmod(fd, os.stat(path).st_mode & 0o777)
+        else:
+            # mkstemp creates 0600 files; match what a plain open() would have made
+            umask = os.umask(0)
+            os.umask(umask)
+            os.fchmod(fd, 0o666 & ~umask)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    invalidate(path)
+
+
+def write_json(path: str, data, indent: int = 2):
+    write_atomic(path, json.dumps(data, indent=indent))
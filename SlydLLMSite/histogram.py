@@ -0,0 +1,99 @@
+"""
+Fixed-memory, mergeable latency histograms for benchmark results
+"""
+import math
+import numpy as np
+from typing import Dict
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram in the spirit of HdrHistogram.
+
+    Values are counted into buckets whose width grows geometrically, so every
+    recorded value is reproduced to within `precision` relative error while
+    memory stays fixed no matter how many samples are recorded. Histograms
+    with the same layout can be merged across clients, runs and processes.
+    """
+
+    def __init__(self, min_value: float = 1e-4, max_value: float = 3600.0, precision: float = 0.01):
+        if min_value <= 0 or max_value <= min_value:
+            raise ValueError("Histogram range must satisfy 0 < min_value < max_value")
+        self.min_value = min_value
+        self.max_value = max_value
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        num_buckets = int(math.ceil(math.log(max_value / min_value) / self._log_base)) + 1
+        self.counts = np.zeros(num_buckets, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        if value >= self.max_value:
+            return len(self.counts) - 1
+        return int(math.log(value / self.min_value) / self._log_base)
+
+    def _bucket_value(self, index: int) -> float:
+        """Representative (geometric midpoint) value of a bucket"""
+        return self.min_value * math.exp((index + 0.5) * self._log_base)
+
+    def record(self, value: float, count: int = 1):
+        self.counts[self._bucket(value)] += count
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def record_many(self, values):
+        """Record a batch of values in one vectorized pass"""
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return
+        scaled = np.log(np.maximum(values, self.min_value) / self.min_value) / self._log_base
+        indexes = np.clip(scaled.astype(np.int64), 0, len(self.counts) - 1)
+        np.add.at(self.counts, indexes, 1)
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add another histogram's samples into this one"""
+        if (other.min_value, other.max_value, other.precision) != (self.min_value, self.max_value, self.precision):
+            raise ValueError("Cannot merge histograms with different bucket layouts")
+        self.counts += other.counts
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, percent: float) -> float:
+        if self.count == 0:
+            return 0.0
+        # Rank of the requested sample, 1-based, matching nearest-rank percentiles
+        rank = max(1, int(math.ceil(percent / 100.0 * self.count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        # Exact extremes are tracked, so never report outside them
+        return min(max(self._bucket_value(index), self.min), self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def summary(self) -> Dict:
+        """Mean, min/max and tail percentiles in the shape the benchmark UI expects"""
+        if self.count == 0:
+            return {"mean": 0, "median": 0, "p95": 0, "p99": 0, "p999": 0, "min": 0, "max": 0}
+        return {
+            "mean": self.mean,
+            "median": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "min": self.min,
+            "max": self.max
+        }
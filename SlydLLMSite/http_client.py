@@ -0,0 +1,105 @@
+"""
+Shared, connection-pooled HTTP client for outbound calls from the Flask app
+
+One requests.Session is reused across requests and threads so calls to
+vLLM and the HuggingFace API ride on keep-alive connections instead of
+paying a fresh TCP handshake each time. Pools are bounded per host.
+"""
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledHTTPClient:
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 32,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0):
+        """
+        pool_connections is how many distinct hosts keep a pool; pool_maxsize is
+        the keep-alive connection cap per host. Callers beyond the cap wait for
+        a free connection rather than opening unbounded new sockets.
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self._adapters = {}
+        self.mount('http://', pool_maxsize)
+        self.mount('https://', pool_maxsize)
+
+        self._lock = threading.Lock()
+        self._host_stats = {}
+
+    def mount(self, prefix: str, maxsize: int):
+        """Use a dedicated pool with its own connection cap for URLs under prefix"""
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=maxsize, pool_block=True)
+        self.session.mount(prefix, adapter)
+        self._adapters[prefix] = adapter
+
+    def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+        start_time = time.time()
+        error = None
+        try:
+            return self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._record(host, time.time() - start_time, error)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, host: str, elapsed: float, error: str = None):
+        with self._lock:
+            stats = self._host_stats.setdefault(host, {
+                'requests': 0, 'errors': 0, 'total_time': 0.0, 'errors_by_type': {}
+            })
+            stats['requests'] += 1
+            stats['total_time'] += elapsed
+            if error:
+                stats['errors'] += 1
+                stats['errors_by_type'][error] = stats['errors_by_type'].get(error, 0) + 1
+
+    def stats(self) -> Dict:
+        """Per-host request counters plus live connection pool state"""
+        pools = {}
+        for prefix, adapter in self._adapters.items():
+            # poolmanager.pools is urllib3's container of per-host connection pools
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                pools[f'{key.key_scheme}://{key.key_host}:{key.key_port}'] = {
+                    'mounted_at': prefix,
+                    'maxsize': pool.pool.maxsize if pool.pool is not None else 0,
+                    # The queue is pre-filled with None placeholders; only count real sockets
+                    'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                    if pool.pool is not None else 0,
+                    'connections_opened': pool.num_connections,
+                    'requests_served': pool.num_requests
+                }
+
+        with self._lock:
+            hosts = {
+                host: dict(stats, errors_by_type=dict(stats['errors_by_type']),
+                           mean_time_ms=round(stats['total_time'] / stats['requests'] * 1000, 2))
+                for host, stats in self._host_stats.items()
+            }
+
+        return {
+            'pool_maxsize': self.pool_maxsize,
+            'timeout': {'connect': self.timeout[0], 'read': self.timeout[1]},
+            'hosts': hosts,
+            'pools': pools
+        }
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,286 @@
+"""
+GPU-free stand-in for the vLLM OpenAI server
+
+Serves /v1/models, /v1/chat/completions (streaming and non-streaming),
+/tokenize and a small /metrics page with a deterministic latency model, so
+the benchmark harness and the Flask app can be exercised and profiled on a
+CPU box. A request waits for one of max_num_seqs batch slots, pays
+prefill_per_token for each prompt token, then decode_per_token for each
+output token, slowed down as the batch fills up. Errors can be injected at
+a fixed rate.
+
+Usage:
+    python mock_vllm.py --port 5002 --model HuggingFaceTB/SmolLM3-3B
+    python mock_vllm.py --max-num-seqs 8 --decode-per-token 0.02 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Dict, List
+
+from aiohttp import web
+
+# Deterministic output text, one token per word
+OUTPUT_WORDS = ["the", "model", "is", "a", "mock", "and", "this", "text", "was", "generated", "by", "it"]
+
+# Chat template overhead per message (role markers and separators)
+TOKENS_PER_MESSAGE = 4
+
+
+def count_tokens(text: str) -> int:
+    """Whitespace tokenizer: one token per word"""
+    return len(text.split())
+
+
+def count_prompt_tokens(messages: List[Dict]) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            # OpenAI content parts; only text parts count
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        total += count_tokens(content) + TOKENS_PER_MESSAGE
+    return total
+
+
+class MockVLLMServer:
+    def __init__(self, model: str = "mock-model", max_model_len: int = 8192, max_num_seqs: int = 16,
+                 base_latency: float = 0.01, prefill_per_token: float = 0.0001, decode_per_token: float = 0.01,
+                 batch_slowdown: float = 0.02, default_output_tokens: int = 128, kv_cache_tokens: int = 65536,
+                 error_rate: float = 0.0, error_status: int = 500, abort_rate: float = 0.0, seed: int = None):
+        """
+        batch_slowdown is the fractional decode slowdown each additional running
+        sequence adds. Without ignore_eos a request generates
+        min(max_tokens, default_output_tokens) tokens. abort_rate is the share of
+        streams cut off half way through.
+        """
+        self.model = model
+        self.max_model_len = max_model_len
+        self.max_num_seqs = max_num_seqs
+        self.base_latency = base_latency
+        self.prefill_per_token = prefill_per_token
+        self.decode_per_token = decode_per_token
+        self.batch_slowdown = batch_slowdown
+        self.default_output_tokens = default_output_tokens
+        self.kv_cache_tokens = kv_cache_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.abort_rate = abort_rate
+        self.random = random.Random(seed)
+
+        self.created = int(time.time())
+        self._slots = None
+        self.running = 0
+        self.waiting = 0
+        self.kv_tokens_in_use = 0
+        self.counters = {
+            "request_success_total": 0,
+            "request_failure_total": 0,
+            "prompt_tokens_total": 0,
+            "generation_tokens_total": 0,
+            "num_preemptions_total": 0
+        }
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/v1/models', self.models)
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_post('/tokenize', self.tokenize)
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/metrics', self.metrics)
+        app.on_startup.append(self._on_startup)
+        return app
+
+    async def _on_startup(self, app: web.Application):
+        # Created on the serving loop so waiters queue in FIFO order on it
+        self._slots = asyncio.Semaphore(self.max_num_seqs)
+
+    @staticmethod
+    def error_response(message: str, status: int, error_type: str = "BadRequestError") -> web.Response:
+        return web.json_response({"object": "error", "message": message, "type": error_type, "code": status},
+                                 status=status)
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "object": "list",
+            "data": [{
+                "id": self.model,
+                "object": "model",
+                "created": self.created,
+                "owned_by": "vllm",
+                "root": self.model,
+                "max_model_len": self.max_model_len
+            }]
+        })
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.Response(status=200)
+
+    async def tokenize(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if "messages" in body:
+            count = count_prompt_tokens(body["messages"])
+        else:
+            count = count_tokens(body.get("prompt", ""))
+        return web.json_response({"count": count, "max_model_len": self.max_model_len})
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """A subset of vLLM's Prometheus gauges and counters"""
+        labels = f'{{model_name="{self.model}"}}'
+        lines = [
+            f"vllm:num_requests_running{labels} {self.running}",
+            f"vllm:num_requests_waiting{labels} {self.waiting}",
+            f"vllm:gpu_cache_usage_perc{labels} {min(1.0, self.kv_tokens_in_use / self.kv_cache_tokens)}"
+        ]
+        lines += [f"vllm:{name}{labels} {value}" for name, value in self.counters.items()]
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+    def _decode_delay(self) -> float:
+        return self.decode_per_token * (1 + self.batch_slowdown * max(0, self.running - 1))
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return self.error_response("Invalid JSON body", 400)
+
+        if body.get("model") != self.model:
+            return self.error_response(f"The model `{body.get('model')}` does not exist.", 404, "NotFoundError")
+        messages = body.get("messages") or []
+        if not messages:
+            return self.error_response("messages must not be empty", 400)
+
+        prompt_tokens = count_prompt_tokens(messages)
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens") or self.max_model_len - prompt_tokens
+        if prompt_tokens + max_tokens > self.max_model_len:
+            return self.error_response(
+                f"This model's maximum context length is {self.max_model_len} tokens. However, you requested "
+                f"{prompt_tokens + max_tokens} tokens ({prompt_tokens} in the messages, {max_tokens} in the "
+                f"completion).", 400)
+
+        if self.random.random() < self.error_rate:
+            self.counters["request_failure_total"] += 1
+            return self.error_response("Injected error", self.error_status, "InternalServerError")
+
+        completion_tokens = max_tokens if body.get("ignore_eos") else min(max_tokens, self.default_output_tokens)
+        request_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.kv_tokens_in_use += prompt_tokens + completion_tokens
+        try:
+            await asyncio.sleep(self.base_latency + prompt_tokens * self.prefill_per_token)
+            if body.get("stream"):
+                return await self._stream(request, body, request_id, prompt_tokens, completion_tokens)
+
+            for _ in range(completion_tokens):
+                await asyncio.sleep(self._decode_delay())
+            self._record_success(prompt_tokens, completion_tokens)
+            return web.json_response({
+                "id": request_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": self.model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self._text(completion_tokens)},
+                    "finish_reason": "length" if completion_tokens == max_tokens else "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            })
+        finally:
+            self.running -= 1
+            self.kv_tokens_in_use -= prompt_tokens + completion_tokens
+            self._slots.release()
+
+    async def _stream(self, request: web.Request, body: Dict, request_id: str, prompt_tokens: int,
+                      completion_tokens: int) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        created = int(time.time())
+
+        async def send(choices: List[Dict], usage: Dict = None):
+            chunk = {"id": request_id, "object": "chat.completion.chunk", "created": created,
+                     "model": self.model, "choices": choices}
+            if usage is not None:
+                chunk["usage"] = usage
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        # vLLM opens with an empty role delta before the first token
+        await send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        abort_at = completion_tokens // 2 if self.random.random() < self.abort_rate else None
+        for i in range(completion_tokens):
+            if i == abort_at:
+                self.counters["request_failure_total"] += 1
+                # Drop the connection mid-stream, as a crashed or restarted server would
+                request.transport.close()
+                return response
+            if i > 0:
+                await asyncio.sleep(self._decode_delay())
+            await send([{"index": 0, "delta": {"content": OUTPUT_WORDS[i % len(OUTPUT_WORDS)] + " "},
+                         "finish_reason": None}])
+
+        await send([{"index": 0, "delta": {}, "finish_reason": "length" if completion_tokens == body.get("max_tokens")
+                     else "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send([], {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        self._record_success(prompt_tokens, completion_tokens)
+        return response
+
+    def _record_success(self, prompt_tokens: int, completion_tokens: int):
+        self.counters["request_success_total"] += 1
+        self.counters["prompt_tokens_total"] += prompt_tokens
+        self.counters["generation_tokens_total"] += completion_tokens
+
+    @staticmethod
+    def _text(num_tokens: int) -> str:
+        return " ".join(OUTPUT_WORDS[i % len(OUTPUT_WORDS)] for i in range(num_tokens))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock vLLM OpenAI server for GPU-free testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5002)
+    parser.add_argument('--model', default='mock-model', help='Model id to serve')
+    parser.add_argument('--max-model-len', type=int, default=8192)
+    parser.add_argument('--max-num-seqs', type=int, default=16, help='Concurrent batch slots; the rest queue')
+    parser.add_argument('--base-latency', type=float, default=0.01, help='Fixed per-request overhead (s)')
+    parser.add_argument('--prefill-per-token', type=float, default=0.0001, help='Seconds per prompt token')
+    parser.add_argument('--decode-per-token', type=float, default=0.01, help='Seconds per output token')
+    parser.add_argument('--batch-slowdown', type=float, default=0.02,
+                        help='Fractional decode slowdown per extra running sequence')
+    parser.add_argument('--default-output-tokens', type=int, default=128,
+                        help='Output length when ignore_eos is not set')
+    parser.add_argument('--kv-cache-tokens', type=int, default=65536, help='KV capacity behind gpu_cache_usage_perc')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status for injected errors')
+    parser.add_argument('--abort-rate', type=float, default=0.0, help='Share of streams cut off mid-response')
+    parser.add_argument('--seed', type=int, help='Seed for error injection')
+    args = parser.parse_args()
+
+    server = MockVLLMServer(
+        model=args.model, max_model_len=args.max_model_len, max_num_seqs=args.max_num_seqs,
+        base_latency=args.base_latency, prefill_per_token=args.prefill_per_token,
+        decode_per_token=args.decode_per_token, batch_slowdown=args.batch_slowdown,
+        default_output_tokens=args.default_output_tokens, kv_cache_tokens=args.kv_cache_tokens,
+        error_rate=args.error_rate, error_status=args.error_status, abort_rate=args.abort_rate, seed=args.seed)
+    print(f"Mock vLLM serving {args.model} on http://{args.host}:{args.port}")
+    web.run_app(server.create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Exact-match cache for deterministic chat and completion responses
+
+Internal tools often resend the same temperature-0 request. When a request's
+output is fully determined by its model, prompt and sampling parameters, the
+response body is cached under a hash of those fields: first in a
+memory-bounded LRU with a TTL, optionally backed by a SQLite file that
+survives restarts. Anything sampled at random is never cached.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import app_metrics
+
+# Fields that change how a response is delivered, not what it contains
+TRANSPORT_FIELDS = {'stream', 'stream_options', 'user'}
+
+
+def is_deterministic(payload: Dict) -> bool:
+    """Greedy decoding (temperature 0) or a fixed seed, with a single choice"""
+    if not isinstance(payload, dict) or payload.get('n', 1) != 1:
+        return False
+    return payload.get('temperature') == 0 or payload.get('seed') is not None
+
+
+def cache_key(payload: Dict, route: str) -> str:
+    """Canonical hash of the route, model, prompt and every sampling parameter.
+    
+    Routes answer the same body with differently shaped responses, so each
+    route gets its own entries.
+    """
+    canonical = {k: v for k, v in payload.items() if k not in TRANSPORT_FIELDS}
+    return hashlib.sha256(json.dumps([route, canonical], sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600.0, disk_path: str = None):
+        """
+        max_bytes bounds the memory tier by response size; least recently used
+        entries are evicted first. Entries older than ttl seconds are dropped
+        from both tiers on lookup.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._lock = threading.Lock()
+        # key -> (expires_at, model, body)
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.counts = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0,
+                       'evictions': 0, 'expired': 0}
+        if disk_path:
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        expires_at REAL NOT NULL,
+                        body BLOB NOT NULL
+                    )
+                ''')
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per call keeps this safe to use from any Flask thread
+        conn = sqlite3.connect(self.disk_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+        app_metrics.RESPONSE_CACHE_LOOKUPS.inc(result=outcome)
+
+    def get(self, payload: Dict, route: str) -> Optional[bytes]:
+        """Cached response body for a deterministic request to route, or None"""
+        if not is_deterministic(payload):
+            self._count('bypassed')
+            return None
+        key = cache_key(payload, route)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                else:
+                    self._drop(key)
+                    self.counts['expired'] += 1
+                    entry = None
+        if entry is not None:
+            self._count('memory_hits')
+            return entry[2]
+
+        if self.disk_path:
+            with self._connect() as conn:
+                row = conn.execute('SELECT model, expires_at, body FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is not None and row[1] <= now:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    row = None
+            if row is not None:
+                # Promote so repeats are served from memory
+                self._store_memory(key, row[0], row[2], row[1])
+                self._count('disk_hits')
+                return row[2]
+
+        self._count('misses')
+        return None
+
+    def put(self, payload: Dict, body: bytes, route: str):
+        """Cache a successful response body for a deterministic request to route"""
+        if not is_deterministic(payload):
+            return
+        key = cache_key(payload, route)
+        model = str(payload.get('model', ''))
+        expires_at = time.time() + self.ttl
+        self._store_memory(key, model, body, expires_at)
+        if self.disk_path:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO responses (key, model, expires_at, body) VALUES (?, ?, ?, ?)',
+                             (key, model, expires_at, body))
+        with self._lock:
+            self.counts['stores'] += 1
+
+    def _store_memory(self, key: str, model: str, body: bytes, expires_at: float):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (expires_at, model, body)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.counts['evictions'] += 1
+        app_metrics.RESPONSE_CACHE_BYTES.set(self.bytes)
+
+    def _drop(self, key: str):
+        """Remove a memory entry; caller holds the lock"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[2])
+
+    def invalidate(self, model: str = None) -> int:
+        """Drop every entry, or only those for one model; returns how many memory entries went"""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if model is None or e[1] == model]
+            for key in keys:
+                self._drop(key)
+        app_metrics.RESPONSE_CACHE_BYTES.set(self.bytes)
+        if self.disk_path:
+            with self._connect() as conn:
+                if model is None:
+                    conn.execute('DELETE FROM responses')
+                else:
+                    conn.execute('DELETE FROM responses WHERE model = ?', (model,))
+        return len(keys)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.counts, entries=len(self._entries), bytes=self.bytes, max_bytes=self.max_bytes,
+                         ttl=self.ttl, disk_path=self.disk_path)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else None
+        if self.disk_path:
+            with self._connect() as conn:
+                row = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM responses').fetchone()
+            stats['disk_entries'], stats['disk_bytes'] = row
+        return stats
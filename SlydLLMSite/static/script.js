@@ -121,7 +121,10 @@ async function restartService() {
 
         const data = await response.json();
 
-        if (data.success) {
+        if (data.success && data.mode === 'blue_green') {
+            statusDiv.textContent = 'Starting a new vLLM instance; the current one keeps serving until it is ready...';
+            pollReloadStatus();
+        } else if (data.success) {
             showStatus(statusDiv, '✓ Service restarted successfully', 'success');
             setTimeout(() => {
                 checkServiceStatus();
@@ -134,6 +137,29 @@ async function restartService() {
     }
 }
 
+// Follow a blue-green reload until the new instance serves traffic or the reload fails
+async function pollReloadStatus() {
+    const statusDiv = document.getElementById('service-status');
+
+    try {
+        const response = await fetch(`${window.API_BASE}/reload-status`);
+        const data = await response.json();
+        const reload = data.reload;
+
+        if (reload.running) {
+            statusDiv.textContent = reload.message || 'Reloading...';
+            statusDiv.style.display = 'block';
+            setTimeout(pollReloadStatus, 5000);
+        } else if (reload.state === 'completed') {
+            showStatus(statusDiv, '✓ Reloaded without downtime: ' + reload.message, 'success');
+        } else {
+            showStatus(statusDiv, '✗ Reload failed, the previous instance is still serving: ' + reload.message, 'error');
+        }
+    } catch (error) {
+        showStatus(statusDiv, '✗ Error checking reload status: ' + error.message, 'error');
+    }
+}
+
 // Check service status
 async function checkServiceStatus() {
     const statusDiv = document.getElementById('service-status');
@@ -301,7 +327,7 @@ function toggleLoraOptions() {
     }
 }
 
-// Send chat message to vLLM
+// Send chat message to vLLM, rendering tokens as they stream in
 async function sendChatMessage() {
     const prompt = document.getElementById('chat-prompt').value.trim();
     
@@ -310,13 +336,18 @@ async function sendChatMessage() {
         return;
     }
     
+    const responseDiv = document.getElementById('chat-response');
+    const responseText = document.getElementById('chat-response-text');
+    const loadingDiv = document.getElementById('chat-loading');
+    
     // Hide previous results and errors
-    document.getElementById('chat-response').style.display = 'none';
+    responseDiv.style.display = 'none';
+    responseText.textContent = '';
     document.getElementById('chat-metrics').style.display = 'none';
     document.getElementById('chat-error').style.display = 'none';
     
-    // Show loading
-    document.getElementById('chat-loading').style.display = 'flex';
+    // Show loading until the first token arrives
+    loadingDiv.style.display = 'flex';
     
     try {
         const response = await fetch(`${window.API_BASE}/chat-completion`, {
@@ -327,47 +358,73 @@ async function sendChatMessage() {
             body: JSON.stringify({ 
                 prompt: prompt,
                 max_tokens: 512,
-                temperature: 0.7
+                temperature: 0.7,
+                stream: true
             })
         });
         
-        const data = await response.json();
+        // Validation errors come back as plain JSON rather than a stream
+        if (!(response.headers.get('Content-Type') || '').includes('text/event-stream')) {
+            const data = await response.json();
+            loadingDiv.style.display = 'none';
+            showChatError(data.message, data.details);
+            return;
+        }
         
-        // Hide loading
-        document.getElementById('chat-loading').style.display = 'none';
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
         
-        if (data.success) {
-            // Show response
-            document.getElementById('chat-response-text').textContent = data.response;
-            document.getElementById('chat-response').style.display = 'block';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
             
-            // Show metrics
-            const metrics = data.metrics;
-            document.getElementById('metric-latency').textContent = `${metrics.latency_ms} ms`;
-            document.getElementById('metric-throughput').textContent = `${metrics.throughput_tps} tokens/sec`;
-            document.getElementById('metric-prompt-tokens').textContent = metrics.prompt_tokens;
-            document.getElementById('metric-completion-tokens').textContent = metrics.completion_tokens;
-            document.getElementById('metric-total-tokens').textContent = metrics.total_tokens;
-            document.getElementById('metric-time').textContent = `${metrics.time_seconds} seconds`;
-            document.getElementById('chat-metrics').style.display = 'block';
-        } else {
-            // Show error
-            const errorDiv = document.getElementById('chat-error');
-            errorDiv.textContent = `Error: ${data.message}`;
-            if (data.details) {
-                errorDiv.textContent += ` - ${data.details}`;
+            // SSE frames are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                if (!frame.startsWith('data:')) continue;
+                
+                const event = JSON.parse(frame.slice(5));
+                if (event.type === 'token') {
+                    loadingDiv.style.display = 'none';
+                    responseDiv.style.display = 'block';
+                    responseText.textContent += event.content;
+                } else if (event.type === 'metrics') {
+                    showChatMetrics(event.metrics);
+                } else if (event.type === 'error') {
+                    showChatError(event.message, event.details);
+                }
             }
-            errorDiv.style.display = 'block';
         }
+        loadingDiv.style.display = 'none';
     } catch (error) {
-        // Hide loading
-        document.getElementById('chat-loading').style.display = 'none';
-        
-        // Show error
-        const errorDiv = document.getElementById('chat-error');
-        errorDiv.textContent = `Error: ${error.message}`;
-        errorDiv.style.display = 'block';
+        loadingDiv.style.display = 'none';
+        showChatError(error.message);
+    }
+}
+
+function showChatMetrics(metrics) {
+    document.getElementById('metric-latency').textContent = `${metrics.latency_ms} ms`;
+    document.getElementById('metric-ttft').textContent = `${metrics.ttft_ms} ms`;
+    document.getElementById('metric-itl').textContent = `${metrics.itl_mean_ms} ms (p95 ${metrics.itl_p95_ms} ms)`;
+    document.getElementById('metric-throughput').textContent = `${metrics.throughput_tps} tokens/sec`;
+    document.getElementById('metric-prompt-tokens').textContent = metrics.prompt_tokens;
+    document.getElementById('metric-completion-tokens').textContent = metrics.completion_tokens;
+    document.getElementById('metric-total-tokens').textContent = metrics.total_tokens;
+    document.getElementById('metric-time').textContent = `${metrics.time_seconds} seconds`;
+    document.getElementById('chat-metrics').style.display = 'block';
+}
+
+function showChatError(message, details) {
+    const errorDiv = document.getElementById('chat-error');
+    errorDiv.textContent = `Error: ${message}`;
+    if (details) {
+        errorDiv.textContent += ` - ${details}`;
     }
+    errorDiv.style.display = 'block';
 }
 
 // Clear chat interface
@@ -383,6 +440,8 @@ function clearChat() {
 async function runBenchmark(testType) {
     // Hide previous results and errors
     document.getElementById('benchmark-results').style.display = 'none';
+    document.getElementById('benchmark-heatmaps').innerHTML = '';
+    document.getElementById('benchmark-charts').innerHTML = '';
     document.getElementById('benchmark-error').style.display = 'none';
     
     // Show loading
@@ -395,6 +454,10 @@ async function runBenchmark(testType) {
         'quick': 'Running quick latency test...',
         'standard': 'Running standard benchmark suite...',
         'full': 'Running comprehensive benchmark tests...',
+        'streaming': 'Running streaming latency test...',
+        'rate_sweep': 'Sweeping open-loop request rates...',
+        'length_sweep': 'Sweeping prompt and output lengths...',
+        'prefix_cache': 'Comparing shared-prefix workload with and without cache reuse...',
         'stress': 'Running stress test to find limits...'
     };
     loadingText.textContent = testMessages[testType] || 'Running benchmark tests...';
@@ -410,32 +473,98 @@ async function runBenchmark(testType) {
         
         const data = await response.json();
         
-        // Hide loading
-        loadingDiv.style.display = 'none';
-        
         if (data.success) {
-            // Format and display results
-            const results = data.results;
-            const resultsContent = document.getElementById('benchmark-results-content');
-            resultsContent.textContent = formatBenchmarkResults(results);
-            document.getElementById('benchmark-results').style.display = 'block';
+            followBenchmarkJob(data.job_id);
         } else {
-            // Show error
-            const errorDiv = document.getElementById('benchmark-error');
-            errorDiv.textContent = `Error: ${data.message}`;
-            errorDiv.style.display = 'block';
+            loadingDiv.style.display = 'none';
+            showBenchmarkError(data.message);
         }
     } catch (error) {
-        // Hide loading
         loadingDiv.style.display = 'none';
-        
-        // Show error
-        const errorDiv = document.getElementById('benchmark-error');
-        errorDiv.textContent = `Error: ${error.message}`;
-        errorDiv.style.display = 'block';
+        showBenchmarkError(error.message);
     }
 }
 
+// Follow a background benchmark job, rendering results as each test finishes
+function followBenchmarkJob(jobId) {
+    const loadingDiv = document.getElementById('benchmark-loading');
+    const loadingText = document.getElementById('benchmark-loading-text');
+    const resultsDiv = document.getElementById('benchmark-results');
+    const resultsContent = document.getElementById('benchmark-results-content');
+    let partialResults = null;
+    
+    const source = new EventSource(`${window.API_BASE}/benchmark-jobs/${jobId}/events`);
+    
+    source.onmessage = function(message) {
+        const event = JSON.parse(message.data);
+        const data = event.data;
+        
+        switch (event.event) {
+            case 'job_queued':
+                loadingText.textContent = 'Waiting for earlier benchmark jobs to finish...';
+                break;
+            case 'job_started':
+                partialResults = { timestamp: new Date().toISOString(), model: '', tests: {} };
+                break;
+            case 'test_started':
+                loadingText.textContent = `Running ${data.test} test...`;
+                break;
+            case 'stress_level':
+                loadingText.textContent = `Stress test: ${data.concurrent_clients} clients, ${data.success_rate.toFixed(1)}% success, ${data.requests_per_second.toFixed(2)} req/s`;
+                break;
+            case 'rate_level':
+                loadingText.textContent = `Load sweep: ${data.offered_rate} req/s offered, ${data.achieved_rate.toFixed(2)} req/s achieved`;
+                break;
+            case 'length_cell':
+                loadingText.textContent = `Length sweep: ${data.input_length} in x ${data.output_length} out, TTFT ${(data.ttft * 1000).toFixed(0)}ms, decode ${data.decode_tokens_per_second.toFixed(1)} tokens/sec`;
+                break;
+            case 'prefix_cache_pass':
+                loadingText.textContent = `Prefix cache test: ${data.pass.replace('_', ' ')} pass done, ${data.tokens_per_second.toFixed(1)} tokens/sec`;
+                break;
+            case 'test_completed':
+                if (partialResults) {
+                    partialResults.tests[data.test] = data.result || { error: 'Unknown test' };
+                    resultsContent.textContent = formatBenchmarkResults(partialResults);
+                    renderLengthSweepHeatmaps(partialResults.tests.length_sweep);
+                    renderServerMetricsCharts(partialResults);
+                    resultsDiv.style.display = 'block';
+                }
+                break;
+            case 'job_completed':
+                source.close();
+                loadingDiv.style.display = 'none';
+                resultsContent.textContent = formatBenchmarkResults(data.results);
+                renderLengthSweepHeatmaps(data.results.tests.length_sweep);
+                renderServerMetricsCharts(data.results);
+                resultsDiv.style.display = 'block';
+                loadBenchmarkHistory();
+                break;
+            case 'job_failed':
+                source.close();
+                loadingDiv.style.display = 'none';
+                showBenchmarkError(data.error);
+                break;
+        }
+    };
+    
+    source.onerror = function() {
+        // EventSource reconnects on its own; only give up if the job is gone
+        fetch(`${window.API_BASE}/benchmark-jobs/${jobId}`).then(response => {
+            if (response.status === 404) {
+                source.close();
+                loadingDiv.style.display = 'none';
+                showBenchmarkError('Benchmark job no longer exists');
+            }
+        }).catch(() => {});
+    };
+}
+
+function showBenchmarkError(message) {
+    const errorDiv = document.getElementById('benchmark-error');
+    errorDiv.textContent = `Error: ${message}`;
+    errorDiv.style.display = 'block';
+}
+
 // Format benchmark results for display
 function formatBenchmarkResults(results) {
     let output = [];
@@ -459,6 +588,7 @@ function formatBenchmarkResults(results) {
             output.push(`  Median: ${testResult.latency.median.toFixed(2)}`);
             output.push(`  P95:    ${testResult.latency.p95.toFixed(2)}`);
             output.push(`  P99:    ${testResult.latency.p99.toFixed(2)}`);
+            output.push(`  P99.9:  ${testResult.latency.p999.toFixed(2)}`);
             output.push(`  Min:    ${testResult.latency.min.toFixed(2)}`);
             output.push(`  Max:    ${testResult.latency.max.toFixed(2)}`);
             output.push(`\nThroughput:`);
@@ -467,6 +597,92 @@ function formatBenchmarkResults(results) {
             output.push(`  Total Tokens: ${testResult.throughput.total_tokens}`);
         }
         
+        if (testName === 'streaming') {
+            output.push(`Concurrent Clients: ${testResult.num_concurrent_clients}`);
+            output.push(`Total Requests: ${testResult.total_requests} | Success: ${testResult.successful_requests}`);
+            output.push(`Success Rate: ${testResult.success_rate.toFixed(1)}%`);
+            const streamMetrics = [
+                ['Time to First Token (ms)', testResult.time_to_first_token],
+                ['Inter-Token Latency (ms)', testResult.inter_token_latency],
+                ['Time per Output Token (ms)', testResult.time_per_output_token]
+            ];
+            for (const [label, dist] of streamMetrics) {
+                output.push(`\n${label}:`);
+                output.push(`  Mean:   ${(dist.mean * 1000).toFixed(2)}`);
+                output.push(`  Median: ${(dist.median * 1000).toFixed(2)}`);
+                output.push(`  P95:    ${(dist.p95 * 1000).toFixed(2)}`);
+                output.push(`  P99:    ${(dist.p99 * 1000).toFixed(2)}`);
+            }
+            output.push(`\nThroughput:`);
+            output.push(`  Mean: ${testResult.throughput.mean_tokens_per_second.toFixed(1)} tokens/sec`);
+            output.push(`  Aggregate: ${testResult.throughput.aggregate_tokens_per_second.toFixed(1)} tokens/sec`);
+        }
+        
+        if (testName === 'rate_sweep') {
+            output.push(`Arrival Pattern: ${testResult.arrival} | ${testResult.duration_per_rate}s per rate`);
+            output.push(`Max Sustained Rate: ${testResult.max_sustained_rate} req/s`);
+            output.push(`Peak Goodput: ${testResult.peak_goodput.toFixed(2)} req/s within SLO`);
+            output.push(`\nLatency vs Offered Load:`);
+            for (const level of testResult.results_by_rate) {
+                output.push(`  ${level.offered_rate} req/s offered: ${level.achieved_rate.toFixed(2)} req/s achieved, ${level.goodput.toFixed(2)} req/s goodput, ${level.success_rate.toFixed(1)}% success, p95 ${(level.p95_latency * 1000).toFixed(0)}ms, p95 TTFT ${(level.p95_ttft * 1000).toFixed(0)}ms`);
+            }
+        }
+        
+        if (testName === 'prefix_cache') {
+            const workload = testResult.workload;
+            output.push(`Workload: ${workload.num_requests} requests, ~${workload.prefix_tokens}-token prefix, ${(workload.share_ratio * 100).toFixed(0)}% shared across ${workload.num_prefixes} prefixes`);
+            if (testResult.prefix_caching_enabled !== null) {
+                output.push(`enable_prefix_caching: ${testResult.prefix_caching_enabled}`);
+            }
+            for (const [label, pass] of [['Cache reuse defeated', testResult.cache_off], ['Shared prefixes', testResult.cache_on]]) {
+                output.push(`\n${label}:`);
+                output.push(`  TTFT Median: ${(pass.time_to_first_token.median * 1000).toFixed(2)}ms | P95: ${(pass.time_to_first_token.p95 * 1000).toFixed(2)}ms`);
+                output.push(`  Shared-Prefix TTFT Median: ${(pass.shared_prefix_ttft.median * 1000).toFixed(2)}ms`);
+                output.push(`  Throughput: ${pass.tokens_per_second.toFixed(1)} tokens/sec | ${pass.requests_per_second.toFixed(2)} req/s`);
+            }
+            const sign = value => (value > 0 ? '+' : '') + value.toFixed(1) + '%';
+            output.push(`\nDelta with cache reuse:`);
+            output.push(`  TTFT Median: ${sign(testResult.ttft_median_delta_pct)} | P95: ${sign(testResult.ttft_p95_delta_pct)}`);
+            output.push(`  Shared-Prefix TTFT Median: ${sign(testResult.shared_prefix_ttft_median_delta_pct)}`);
+            output.push(`  Throughput: ${sign(testResult.throughput_delta_pct)}`);
+            output.push(`  Prefix caching effective: ${testResult.cache_effective ? 'Yes' : 'No'}`);
+        }
+        
+        if (testName === 'length_sweep') {
+            output.push(`Grid: ${testResult.input_lengths.length} input x ${testResult.output_lengths.length} output lengths, ${testResult.requests_per_cell} requests per cell`);
+            if (testResult.max_model_len) {
+                output.push(`Cells beyond max_model_len (${testResult.max_model_len}) skipped`);
+            }
+            if (testResult.timed_out_requests || testResult.failed_requests) {
+                output.push(`Timed out: ${testResult.timed_out_requests} | Other errors: ${testResult.failed_requests}`);
+            }
+            output.push(`\nInput x Output: TTFT | prefill tokens/sec | decode tokens/sec`);
+            for (const row of testResult.cells) {
+                for (const cell of row) {
+                    if (!cell) continue;
+                    if (cell.error) {
+                        output.push(`  ${cell.input_length} x ${cell.output_length}: ${cell.error} (${cell.timeouts} timed out after ${cell.timeout.toFixed(0)}s, ${cell.errors} errors)`);
+                        continue;
+                    }
+                    output.push(`  ${cell.input_length} x ${cell.output_length}: ${(cell.ttft * 1000).toFixed(0)}ms | ${cell.prefill_tokens_per_second.toFixed(0)} | ${cell.decode_tokens_per_second.toFixed(1)}`);
+                }
+            }
+        }
+        
+        if (testName === 'replay') {
+            output.push(`Trace: ${testResult.trace_path} (${testResult.time_scale}x speed)`);
+            output.push(`Total Requests: ${testResult.total_requests} | Success: ${testResult.successful_requests}`);
+            output.push(`Success Rate: ${testResult.success_rate.toFixed(1)}%`);
+            output.push(`\nLatency (ms):`);
+            output.push(`  Median: ${(testResult.latency.median * 1000).toFixed(2)}`);
+            output.push(`  P95:    ${(testResult.latency.p95 * 1000).toFixed(2)}`);
+            output.push(`  P99:    ${(testResult.latency.p99 * 1000).toFixed(2)}`);
+            output.push(`  P95 TTFT: ${(testResult.time_to_first_token.p95 * 1000).toFixed(2)}`);
+            output.push(`\nPerformance:`);
+            output.push(`  Requests/sec: ${testResult.requests_per_second.toFixed(2)}`);
+            output.push(`  Tokens/sec: ${testResult.tokens_per_second.toFixed(1)}`);
+        }
+        
         if (testName === 'concurrent') {
             output.push(`Concurrent Clients: ${testResult.num_concurrent_clients}`);
             output.push(`Requests per Client: ${testResult.requests_per_client}`);
@@ -477,6 +693,7 @@ function formatBenchmarkResults(results) {
             output.push(`  Median: ${testResult.latency_under_load.median.toFixed(2)}`);
             output.push(`  P95:    ${testResult.latency_under_load.p95.toFixed(2)}`);
             output.push(`  P99:    ${testResult.latency_under_load.p99.toFixed(2)}`);
+            output.push(`  P99.9:  ${testResult.latency_under_load.p999.toFixed(2)}`);
             output.push(`\nThroughput Under Load:`);
             output.push(`  Mean: ${testResult.throughput_under_load.mean_tokens_per_second.toFixed(1)} tokens/sec`);
             output.push(`  Aggregate: ${testResult.throughput_under_load.aggregate_tokens_per_second.toFixed(1)} tokens/sec`);
@@ -496,7 +713,8 @@ function formatBenchmarkResults(results) {
         
         if (testName === 'stress') {
             output.push(`Maximum Concurrent Tested: ${testResult.max_concurrent_tested}`);
-            output.push(`Optimal Concurrent Clients: ${testResult.optimal_concurrent} (${testResult.peak_throughput.toFixed(2)} req/s peak)`);
+            output.push(`Optimal Concurrent Clients: ${testResult.optimal_concurrent} (${testResult.peak_goodput.toFixed(2)} req/s goodput)`);
+            output.push(`Peak Throughput: ${testResult.peak_throughput.toFixed(2)} req/s (including SLO misses)`);
             output.push(`Max Sustainable Load: ${testResult.max_sustainable_load} concurrent clients`);
             if (testResult.degradation_point) {
                 output.push(`Performance Degradation Point: ${testResult.degradation_point} concurrent clients`);
@@ -510,7 +728,11 @@ function formatBenchmarkResults(results) {
                 else if (load.success_rate < 95) marker = ' ⚠️';
                 else if (load.success_rate === 100) marker = ' ✅';
                 
-                output.push(`  ${load.concurrent_clients} clients: ${load.success_rate.toFixed(1)}% success, ${load.mean_latency.toFixed(2)}ms mean, ${load.requests_per_second.toFixed(2)} req/s${marker}`);
+                output.push(`  ${load.concurrent_clients} clients: ${load.success_rate.toFixed(1)}% success, ${load.mean_latency.toFixed(2)}ms mean, ${load.requests_per_second.toFixed(2)} req/s, ${load.goodput.toFixed(2)} req/s goodput${marker}`);
+                if (load.server && load.server.waiting) {
+                    const kv = load.server.kv_cache_usage ? `, KV ${(load.server.kv_cache_usage.max * 100).toFixed(0)}%` : '';
+                    output.push(`    └─ Server: ${load.server.running.max} running, ${load.server.waiting.max} waiting${kv}`);
+                }
                 
                 if (load.failed_requests > 0) {
                     output.push(`    └─ Failed requests: ${load.failed_requests}`);
@@ -523,9 +745,231 @@ function formatBenchmarkResults(results) {
                 output.push(`  Suggested Max Workers: ${testResult.recommendations.suggested_max_workers}`);
                 output.push(`  Note: ${testResult.recommendations.note}`);
             }
+            
+            const saturation = testResult.saturation;
+            if (saturation && saturation.knee_concurrency) {
+                output.push(`\n🔎 Saturation:`);
+                output.push(`  Latency knee at ${saturation.knee_concurrency} clients, limited by ${saturation.limited_by || 'unknown'}`);
+                const evidence = saturation.evidence || {};
+                if (evidence.kv_cache_usage_peak !== null && evidence.kv_cache_usage_peak !== undefined) {
+                    output.push(`  KV cache peak: ${(evidence.kv_cache_usage_peak * 100).toFixed(1)}% | Waiting peak: ${evidence.waiting_peak} | Running peak: ${evidence.running_peak} | Preemptions: ${evidence.preemptions}`);
+                }
+                output.push(`  ${saturation.note}`);
+            }
+        }
+        
+        if (testResult.goodput !== undefined) {
+            output.push(...formatGoodput(testResult));
+        }
+        
+        const serverSummary = testResult.server_metrics && testResult.server_metrics.summary;
+        if (serverSummary) {
+            output.push(`\nServer (/metrics):`);
+            if (serverSummary.running) output.push(`  Running: peak ${serverSummary.running.max} | Waiting: peak ${serverSummary.waiting.max}`);
+            if (serverSummary.kv_cache_usage) output.push(`  KV Cache Usage: peak ${(serverSummary.kv_cache_usage.max * 100).toFixed(1)}%`);
+            if (serverSummary.preemptions !== undefined) output.push(`  Preemptions: ${serverSummary.preemptions}`);
+            if (serverSummary.prefill_time) output.push(`  Mean Prefill Time: ${(serverSummary.prefill_time.mean * 1000).toFixed(1)}ms`);
+            if (serverSummary.decode_time) output.push(`  Mean Decode Time: ${(serverSummary.decode_time.mean * 1000).toFixed(1)}ms`);
+        }
+    }
+    
+    return output.join('\n');
+}
+
+// Render each length sweep metric matrix as a colour-scaled table (input rows x output columns)
+function renderLengthSweepHeatmaps(testResult) {
+    const container = document.getElementById('benchmark-heatmaps');
+    container.innerHTML = '';
+    if (!testResult || testResult.error) {
+        return;
+    }
+    
+    const metrics = [
+        ['ttft', 'Time to First Token (ms)', value => (value * 1000).toFixed(0), false],
+        ['prefill_tokens_per_second', 'Prefill Tokens/sec', value => value.toFixed(0), true],
+        ['decode_tokens_per_second', 'Decode Tokens/sec', value => value.toFixed(1), true]
+    ];
+    
+    for (const [key, label, format, higherIsBetter] of metrics) {
+        const matrix = testResult.matrices[key];
+        const values = matrix.flat().filter(value => value !== null);
+        if (!values.length) continue;
+        const min = Math.min(...values);
+        const max = Math.max(...values);
+        
+        const table = document.createElement('table');
+        table.className = 'heatmap';
+        const header = table.insertRow();
+        header.insertCell().textContent = 'in / out';
+        for (const outputLength of testResult.output_lengths) {
+            header.insertCell().textContent = outputLength;
+        }
+        
+        testResult.input_lengths.forEach((inputLength, i) => {
+            const row = table.insertRow();
+            row.insertCell().textContent = inputLength;
+            matrix[i].forEach(value => {
+                const cell = row.insertCell();
+                if (value === null) {
+                    cell.textContent = '-';
+                    return;
+                }
+                // Green for the best cell, red for the worst
+                let score = max > min ? (value - min) / (max - min) : 1;
+                if (!higherIsBetter) score = 1 - score;
+                cell.style.background = `hsla(${Math.round(score * 120)}, 70%, 40%, 0.8)`;
+                cell.textContent = format(value);
+            });
+        });
+        
+        const title = document.createElement('h4');
+        title.textContent = label;
+        container.appendChild(title);
+        container.appendChild(table);
+    }
+}
+
+// Chart each test's /metrics time series: queue depth on the left axis, KV cache usage on the right
+function renderServerMetricsCharts(results) {
+    const container = document.getElementById('benchmark-charts');
+    container.innerHTML = '';
+    const width = 600, height = 160, pad = 30;
+    const colors = { running: '#667eea', waiting: '#f59e0b', kv_cache_usage: '#10b981' };
+    
+    for (const [testName, testResult] of Object.entries(results.tests)) {
+        const series = testResult && testResult.server_metrics && testResult.server_metrics.series;
+        if (!series || series.length < 2) continue;
+        
+        const duration = series[series.length - 1].t || 1;
+        const maxQueue = Math.max(1, ...series.map(s => Math.max(s.running || 0, s.waiting || 0)));
+        const x = t => pad + (t / duration) * (width - 2 * pad);
+        const line = (key, scale) => series
+            .filter(s => s[key] !== null && s[key] !== undefined)
+            .map(s => `${x(s.t).toFixed(1)},${(height - pad - (s[key] / scale) * (height - 2 * pad)).toFixed(1)}`)
+            .join(' ');
+        
+        const polylines = [['running', maxQueue], ['waiting', maxQueue], ['kv_cache_usage', 1]]
+            .map(([key, scale]) => `<polyline fill="none" stroke="${colors[key]}" stroke-width="2" points="${line(key, scale)}"/>`)
+            .join('');
+        
+        const chart = document.createElement('div');
+        chart.className = 'metrics-chart';
+        chart.innerHTML = `
+            <h4>${testName}: server queue and KV cache over ${duration.toFixed(0)}s</h4>
+            <svg viewBox="0 0 ${width} ${height}" width="100%" preserveAspectRatio="none">
+                <line x1="${pad}" y1="${height - pad}" x2="${width - pad}" y2="${height - pad}" stroke="#404040"/>
+                <text x="2" y="${pad}" fill="#a0a0a0" font-size="10">${maxQueue}</text>
+                <text x="${width - pad + 2}" y="${pad}" fill="#a0a0a0" font-size="10">100%</text>
+                ${polylines}
+            </svg>
+            <div class="metrics-legend">
+                <span style="color: ${colors.running}">■ running</span>
+                <span style="color: ${colors.waiting}">■ waiting</span>
+                <span style="color: ${colors.kv_cache_usage}">■ KV cache %</span>
+            </div>`;
+        container.appendChild(chart);
+    }
+}
+
+// Goodput lines: requests/sec that met every latency SLO, and which targets held
+function formatGoodput(testResult) {
+    const slo = testResult.slo;
+    const lines = [`\nGoodput (within SLO):`];
+    lines.push(`  ${testResult.goodput.toFixed(2)} req/s | ${testResult.slo_attainment.toFixed(1)}% of requests met SLO`);
+    lines.push(`  Targets: TTFT ${(slo.ttft * 1000).toFixed(0)}ms, TPOT ${(slo.tpot * 1000).toFixed(0)}ms, E2E ${slo.e2e}s`);
+    for (const [target, met] of Object.entries(testResult.slo_met)) {
+        lines.push(`  ${target}: ${met ? '✅ met' : '❌ missed'}`);
+    }
+    return lines;
+}
+
+// Load stored benchmark runs into the comparison selectors
+async function loadBenchmarkHistory() {
+    try {
+        const response = await fetch(`${window.API_BASE}/benchmark-history`);
+        const data = await response.json();
+        if (!data.success) {
+            return;
+        }
+        
+        for (const selectId of ['history-base', 'history-candidate']) {
+            const select = document.getElementById(selectId);
+            select.innerHTML = '';
+            for (const run of data.runs) {
+                const option = document.createElement('option');
+                option.value = run.id;
+                option.textContent = `#${run.id} ${new Date(run.timestamp).toLocaleString()} - ${run.model} (${run.test_type || run.tests.join(', ')})`;
+                select.appendChild(option);
+            }
+        }
+        // Default to comparing the previous run against the latest one
+        if (data.runs.length > 1) {
+            document.getElementById('history-base').value = data.runs[1].id;
+        }
+    } catch (error) {
+        console.error('Error loading benchmark history:', error);
+    }
+}
+
+// Compare two stored runs and show regressions
+async function compareBenchmarkRuns() {
+    const errorDiv = document.getElementById('history-error');
+    const outputDiv = document.getElementById('history-comparison');
+    errorDiv.style.display = 'none';
+    
+    const base = document.getElementById('history-base').value;
+    const candidate = document.getElementById('history-candidate').value;
+    const threshold = document.getElementById('history-threshold').value || 10;
+    if (!base || !candidate) {
+        showStatus(errorDiv, '✗ Select two runs to compare', 'error');
+        return;
+    }
+    
+    try {
+        const response = await fetch(`${window.API_BASE}/benchmark-history/compare?base=${base}&candidate=${candidate}&threshold=${threshold}`);
+        const data = await response.json();
+        if (!data.success) {
+            showStatus(errorDiv, '✗ ' + data.message, 'error');
+            return;
+        }
+        outputDiv.textContent = formatRunComparison(data.comparison);
+        outputDiv.style.display = 'block';
+    } catch (error) {
+        showStatus(errorDiv, '✗ ' + error.message, 'error');
+    }
+}
+
+function formatRunComparison(comparison) {
+    let output = [];
+    output.push(`Run #${comparison.base.id} (${comparison.base.model}) vs Run #${comparison.candidate.id} (${comparison.candidate.model})`);
+    output.push(`Regression threshold: ${comparison.threshold_pct}%`);
+    output.push('=' + '='.repeat(60));
+    
+    const changedKeys = Object.keys(comparison.config_diff);
+    if (changedKeys.length) {
+        output.push('\nConfig changes:');
+        for (const key of changedKeys) {
+            const diff = comparison.config_diff[key];
+            output.push(`  ${key}: ${JSON.stringify(diff.base)} → ${JSON.stringify(diff.candidate)}`);
+        }
+    } else {
+        output.push('\nConfig changes: none');
+    }
+    
+    for (const [testName, metrics] of Object.entries(comparison.tests)) {
+        output.push(`\n${testName.toUpperCase()}:`);
+        for (const [metric, values] of Object.entries(metrics)) {
+            let marker = '';
+            if (values.regression) marker = ' ❌ REGRESSION';
+            else if (values.improvement) marker = ' ✅';
+            const sign = values.change_pct > 0 ? '+' : '';
+            output.push(`  ${metric}: ${values.base.toFixed(3)} → ${values.candidate.toFixed(3)} (${sign}${values.change_pct}%)${marker}`);
         }
     }
     
+    output.push(comparison.regressions.length
+        ? `\n${comparison.regressions.length} regression(s): ${comparison.regressions.join(', ')}`
+        : '\nNo regressions beyond threshold');
     return output.join('\n');
 }
 
@@ -533,4 +977,5 @@ function formatBenchmarkResults(results) {
 document.addEventListener('DOMContentLoaded', function() {
     // Check service status automatically on load
     checkServiceStatus();
+    loadBenchmarkHistory();
 });
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""
+Background sampler for vLLM's Prometheus /metrics endpoint
+
+Client-side timings cannot tell a KV-cache-bound server from a compute-bound
+one. While a benchmark runs, MetricsSampler polls /metrics on the same event
+loop and keeps a time series of queue depth, KV cache usage, preemptions,
+token counters and the server's own prefill/decode timings, which can then
+be summarized over the whole test or over any window within it. Given
+several replicas it scrapes each and combines them into one pool-wide sample.
+"""
+import asyncio
+import re
+import time
+from typing import Dict, List, Union
+
+import aiohttp
+
+# Gauges and counters are summed over label sets (one per model / engine).
+# Newer vLLM renamed gpu_cache_usage_perc to kv_cache_usage_perc; either is read.
+GAUGES = {
+    "running": ["vllm:num_requests_running"],
+    "waiting": ["vllm:num_requests_waiting"],
+    "kv_cache_usage": ["vllm:kv_cache_usage_perc", "vllm:gpu_cache_usage_perc"]
+}
+COUNTERS = {
+    "preemptions": ["vllm:num_preemptions_total"],
+    "prompt_tokens": ["vllm:prompt_tokens_total"],
+    "generation_tokens": ["vllm:generation_tokens_total"]
+}
+# Histograms whose mean over a window is sum delta / count delta
+HISTOGRAMS = {
+    "queue_time": ["vllm:request_queue_time_seconds"],
+    "prefill_time": ["vllm:request_prefill_time_seconds"],
+    "decode_time": ["vllm:request_decode_time_seconds"],
+    "ttft": ["vllm:time_to_first_token_seconds"],
+    "inter_token_latency": ["vllm:inter_token_latency_seconds", "vllm:time_per_output_token_seconds"]
+}
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)')
+
+
+def parse_prometheus(text: str) -> Dict[str, float]:
+    """Parse Prometheus text exposition into {metric name: value summed over labels}"""
+    totals = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE_RE.match(line)
+        if not match:
+            continue
+        name, _, value = match.groups()
+        try:
+            totals[name] = totals.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return totals
+
+
+def _first(values: Dict[str, float], names: List[str], suffix: str = "") -> float:
+    for name in names:
+        if name + suffix in values:
+            return values[name + suffix]
+    return None
+
+
+def extract_sample(values: Dict[str, float]) -> Dict:
+    """Reduce one scrape to the gauges, counters and histogram sums/counts we track"""
+    sample = {}
+    for key, names in GAUGES.items():
+        sample[key] = _first(values, names)
+    for key, names in COUNTERS.items():
+        sample[key] = _first(values, names)
+    for key, names in HISTOGRAMS.items():
+        sample[key + "_sum"] = _first(values, names, "_sum")
+        sample[key + "_count"] = _first(values, names, "_count")
+    return sample
+
+
+def combine_samples(samples: List[Dict]) -> Dict:
+    """Merge per-replica samples: KV cache usage is the fullest replica, everything else adds up"""
+    combined = {}
+    for key in samples[0]:
+        values = [s[key] for s in samples if s.get(key) is not None]
+        if not values:
+            combined[key] = None
+        elif key == "kv_cache_usage":
+            combined[key] = max(values)
+        else:
+            combined[key] = sum(values)
+    return combined
+
+
+def summarize(samples: List[Dict]) -> Dict:
+    """Peaks and means of gauges, counter deltas and histogram means over a run of samples"""
+    if not samples:
+        return {}
+
+    summary = {"samples": len(samples), "duration": samples[-1]["t"] - samples[0]["t"]}
+    for key in GAUGES:
+        values = [s[key] for s in samples if s.get(key) is not None]
+        if values:
+            summary[key] = {"mean": sum(values) / len(values), "max": max(values)}
+
+    first, last = samples[0], samples[-1]
+    for key in COUNTERS:
+        if first.get(key) is not None and last.get(key) is not None:
+            summary[key] = last[key] - first[key]
+
+    for key in HISTOGRAMS:
+        sum_key, count_key = key + "_sum", key + "_count"
+        if None in (first.get(count_key), last.get(count_key)):
+            continue
+        count = last[count_key] - first[count_key]
+        if count > 0:
+            summary[key] = {"mean": (last[sum_key] - first[sum_key]) / count, "count": count}
+    return summary
+
+
+class MetricsSampler:
+    def __init__(self, base_url: Union[str, List[str]], interval: float = 1.0, timeout: float = 2.0):
+        base_urls = [base_url] if isinstance(base_url, str) else base_url
+        self.metrics_urls = [f"{url.rstrip('/')}/metrics" for url in base_urls]
+        self.interval = interval
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.samples = []
+        self.error = None
+        self.start_time = None
+        self._task = None
+
+    async def _scrape_one(self, session: aiohttp.ClientSession, url: str) -> Dict:
+        async with session.get(url, timeout=self.timeout) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Status {response.status} from {url}")
+            return extract_sample(parse_prometheus(await response.text()))
+
+    async def scrape(self, session: aiohttp.ClientSession) -> Dict:
+        # All replicas or none, so counter deltas never jump when one scrape fails
+        samples = await asyncio.gather(*(self._scrape_one(session, url) for url in self.metrics_urls))
+        return combine_samples(samples)
+
+    async def _run(self):
+        async with aiohttp.ClientSession() as session:
+            while True:
+                started = time.time()
+                try:
+                    sample = await self.scrape(session)
+                    sample["t"] = started - self.start_time
+                    self.samples.append(sample)
+                    self.error = None
+                except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                    # Keep sampling; a metrics hiccup must never fail the benchmark
+                    self.error = str(e) or type(e).__name__
+                await asyncio.sleep(max(0.0, self.interval - (time.time() - started)))
+
+    def start(self):
+        """Start polling on the running event loop"""
+        self.start_time = time.time()
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict:
+        """Stop polling, take one closing sample and return the series and its summary"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            async with aiohttp.ClientSession() as session:
+                sample = await self.scrape(session)
+                sample["t"] = time.time() - self.start_time
+                self.samples.append(sample)
+        except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+            self.error = str(e) or type(e).__name__
+        return self.result()
+
+    def window(self, start: float, end: float) -> Dict:
+        """Summary of the samples taken between two time.time() stamps"""
+        start_offset, end_offset = start - self.start_time, end - self.start_time
+        return summarize([s for s in self.samples if start_offset <= s["t"] <= end_offset])
+
+    def result(self) -> Dict:
+        if not self.samples:
+            return {"error": self.error or "No samples collected"}
+        return {
+            "interval": self.interval,
+            "series": [{k: v for k, v in s.items() if not k.endswith(("_sum", "_count"))} for s in self.samples],
+            "summary": summarize(self.samples)
+        }
+
+
+def diagnose_saturation(levels: List[Dict]) -> Dict:
+    """Find the latency knee in stress levels and what the server looked like at it.
+
+    Each level carries concurrent_clients, requests_per_second, p99_latency and a
+    "server" window summary. The knee is the first level where throughput gains
+    under 10% while p99 latency rises over 50%: past it, extra clients only queue.
+    """
+    knee = None
+    for previous, level in zip(levels, levels[1:]):
+        if not previous["requests_per_second"] or not previous["p99_latency"]:
+            continue
+        throughput_gain = level["requests_per_second"] / previous["requests_per_second"] - 1
+        latency_growth = level["p99_latency"] / previous["p99_latency"] - 1
+        if throughput_gain < 0.10 and latency_growth > 0.50:
+            knee = level
+            break
+
+    if knee is None:
+        return {"knee_concurrency": None, "limited_by": None,
+                "note": "No latency knee within the tested load"}
+
+    server = knee.get("server") or {}
+    kv_peak = server.get("kv_cache_usage", {}).get("max")
+    waiting_peak = server.get("waiting", {}).get("max")
+    running_peak = server.get("running", {}).get("max")
+    preemptions = server.get("preemptions")
+
+    if not server:
+        limited_by, note = None, "No server metrics for the knee level"
+    elif (kv_peak is not None and kv_peak >= 0.9) or preemptions:
+        limited_by = "kv_cache"
+        note = "KV cache ran full at the knee; more KV blocks (memory, shorter max_model_len, quantized KV) raise capacity"
+    elif waiting_peak:
+        limited_by = "scheduler"
+        note = ("Requests queued while the KV cache had room; the batch limits (max_num_seqs, "
+                "max_num_batched_tokens) are the cap")
+    else:
+        limited_by = "compute"
+        note = "KV cache had headroom at the knee; the GPU is compute-bound at this batch size"
+
+    return {
+        "knee_concurrency": knee["concurrent_clients"],
+        "limited_by": limited_by,
+        "note": note,
+        "evidence": {
+            "kv_cache_usage_peak": kv_peak,
+            "waiting_peak": waiting_peak,
+            "running_peak": running_peak,
+            "preemptions": preemptions
+        }
+    }
@@ -3,7 +3,9 @@
 Auto-configure vLLM based on GPU hardware and model size.
 
 Detects GPU VRAM via torch.cuda (preferred) or nvidia-smi (fallback),
-estimates model memory from a local lookup table, and writes optimal
+reads the model's architecture from its HF config.json and safetensors
+headers when the model is on disk (falling back to a local lookup table
+keyed on the model name), and writes optimal
 gpu_memory_utilization, max_model_len, tensor_parallel_size, and
 quantization into vllm_config.json.
 
@@ -15,10 +17,13 @@ Usage:
 """
 
 import argparse
+import glob
 import json
 import logging
+import mmap
 import os
 import re
+import struct
 import subprocess
 import sys
 
@@ -172,6 +177,161 @@ MODEL_LOOKUP = {
 }
 
 
+# ---------------------------------------------------------------------------
+# Model Files (HF config.json + safetensors headers)
+# ---------------------------------------------------------------------------
+
+# Bytes per element for safetensors dtype codes
+SAFETENSORS_DTYPE_BYTES = {
+    "F64": 8, "I64": 8, "U64": 8,
+    "F32": 4, "I32": 4, "U32": 4,
+    "F16": 2, "BF16": 2, "I16": 2, "U16": 2,
+    "F8_E4M3": 1, "F8_E5M2": 1, "I8": 1, "U8": 1, "BOOL": 1,
+}
+
+
+def hf_cache_dirs() -> list:
+    """Candidate HuggingFace hub cache directories, most specific first."""
+    dirs = []
+    if os.environ.get("HF_HUB_CACHE"):
+        dirs.append(os.environ["HF_HUB_CACHE"])
+    if os.environ.get("HF_HOME"):
+        dirs.append(os.path.join(os.environ["HF_HOME"], "hub"))
+    dirs.append(os.path.expanduser("~/.cache/huggingface/hub"))
+    return dirs
+
+
+def find_model_dir(model_name: str, model_path: str | None = None) -> str | None:
+    """
+    Locate a local directory holding the model's config.json: an explicit
+    path, the model name itself if it is a directory, or a snapshot in the
+    HF hub cache (the revision refs/main points at, else the newest).
+    """
+    for candidate in (model_path, model_name):
+        if candidate and os.path.isfile(os.path.join(candidate, "config.json")):
+            return candidate
+
+    repo_dir_name = "models--" + model_name.replace("/", "--")
+    for cache_dir in hf_cache_dirs():
+        repo_dir = os.path.join(cache_dir, repo_dir_name)
+        if not os.path.isdir(repo_dir):
+            continue
+
+        ref_path = os.path.join(repo_dir, "refs", "main")
+        if os.path.isfile(ref_path):
+            with open(ref_path) as f:
+                snapshot = os.path.join(repo_dir, "snapshots", f.read().strip())
+            if os.path.isfile(os.path.join(snapshot, "config.json")):
+                return snapshot
+
+        snapshots = [d for d in glob.glob(os.path.join(repo_dir, "snapshots", "*"))
+                     if os.path.isfile(os.path.join(d, "config.json"))]
+        if snapshots:
+            return max(snapshots, key=os.path.getmtime)
+    return None
+
+
+def read_safetensors_header(path: str) -> dict:
+    """
+    Parse only the JSON header of a .safetensors file via mmap.
+
+    The format is an 8-byte little-endian header length followed by the
+    JSON header; tensor data after it is never touched.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            (header_len,) = struct.unpack("<Q", mm[:8])
+            return json.loads(mm[8:8 + header_len])
+
+
+def safetensors_weight_bytes(model_dir: str) -> int | None:
+    """Total tensor bytes across the model's safetensors shards, or None if absent."""
+    index_path = os.path.join(model_dir, "model.safetensors.index.json")
+    index = None
+    if os.path.isfile(index_path):
+        index = load_json(index_path)
+        shards = sorted(set(index.get("weight_map", {}).values()))
+        shard_paths = [os.path.join(model_dir, shard) for shard in shards]
+    else:
+        shard_paths = sorted(glob.glob(os.path.join(model_dir, "*.safetensors")))
+
+    if shard_paths and all(os.path.isfile(p) for p in shard_paths):
+        total = 0
+        for shard_path in shard_paths:
+            for name, tensor in read_safetensors_header(shard_path).items():
+                if name == "__metadata__":
+                    continue
+                numel = 1
+                for dim in tensor["shape"]:
+                    numel *= dim
+                total += numel * SAFETENSORS_DTYPE_BYTES.get(tensor["dtype"], 2)
+        return total
+
+    # Shards not downloaded yet: the index still records the total size
+    if index and index.get("metadata", {}).get("total_size"):
+        return int(index["metadata"]["total_size"])
+    return None
+
+
+def resolve_model_info(model_name: str, model_path: str | None = None) -> dict | None:
+    """
+    Build model info from the model's own files instead of its name.
+
+    Returns the same keys as estimate_model_info, or None if the model's
+    config.json is not available locally. weight_gb is None when no
+    safetensors weights or index could be found.
+    """
+    model_dir = find_model_dir(model_name, model_path)
+    if model_dir is None:
+        return None
+
+    try:
+        config = load_json(os.path.join(model_dir, "config.json"))
+    except (OSError, ValueError) as exc:
+        log.warning("Could not read config.json in %s: %s", model_dir, exc)
+        return None
+
+    # Multimodal checkpoints nest the language model's config
+    text_config = config.get("text_config") or config
+
+    layers = text_config.get("num_hidden_layers") or text_config.get("n_layer") or text_config.get("num_layers")
+    num_heads = text_config.get("num_attention_heads") or text_config.get("n_head")
+    hidden_size = text_config.get("hidden_size") or text_config.get("n_embd")
+    if not (layers and num_heads and hidden_size):
+        log.warning("config.json in %s lacks layer/head/hidden sizes", model_dir)
+        return None
+
+    if text_config.get("multi_query"):
+        kv_heads = 1
+    else:
+        kv_heads = text_config.get("num_key_value_heads") or num_heads
+    head_dim = text_config.get("head_dim") or hidden_size // num_heads
+    max_context = (text_config.get("max_position_embeddings") or text_config.get("n_positions")
+                   or text_config.get("seq_length") or 8192)
+
+    quant_method = (config.get("quantization_config") or {}).get("quant_method", "")
+    quant = quant_method.lower() if quant_method.lower() in ("awq", "gptq") else parse_quantization(model_name)
+
+    try:
+        weight_bytes = safetensors_weight_bytes(model_dir)
+    except (OSError, ValueError, struct.error) as exc:
+        log.warning("Could not read safetensors headers in %s: %s", model_dir, exc)
+        weight_bytes = None
+
+    info = {
+        "weight_gb": round(weight_bytes / (1024 ** 3), 2) if weight_bytes else None,
+        "layers": int(layers),
+        "kv_heads": int(kv_heads),
+        "head_dim": int(head_dim),
+        "max_context": int(max_context),
+        "quant": quant,
+        "param_class": parse_param_count(model_name),
+        "source": model_dir,
+    }
+    log.info("Resolved model files in %s: %s", model_dir, info)
+    return info
+
+
 # ---------------------------------------------------------------------------
 # Model Name Parsing
 # ---------------------------------------------------------------------------
@@ -202,11 +362,30 @@ def parse_quantization(model_name: str) -> str:
     return "fp16"
 
 
-def estimate_model_info(model_name: str) -> dict:
+def estimate_model_info(model_name: str, model_path: str | None = None) -> dict:
     """
     Return model info dict with keys:
       weight_gb, layers, kv_heads, head_dim, max_context, quant, param_class
+
+    Prefers the model's real config.json and safetensors sizes when they are
+    on disk; otherwise estimates from the model name.
     """
+    resolved = resolve_model_info(model_name, model_path)
+    if resolved and resolved["weight_gb"] is not None:
+        return resolved
+
+    name_info = estimate_model_info_from_name(model_name)
+    if resolved:
+        # Architecture is exact; only the weight size comes from the name
+        resolved["weight_gb"] = name_info["weight_gb"]
+        resolved["param_class"] = resolved["param_class"] or name_info["param_class"]
+        log.info("Using config.json architecture with name-based weight estimate: %s", resolved)
+        return resolved
+    return name_info
+
+
+def estimate_model_info_from_name(model_name: str) -> dict:
+    """Estimate model info from the parameter count and quantization in its name."""
     param_class = parse_param_count(model_name)
     quant = parse_quantization(model_name)
 
@@ -385,9 +564,15 @@ def load_json(path: str) -> dict:
 
 
 def save_json(path: str, data: dict):
-    with open(path, "w") as f:
+    # Write to a temp file and rename it into place so the web UI, which
+    # reads this config on every request, never sees a half-written file
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
         json.dump(data, f, indent=2)
         f.write("\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
 
 def apply_config(config_path: str, defaults_path: str, new_values: dict, dry_run: bool = False):
@@ -442,6 +627,10 @@ def main():
         "--defaults", default="default_vllm_config.json",
         help="Path to default_vllm_config.json (default: default_vllm_config.json)",
     )
+    parser.add_argument(
+        "--model-path", default=None,
+        help="Local model directory with config.json/safetensors (default: search the HF cache)",
+    )
     parser.add_argument(
         "--dry-run", action="store_true",
         help="Print calculated config without writing",
@@ -475,7 +664,7 @@ def main():
     log.info("Model: %s", model_name)
 
     # 3. Estimate model size
-    model_info = estimate_model_info(model_name)
+    model_info = estimate_model_info(model_name, args.model_path)
 
     # 4. Calculate optimal config
     new_values = calculate_config(gpu_info, model_info)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Benchmark-driven autotuner for vLLM serving configs.
+
+Starts from the analytic config auto_config_gpu.calculate_config derives for
+this GPU and model, generates candidate configs around it (max_num_seqs,
+enable_chunked_prefill, max_num_batched_tokens, enable_prefix_caching),
+launches vLLM with each candidate via build_vllm_command.build_command,
+runs a ModelBenchmark workload against it and keeps the configs that
+deliver the highest goodput (requests/s meeting every latency SLO). The search is a grid
+evaluated with successive halving: every candidate gets a short run, the
+best 1/eta survive to a run eta times longer, until one is left.
+
+The production vLLM service must be stopped first: candidates need the GPU.
+
+Usage:
+    python3 autotune_vllm.py --config vllm_config.json --slo-ttft 1 --slo-e2e 20
+    python3 autotune_vllm.py --workload open_loop --request-rate 8 --apply
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import shlex
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import auto_config_gpu
+from build_vllm_command import build_command
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "SlydLLMSite"))
+from benchmark import DEFAULT_SLO, ModelBenchmark  # noqa: E402
+
+LOG_FILE = "/var/log/autotune_vllm.log"
+
+log = logging.getLogger("autotune_vllm")
+
+
+def setup_logging():
+    log.setLevel(logging.DEBUG)
+    fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setLevel(logging.INFO)
+    stdout_handler.setFormatter(fmt)
+    log.addHandler(stdout_handler)
+
+    try:
+        file_handler = logging.FileHandler(LOG_FILE)
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(fmt)
+        log.addHandler(file_handler)
+    except PermissionError:
+        log.warning("Cannot write to %s — file logging disabled", LOG_FILE)
+
+    # Reuse this logger's handlers for the analytic model's messages
+    auto_config_gpu.log.setLevel(logging.INFO)
+    for handler in log.handlers:
+        auto_config_gpu.log.addHandler(handler)
+
+
+# ---------------------------------------------------------------------------
+# Candidate Generation
+# ---------------------------------------------------------------------------
+
+def generate_candidates(base: dict, max_candidates: int | None = None, seed: int = 0) -> list:
+    """
+    Build a grid of scheduler settings around the analytic base config.
+
+    max_num_seqs spans half to four times the analytic value; batched-token
+    budgets only vary when chunked prefill is on, since without it vLLM needs
+    max_num_batched_tokens >= max_model_len anyway.
+    """
+    base_seqs = base["max_num_seqs"]
+    seqs_options = sorted({max(4, base_seqs // 2), base_seqs, base_seqs * 2, base_seqs * 4})
+
+    candidates = []
+    for max_num_seqs, chunked, prefix_caching in itertools.product(seqs_options, (False, True), (False, True)):
+        if chunked:
+            budgets = [b for b in (2048, 8192, 16384) if b >= max_num_seqs]
+        else:
+            budgets = [None]
+        for budget in budgets:
+            candidates.append({
+                "max_num_seqs": max_num_seqs,
+                "enable_chunked_prefill": chunked,
+                "max_num_batched_tokens": budget,
+                "enable_prefix_caching": prefix_caching,
+            })
+
+    if max_candidates and len(candidates) > max_candidates:
+        rng = random.Random(seed)
+        # Always keep the analytic baseline in the pool
+        baseline = {"max_num_seqs": base_seqs, "enable_chunked_prefill": False,
+                    "max_num_batched_tokens": None, "enable_prefix_caching": False}
+        others = [c for c in candidates if c != baseline]
+        candidates = [baseline] + rng.sample(others, max_candidates - 1)
+
+    log.info("Generated %d candidate configs", len(candidates))
+    return candidates
+
+
+# ---------------------------------------------------------------------------
+# vLLM Process Management
+# ---------------------------------------------------------------------------
+
+def launch_vllm(config: dict, python: str, log_path: str):
+    """Write config to a temp file, build the vLLM command from it and start the server."""
+    fd, config_path = tempfile.mkstemp(prefix="autotune_", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(config, f, indent=2)
+
+    argv = shlex.split(build_command(config_path))
+    argv[0] = python
+    log.debug("Launching: %s", " ".join(argv))
+
+    log_file = open(log_path, "w")
+    # New session so the whole process group (vLLM spawns workers) can be stopped
+    process = subprocess.Popen(argv, stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True)
+    return process, config_path, log_file
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float) -> bool:
+    """Poll /v1/models until vLLM answers, the process dies or timeout passes."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if requests.get(f"{base_url}/v1/models", timeout=2).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(2)
+    return False
+
+
+def stop_vllm(process: subprocess.Popen, grace_seconds: float = 30):
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=grace_seconds)
+    except subprocess.TimeoutExpired:
+        log.warning("vLLM did not exit after SIGTERM — killing")
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Evaluation
+# ---------------------------------------------------------------------------
+
+async def run_workload(benchmark: ModelBenchmark, workload: str, budget_seconds: int, args) -> dict:
+    if workload == "open_loop":
+        return await benchmark.open_loop_test(args.request_rate, duration_seconds=budget_seconds,
+                                              arrival=args.arrival)
+    if workload == "streaming":
+        # Scale the request count with the budget at roughly one request per second per client
+        return await benchmark.streaming_test(num_requests=max(args.concurrency, budget_seconds * args.concurrency // 4),
+                                              num_concurrent=args.concurrency)
+    if workload == "concurrent":
+        requests_per_client = max(1, budget_seconds // 10)
+        return await benchmark.concurrent_test(args.concurrency, requests_per_client=requests_per_client)
+    raise ValueError(f"Unknown workload: {workload}")
+
+
+def score_result(result: dict) -> float:
+    """Goodput: requests/s that met every SLO target; failed runs score zero."""
+    if result.get("error"):
+        return 0.0
+    return result.get("goodput", 0.0)
+
+
+def evaluate(candidate: dict, base_config: dict, budget_seconds: int, args) -> dict:
+    """Launch vLLM with one candidate, benchmark it and shut it down."""
+    config = dict(base_config, **candidate)
+    config["host"] = "127.0.0.1"
+    config["port"] = args.port
+    base_url = f"http://127.0.0.1:{args.port}"
+    log_path = os.path.join(args.log_dir, "trial_" + "_".join(f"{k}-{v}" for k, v in candidate.items()) + ".log")
+
+    trial = {"candidate": candidate, "budget_seconds": budget_seconds, "score": 0.0}
+    process, config_path, log_file = launch_vllm(config, args.python, log_path)
+    try:
+        start = time.time()
+        if not wait_until_ready(base_url, process, args.startup_timeout):
+            trial["error"] = f"vLLM failed to start (see {log_path})"
+            log.warning("Candidate %s: %s", candidate, trial["error"])
+            return trial
+        trial["startup_seconds"] = round(time.time() - start, 1)
+
+        benchmark = ModelBenchmark(base_url, config["model"], slo=args.slo)
+        result = asyncio.run(run_workload(benchmark, args.workload, budget_seconds, args))
+        trial["result"] = result
+        trial["score"] = score_result(result)
+        log.info("Candidate %s: score=%.3f", candidate, trial["score"])
+        return trial
+    finally:
+        stop_vllm(process)
+        log_file.close()
+        os.unlink(config_path)
+
+
+def successive_halving(candidates: list, base_config: dict, args) -> list:
+    """Evaluate all candidates, keep the top 1/eta, re-run them with eta x budget, repeat."""
+    trials = []
+    survivors = candidates
+    budget = args.min_budget
+    round_number = 1
+
+    while True:
+        log.info("Round %d: %d candidates, %ds budget each", round_number, len(survivors), budget)
+        round_trials = [evaluate(candidate, base_config, budget, args) for candidate in survivors]
+        for trial in round_trials:
+            trial["round"] = round_number
+        trials.extend(round_trials)
+
+        if len(survivors) <= 1:
+            break
+        keep = max(1, math.floor(len(survivors) / args.eta))
+        ranked = sorted(round_trials, key=lambda t: t["score"], reverse=True)
+        survivors = [t["candidate"] for t in ranked[:keep] if t["score"] > 0] or [ranked[0]["candidate"]]
+        budget = min(budget * args.eta, args.max_budget)
+        round_number += 1
+
+    return trials
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Search vLLM configs for the best goodput within latency SLOs")
+    parser.add_argument("--config", default="vllm_config.json", help="Base vLLM config (default: vllm_config.json)")
+    parser.add_argument("--model-path", default=None, help="Local model directory (default: search the HF cache)")
+    parser.add_argument("--python", default="/opt/vllm-env/bin/python" if os.path.exists("/opt/vllm-env/bin/python")
+                        else sys.executable, help="Python interpreter with vLLM installed")
+    parser.add_argument("--port", type=int, default=5102, help="Port for candidate servers (default: 5102)")
+    parser.add_argument("--workload", choices=["open_loop", "streaming", "concurrent"], default="open_loop")
+    parser.add_argument("--request-rate", type=float, default=4.0, help="Offered load for open_loop (req/s)")
+    parser.add_argument("--arrival", choices=["poisson", "constant", "gamma"], default="poisson")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients for streaming/concurrent workloads")
+    parser.add_argument("--slo-ttft", type=float, default=DEFAULT_SLO["ttft"], help="Time-to-first-token target (s)")
+    parser.add_argument("--slo-tpot", type=float, default=DEFAULT_SLO["tpot"], help="Time-per-output-token target (s)")
+    parser.add_argument("--slo-e2e", type=float, default=DEFAULT_SLO["e2e"], help="End-to-end latency target (s)")
+    parser.add_argument("--max-candidates", type=int, default=None, help="Randomly subsample the grid to this size")
+    parser.add_argument("--min-budget", type=int, default=20, help="Benchmark seconds per candidate in round 1")
+    parser.add_argument("--max-budget", type=int, default=180, help="Cap on benchmark seconds per candidate")
+    parser.add_argument("--eta", type=int, default=3, help="Successive halving reduction factor")
+    parser.add_argument("--startup-timeout", type=float, default=900, help="Seconds to wait for vLLM to load")
+    parser.add_argument("--log-dir", default=tempfile.gettempdir(), help="Where to write per-trial vLLM logs")
+    parser.add_argument("--output", default="autotune_results.json", help="Write all trials here")
+    parser.add_argument("--apply", action="store_true", help="Write the winning settings into --config")
+    args = parser.parse_args()
+    args.slo = {"ttft": args.slo_ttft, "tpot": args.slo_tpot, "e2e": args.slo_e2e}
+
+    setup_logging()
+    log.info("=== autotune_vllm starting ===")
+
+    base_config = auto_config_gpu.load_json(args.config)
+    model_name = base_config.get("model", "")
+    if not model_name:
+        log.error("No model specified in %s", args.config)
+        sys.exit(1)
+
+    gpu_info = auto_config_gpu.detect_gpu()
+    if gpu_info is None:
+        log.error("No GPU detected — cannot autotune")
+        sys.exit(1)
+
+    model_info = auto_config_gpu.estimate_model_info(model_name, args.model_path)
+    analytic = auto_config_gpu.calculate_config(gpu_info, model_info)
+    base_config = dict(base_config, **analytic)
+
+    candidates = generate_candidates(analytic, args.max_candidates)
+    trials = successive_halving(candidates, base_config, args)
+
+    final_round = max(t["round"] for t in trials)
+    best = max((t for t in trials if t["round"] == final_round), key=lambda t: t["score"])
+    log.info("Best candidate: %s (score=%.3f)", best["candidate"], best["score"])
+
+    with open(args.output, "w") as f:
+        json.dump({"analytic": analytic, "best": best, "trials": trials}, f, indent=2, default=float)
+    log.info("Trials written to %s", args.output)
+
+    if args.apply:
+        if best["score"] <= 0:
+            log.warning("No candidate met the workload — leaving %s unchanged", args.config)
+        else:
+            # Exactly what the winning trial ran with, analytic memory and parallelism settings included
+            config = dict(base_config, **best["candidate"])
+            auto_config_gpu.save_json(args.config, config)
+            log.info("Applied best settings to %s", args.config)
+
+    log.info("=== autotune_vllm complete ===")
+
+
+if __name__ == "__main__":
+    main()
@@ -29,4 +29,4 @@ systemctl enable nginx
 echo "Nginx setup complete!"
 echo "Nginx is now proxying:"
 echo "  - http://your-server/ -> Configuration interface (port 5005)"
-echo "  - http://your-server/v1/* -> vLLM API (port 5002)"
\ No newline at end of file
+echo "  - http://your-server/v1/* -> vLLM API via the gateway (port 5005)"
\ No newline at end of file
@@ -65,9 +65,13 @@ Group=root
 WorkingDirectory=/opt/SlydLLMSite
 Environment="PATH=/opt/vllm-env/bin:/usr/local/bin:/usr/bin:/bin"
 EnvironmentFile=-/home/ubuntu/.env
+# For many concurrent chat users, serve the same routes on an event loop instead:
+# ExecStart=/opt/vllm-env/bin/python /opt/SlydLLMSite/async_app.py --port 5005
 ExecStart=/opt/vllm-env/bin/python /opt/SlydLLMSite/app.py
 Restart=on-failure
 RestartSec=10
+# Blue-green reloads start vLLM instances from the site; keep them running when the site restarts
+KillMode=process
 StandardOutput=journal
 StandardError=journal
 